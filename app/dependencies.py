@@ -1,11 +1,6 @@
-from fastapi import Header, HTTPException
+from token_store import TokenHeader, TokenQuery, default_token_store
 
+# token 从 token 库里查（API_TOKENS_FILE 改了会自动重新加载）；同一个请求里重复声明只查一次
+get_token_header = TokenHeader("X-Token", default_token_store, detail="X-Token header invalid")
 
-async def get_token_header(x_token: str = Header()):
-    if x_token != "fake-super-secret-token":
-        raise HTTPException(status_code=400, detail="X-Token header invalid")
-
-
-async def get_query_token(token: str):
-    if token != "jessica":
-        raise HTTPException(status_code=400, detail="No Jessica token provided")
+get_query_token = TokenQuery("token", default_token_store, detail="No Jessica token provided")
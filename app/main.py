@@ -14,11 +14,14 @@
 """
 from fastapi import Depends, FastAPI
 
+from compression import CompressionMiddleware
+
 from .dependencies import get_query_token, get_token_header
 from .internal import admin
 from .routers import items, users
 
 app = FastAPI(dependencies=[Depends(get_query_token)])
+app.add_middleware(CompressionMiddleware)
 
 app.include_router(users.router)
 app.include_router(items.router)
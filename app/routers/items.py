@@ -1,5 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Annotated
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from conditional import content_etag, is_not_modified, not_modified, set_validators
+from store import default_store
 from ..dependencies import get_token_header
 
 router = APIRouter(
@@ -9,19 +13,37 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-fake_items_db = {"plumbus": {"name": "Plumbus"}, "gun": {"name": "Portal Gun"}}
+# 种子数据，已经有了就不覆盖（设了 STORE_PATH 时几个 worker 共用一份）
+default_store.add("app_items", "plumbus", {"name": "Plumbus"})
+default_store.add("app_items", "gun", {"name": "Portal Gun"})
 
 
 @router.get("/")
-async def read_items():
-    return fake_items_db
+def read_items(
+        request: Request,
+        response: Response,
+        limit: Annotated[int, Query(gt=0, le=100)] = 100,
+        offset: Annotated[int, Query(ge=0)] = 0,
+):
+    items = {record.key: record.value for record in default_store.page("app_items", limit, offset).records}
+    # 数据可能被别的 worker 改过，ETag 每次按内容算
+    etag = content_etag(items)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    return items
 
 
 @router.get("/{item_id}")
-async def read_item(item_id: str):
-    if item_id not in fake_items_db:
+def read_item(item_id: str, request: Request, response: Response):
+    record = default_store.get("app_items", item_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Item not found")
-    return {"name": fake_items_db[item_id]["name"], "item_id": item_id}
+    etag = content_etag(record.value)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    return {"name": record.value["name"], "item_id": item_id}
 
 
 @router.put(
@@ -9,3 +9,13 @@ def test_read_main():
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Hello Bigger Applications!"}
+
+
+def test_read_items_etag():
+    headers = {"X-Token": "fake-super-secret-token"}
+    response = client.get("/items/plumbus", params={"token": "jessica"}, headers=headers)
+    assert response.status_code == 200
+
+    headers["If-None-Match"] = response.headers["ETag"]
+    response = client.get("/items/plumbus", params={"token": "jessica"}, headers=headers)
+    assert response.status_code == 304
@@ -1,6 +1,13 @@
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import BackgroundTasks, FastAPI, Depends
 from typing import Annotated
-from fastapi.staticfiles import StaticFiles
+
+from compression import CompressionMiddleware
+from jobs import JobQueue
+from log_writer import BufferedLogWriter
+from static_files import CachedStaticFiles
 
 description = """
 ChimichangApp API helps you do awesome stuff. 🚀
@@ -48,13 +55,53 @@ tags_metadata = [
 #               },
 #               )
 # app = FastAPI(openapi_tags=tags_metadata)
-app = FastAPI(docs_url='/test', redoc_url=None)
-app.mount('/static', StaticFiles(directory='static'))
 
+# 整个进程共用一个写日志的线程，不再每条消息都打开、写入、关闭一次文件
+log_writer = BufferedLogWriter(
+    os.getenv("LOG_FILE", "log.txt"),
+    flush_bytes=int(os.getenv("LOG_FLUSH_BYTES", 64 * 1024)),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", 1.0)),
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+    backup_count=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+)
+
+
+# 通知放进持久化队列，由单独的 worker 进程发送（python worker.py），服务进程只负责入队
+job_queue = JobQueue(
+    os.getenv("JOBS_DB", "jobs.db"),
+    lease_seconds=float(os.getenv("JOBS_LEASE_SECONDS", 30)),
+    max_attempts=int(os.getenv("JOBS_MAX_ATTEMPTS", 5)),
+)
+
+
+def deliver_notification(email: str, message: str):
+    # 真正发邮件的地方；现在和以前一样只写一行日志
+    log_writer.write(message)
+    # 返回之后任务就标记为完成了，这时 worker 被杀，还在缓冲里的通知就丢了
+    log_writer.flush()
+
+
+job_handlers = {"send_notification": deliver_notification}
 
-def write_log(message: str):
-    with open("log.txt", mode="a") as log:
-        log.write(message)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_writer.start()
+    yield
+    # 关闭时把队列里剩下的消息都写完
+    log_writer.close()
+
+
+app = FastAPI(docs_url='/test', redoc_url=None, lifespan=lifespan)
+# 静态文件里已经有 .br/.gz 的直接用预压缩版本（带 Content-Encoding，中间件不会再压）
+app.add_middleware(CompressionMiddleware)
+# 静态文件启动后不会变：ETag、预压缩版本启动时算好，小文件放内存
+app.mount('/static', CachedStaticFiles(directory='static', max_age=int(os.getenv('STATIC_MAX_AGE', 3600))))
+
+
+async def write_log(message: str):
+    # async def 的后台任务直接在事件循环里执行，只是入队，不用再切到线程池
+    log_writer.write(message)
 
 
 def get_query(background_tasks: BackgroundTasks, q: str | None = None):
@@ -74,9 +121,16 @@ async def get_items():
     return [{"name": "wand"}, {"name": "flying broom"}]
 
 
+# 入队要写 SQLite，用普通 def 放到线程池里执行，不阻塞事件循环
 @app.post("/send-notification/{email}")
-async def send_notification(email: str, background_tasks: BackgroundTasks, q: Annotated[str, Depends(get_query)]):
+def send_notification(email: str, q: Annotated[str, Depends(get_query)]):
     message = f"message to {email}\n"
 
-    background_tasks.add_task(write_log, message)
+    # 同一个邮箱已经有一条待发送的通知时不会重复入队
+    job_queue.enqueue("send_notification", {"email": email, "message": message}, dedup_key=f"notification:{email}")
     return {"message": "Message sent"}
+
+
+@app.get("/jobs/metrics")
+def read_job_metrics():
+    return job_queue.metrics()
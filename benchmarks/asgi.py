@@ -0,0 +1,51 @@
+"""
+Drive an ASGI app in-process, without a server or TestClient, to time the app itself.
+"""
+import asyncio
+import time
+
+from starlette.types import ASGIApp
+
+
+def make_scope(method: str, path: str, headers: list[tuple[bytes, bytes]] | None = None) -> dict:
+    path, _, query = path.partition("?")
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method, "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "headers": headers or [],
+        "server": ("bench", 80), "client": ("127.0.0.1", 50000),
+    }
+
+
+async def call(app: ASGIApp, scope: dict, body: bytes = b"") -> int:
+    """Run one request and return its status code."""
+    status = 0
+    received = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(dict(scope), receive, send)
+    disconnected.set()
+    return status
+
+
+async def requests_per_second(app: ASGIApp, scope: dict, requests: int, body: bytes = b"",
+                              expect: int = 200) -> float:
+    for _ in range(min(100, requests)):
+        assert await call(app, scope, body) == expect
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, scope, body)
+    return requests / (time.perf_counter() - start)
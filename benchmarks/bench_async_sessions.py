@@ -0,0 +1,110 @@
+"""
+Compare GET /heroes/{hero_id} latency for DB_MODE=sync vs DB_MODE=async at 500 concurrent clients.
+
+    python -m benchmarks.bench_async_sessions --clients 500 --requests 4
+
+Each mode runs sql.py under its own uvicorn process against a seeded on-disk SQLite file.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from sqlmodel import Session, SQLModel
+
+from sql import Hero, create_sqlite_engine
+
+SEED_ROWS = 10_000
+
+
+def seed(db_path: Path) -> None:
+    engine = create_sqlite_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(Hero(name=f"hero-{i}", secret_name="secret", age=i % 90) for i in range(SEED_ROWS))
+        session.commit()
+    engine.dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, db_path: Path, port: int) -> subprocess.Popen:
+    env = {**os.environ, "DB_MODE": mode, "SQLITE_FILE": str(db_path)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "sql:app", "--port", str(port), "--log-level", "critical"],
+        env=env,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/heroes/1")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"uvicorn did not start in {mode} mode")
+
+
+async def run_clients(port: int, clients: int, requests: int) -> tuple[list[float], int]:
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        async def one_client():
+            nonlocal errors
+            for _ in range(requests):
+                start = time.perf_counter()
+                try:
+                    response = await client.get(f"/heroes/{random.randint(1, SEED_ROWS)}")
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        await asyncio.gather(*(one_client() for _ in range(clients)))
+    return latencies, errors
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=4, help="requests per client")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "heroes.db"
+        seed(db_path)
+        for mode in ("sync", "async"):
+            port = free_port()
+            server = start_server(mode, db_path, port)
+            try:
+                start = time.perf_counter()
+                latencies, errors = asyncio.run(run_clients(port, args.clients, args.requests))
+                elapsed = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.wait()
+            print(
+                f"{mode:>6}: p50 {percentile(latencies, 50):7.1f} ms  p99 {percentile(latencies, 99):7.1f} ms"
+                f"  {len(latencies) / elapsed:8,.0f} req/s  {errors} errors"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Measure the per-request cost of get_current_user in test.py.
+
+    python -m benchmarks.bench_auth_overhead --iterations 20000
+
+"uncached" decodes and verifies the JWT and looks the user up on every call, like every
+request did before the token cache; "cached" is a token-cache hit. RS256 and EdDSA are
+included when the cryptography package is installed.
+"""
+import argparse
+import asyncio
+import time
+
+from test import JWTKey, create_access_token, get_current_user, jwt_keys, token_cache
+
+
+def asymmetric_keys() -> list[JWTKey]:
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    except ImportError:
+        return []
+    keys = []
+    for kid, algorithm, private_key in [
+        ("rs-1", "RS256", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+        ("ed-1", "EdDSA", ed25519.Ed25519PrivateKey.generate()),
+    ]:
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        keys.append(JWTKey(kid, algorithm, pem))
+    return keys
+
+
+async def per_call_us(token: str, iterations: int, cached: bool) -> float:
+    await get_current_user(token)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if not cached:
+            token_cache.clear()
+        await get_current_user(token)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for key in [jwt_keys.current, *asymmetric_keys()]:
+        jwt_keys.add(key, current=True)
+        token = create_access_token({"sub": "johndoe"})
+        uncached = asyncio.run(per_call_us(token, args.iterations, cached=False))
+        cached = asyncio.run(per_call_us(token, args.iterations, cached=True))
+        print(f"{key.algorithm:>6}: uncached {uncached:8.1f} us/request, cached {cached:6.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
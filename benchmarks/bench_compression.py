@@ -0,0 +1,62 @@
+"""
+Bandwidth saved vs CPU spent by CompressionMiddleware's encoders at several levels.
+
+    python -m benchmarks.bench_compression --rounds 50
+
+Payloads: a 100-hero `/heroes/` page, a 100-item `/offers/` body, and the same heroes as an
+NDJSON export compressed line by line with a flush after every line (what the middleware
+does for streaming responses). brotli and zstd rows only appear when their packages are
+installed.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.bench_json_response import make_offer
+from compression import available_encoders
+
+LEVELS = {"gzip": [1, 6, 9], "br": [1, 4, 11], "zstd": [1, 3, 19]}
+
+
+def heroes_page(count: int = 100) -> bytes:
+    heroes = [{"name": f"Hero {i}", "age": 20 + i % 50, "id": i, "version": 1,
+               "updated_at": "2025-01-01T00:00:00"} for i in range(count)]
+    return json.dumps(heroes).encode()
+
+
+def compress(encoder_class, level: int, chunks: list[bytes], streaming: bool) -> int:
+    encoder = encoder_class(level)
+    size = 0
+    for chunk in chunks:
+        size += len(encoder.compress(chunk))
+        if streaming:
+            size += len(encoder.flush())
+    return size + len(encoder.finish())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    page = heroes_page()
+    payloads = {
+        "heroes page": ([page], False),
+        "offer": ([make_offer(100).model_dump_json().encode()], False),
+        "ndjson stream": ([json.dumps(hero).encode() + b"\n" for hero in json.loads(page)], True),
+    }
+    for name, (chunks, streaming) in payloads.items():
+        raw = sum(len(chunk) for chunk in chunks)
+        print(f"{name}: {raw} bytes")
+        for coding, encoder_class in available_encoders().items():
+            for level in LEVELS[coding]:
+                start = time.process_time()
+                for _ in range(args.rounds):
+                    size = compress(encoder_class, level, chunks, streaming)
+                cpu = (time.process_time() - start) / args.rounds
+                print(f"  {coding:>4} level {level:>2}: {size:7d} bytes ({raw / size:5.1f}x), "
+                      f"{cpu * 1_000_000:8.1f} us CPU, {raw / cpu / 1024 / 1024:7.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
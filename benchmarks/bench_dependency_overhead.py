@@ -0,0 +1,68 @@
+"""
+Per-request cost of app/'s token dependencies on nested routers.
+
+    python -m benchmarks.bench_dependency_overhead --requests 5000
+
+Each variant mirrors app/main.py: a query-token check on the app, an X-Token check on the
+items router, and the X-Token check declared again through include_router (as for the admin
+router). "Header()/Query" are the functions app/dependencies.py had before the token store;
+"token store" are the current TokenQuery/TokenHeader dependencies.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException
+
+from app.dependencies import get_query_token, get_token_header
+from benchmarks.asgi import make_scope, requests_per_second
+
+
+async def header_function(x_token: str = Header()):
+    if x_token != "fake-super-secret-token":
+        raise HTTPException(status_code=400, detail="X-Token header invalid")
+
+
+async def query_function(token: str):
+    if token != "jessica":
+        raise HTTPException(status_code=400, detail="No Jessica token provided")
+
+
+def make_app(query_dependency, header_dependency) -> FastAPI:
+    app = FastAPI(dependencies=[Depends(query_dependency)] if query_dependency else [])
+    router = APIRouter(prefix="/items", dependencies=[Depends(header_dependency)] if header_dependency else [])
+
+    @router.get("/{item_id}")
+    async def read_item(item_id: str):
+        return {"name": "Plumbus", "item_id": item_id}
+
+    app.include_router(router, dependencies=[Depends(header_dependency)] if header_dependency else [])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=9)
+    args = parser.parse_args()
+
+    apps = {
+        "no dependencies": make_app(None, None),
+        "Header()/Query": make_app(query_function, header_function),
+        "token store": make_app(get_query_token, get_token_header),
+    }
+    scope = make_scope("GET", "/items/plumbus?token=jessica", [(b"x-token", b"fake-super-secret-token")])
+    rates = {name: [] for name in apps}
+    for _ in range(args.rounds):
+        for name in random.sample(list(apps), len(apps)):
+            rates[name].append(asyncio.run(requests_per_second(apps[name], scope, args.requests)))
+
+    base = 1_000_000 / statistics.median(rates["no dependencies"])
+    for name, samples in rates.items():
+        per_request = 1_000_000 / statistics.median(samples)
+        print(f"{name:>16}: {per_request:6.1f} us/request, dependencies {per_request - base:+6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
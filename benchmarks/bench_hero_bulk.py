@@ -0,0 +1,63 @@
+"""
+Compare hero write throughput: one POST /heroes/ per row vs. one POST /heroes/bulk.
+
+    python -m benchmarks.bench_hero_bulk --rows 2000
+
+Both paths write to a fresh on-disk SQLite file so every commit pays its real fsync. The
+per-IP write rate limit and the write concurrency limit are switched off: this measures
+the write path, not the limiters.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+
+from sql import app, get_session, hero_write_concurrency, hero_write_rate_limit
+
+
+def make_client(db_path: Path) -> TestClient:
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+
+    def get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    # 默认每个 IP 每分钟 60 次写，逐条 POST 的那一轮跑到第 61 行就会 429
+    app.dependency_overrides[hero_write_rate_limit] = lambda: None
+    app.dependency_overrides[hero_write_concurrency] = lambda: None
+    return TestClient(app)
+
+
+def one_at_a_time(client: TestClient, heroes: list[dict]) -> None:
+    for hero in heroes:
+        assert client.post("/heroes/", json=hero).status_code == 200
+
+
+def bulk(client: TestClient, heroes: list[dict]) -> None:
+    response = client.post("/heroes/bulk", json=heroes)
+    assert response.status_code == 200 and not response.json()["errors"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    heroes = [{"name": f"hero-{i}", "secret_name": f"secret-{i}", "age": i % 90} for i in range(args.rows)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, run in [("one-at-a-time", one_at_a_time), ("bulk", bulk)]:
+            client = make_client(Path(tmp) / f"{label}.db")
+            start = time.perf_counter()
+            run(client, heroes)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>14}: {args.rows / elapsed:10,.0f} rows/s ({elapsed:.2f}s for {args.rows} rows)")
+    app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare FastAPI's default JSON serialization with PydanticJSONRoute on main.py's Offer model.
+
+    python -m benchmarks.bench_json_response --items 1000 --requests 200
+
+Both apps serve the same prebuilt `Offer` (with `--items` nested items, each with images)
+through `response_model=Offer`. Reported per request: mean and p99 latency, and the peak
+memory traced while one response is built.
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from json_route import PydanticJSONRoute
+from main import Image, Offer
+
+# main.py 后面又定义了几个同名的 Item，这里取 Offer 里用的那个
+Item = Offer.model_fields["items"].annotation.__args__[0]
+
+
+def make_offer(items: int) -> Offer:
+    return Offer(
+        name="bundle",
+        description="A big bundle",
+        price=99.5,
+        items=[
+            Item(
+                name=f"item-{i}",
+                description="All my friends drive a low rider",
+                price=i + 0.5,
+                tax=3.2,
+                tags={"a", "b", f"t{i % 10}"},
+                image=Image(url=f"https://example.com/{i}.png", name=f"{i}.png"),
+                images=[Image(url=f"https://example.com/{i}-{j}.png", name=f"{i}-{j}.png") for j in range(3)],
+            )
+            for i in range(items)
+        ],
+    )
+
+
+def make_app(route_class: type[APIRoute], offer: Offer) -> FastAPI:
+    router = APIRouter(route_class=route_class)
+
+    @router.get("/offer", response_model=Offer)
+    async def read_offer():
+        return offer
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def measure(client: TestClient, requests: int) -> tuple[float, float, float]:
+    client.get("/offer")
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get("/offer").raise_for_status()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    tracemalloc.start()
+    client.get("/offer")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.mean(timings) * 1000, timings[int(len(timings) * 0.99)] * 1000, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    offer = make_offer(args.items)
+    for name, route_class in [("APIRoute", APIRoute), ("PydanticJSONRoute", PydanticJSONRoute)]:
+        with TestClient(make_app(route_class, offer)) as client:
+            mean, p99, peak = measure(client, args.requests)
+            size = len(client.get("/offer").content)
+        print(f"{name:>17}: mean {mean:7.2f} ms, p99 {p99:7.2f} ms, peak alloc {peak:6.2f} MiB, body {size} bytes")
+
+
+if __name__ == "__main__":
+    main()
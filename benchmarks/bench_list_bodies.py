@@ -0,0 +1,115 @@
+"""
+Latency and longest event-loop stall for image lists of growing size.
+
+    python -m benchmarks.bench_list_bodies --sizes 100,1000,10000,100000
+
+"unbounded list" is /images/multiple/ as it was: any number of images validated in one go
+and printed one by one. "bounded list" is the current endpoint (413 above MAX_LIST_BODY_SIZE,
+422 above MAX_LIST_ITEMS). "ndjson" sends the same images to /images/multiple/ndjson in 64 KiB
+chunks. The stall is the longest time the event loop could not run anything else; output
+goes to /dev/null.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import statistics
+import time
+
+from fastapi import FastAPI
+
+import main as demo
+from benchmarks.asgi import make_scope
+from log_writer import QueueLogHandler
+
+CHUNK_SIZE = 64 * 1024
+
+
+def unbounded_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/images/multiple/")
+    async def create_multiple_images(images: list[demo.Image]):
+        for image in images:
+            print(image.name, image.url)
+        return images
+
+    return app
+
+
+async def timed_call(app, scope: dict, body: bytes) -> tuple[int, float, float]:
+    """Status, seconds until the response was complete, and the longest loop stall in seconds."""
+    chunks = [body[offset:offset + CHUNK_SIZE] for offset in range(0, len(body), CHUNK_SIZE)] or [b""]
+    status, longest, done = 0, 0.0, False
+
+    async def receive():
+        if chunks:
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    async def watch_loop():
+        nonlocal longest
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            longest, last = max(longest, now - last), now
+
+    watcher = asyncio.create_task(watch_loop())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await app(dict(scope), receive, send)
+    elapsed = time.perf_counter() - start
+    done = True
+    await watcher
+    return status, elapsed, longest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, "w")
+    for handler in demo.images_logger.handlers[:]:
+        demo.images_logger.removeHandler(handler)
+        handler.close()
+    demo.images_logger.addHandler(QueueLogHandler(logging.StreamHandler(devnull)))
+
+    json_scope = make_scope("POST", "/images/multiple/", [(b"content-type", b"application/json")])
+    ndjson_scope = make_scope("POST", "/images/multiple/ndjson", [(b"content-type", b"application/x-ndjson")])
+    variants = {
+        "unbounded list": (unbounded_app(), json_scope, "json"),
+        "bounded list": (demo.app, json_scope, "json"),
+        "ndjson": (demo.app, ndjson_scope, "ndjson"),
+    }
+    for size in map(int, args.sizes.split(",")):
+        images = [{"url": f"https://example.com/images/{i}.png", "name": f"image-{i}"} for i in range(size)]
+        bodies = {
+            "json": json.dumps(images).encode(),
+            "ndjson": b"\n".join(json.dumps(image).encode() for image in images),
+        }
+        for name, (app, scope, kind) in variants.items():
+            headers = scope["headers"] + [(b"content-length", str(len(bodies[kind])).encode())]
+            results = []
+            with contextlib.redirect_stdout(devnull):
+                for _ in range(args.rounds):
+                    results.append(asyncio.run(timed_call(app, {**scope, "headers": headers}, bodies[kind])))
+            status = results[0][0]
+            elapsed = statistics.median(result[1] for result in results)
+            stall = statistics.median(result[2] for result in results)
+            print(f"{size:>7} images, {name:>14}: {status}, {elapsed * 1000:8.1f} ms, "
+                  f"longest stall {stall * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measure event-loop lag while a burst of logins hits POST /token.
+
+    python -m benchmarks.bench_login_storm --logins 20
+
+"blocking" runs bcrypt inline in the handler, the way login used to work; "offloaded" is the
+current worker-pool path. The verification cache is off so every login pays for bcrypt.
+A ticker task sleeps 10 ms in a loop; how late it wakes up is the lag every other request sees.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import test as auth
+from ratelimit import Rate
+
+
+async def blocking_authenticate(fake_db, username: str, password: str):
+    user = auth.get_user(fake_db, username)
+    if not user or not auth.verify_password(password, user.hashed_password):
+        return False
+    return user
+
+
+async def measure_lag(stop: asyncio.Event, lags: list[float], interval: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def storm(logins: int) -> tuple[float, list[float]]:
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    transport = httpx.ASGITransport(app=auth.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/token", data={"username": "johndoe", "password": "secret"}) for _ in range(logins)
+        ))
+        elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    assert all(response.status_code == 200 for response in responses)
+    return elapsed, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+
+    auth.verified_passwords.maxsize = 0
+    # 这里要看的是 bcrypt 对事件循环的影响，限流和排队上限先放开
+    auth.login_rate_limit.rate = auth.login_user_rate_limit.rate = Rate(10 ** 9, 1)
+    auth.login_concurrency.max_waiting = args.logins
+    original = auth.authenticate_user
+    for label, authenticate in [("blocking", blocking_authenticate), ("offloaded", original)]:
+        auth.authenticate_user = authenticate
+        elapsed, lags = asyncio.run(storm(args.logins))
+        lags.sort()
+        print(
+            f"{label:>10}: {args.logins} logins in {elapsed:.2f}s, loop lag "
+            f"p50 {statistics.median(lags):.1f} ms / p99 {lags[int(len(lags) * 0.99)]:.1f} ms / "
+            f"max {lags[-1]:.1f} ms ({len(lags)} ticks)"
+        )
+    auth.authenticate_user = original
+
+
+if __name__ == "__main__":
+    main()
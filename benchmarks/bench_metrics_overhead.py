@@ -0,0 +1,66 @@
+"""
+Per-request cost of MetricsMiddleware, and the cost of rendering /metrics.
+
+    python -m benchmarks.bench_metrics_overhead --requests 20000
+
+The same small FastAPI app is called in-process with and without the middleware, alternating
+for a few rounds; the difference between the best rounds is what the metrics cost.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from benchmarks.asgi import make_scope, requests_per_second
+from metrics import MetricsMiddleware, MetricsRegistry
+
+
+def make_app(registry: MetricsRegistry | None) -> FastAPI:
+    app = FastAPI()
+    if registry is not None:
+        app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/users/{user_id}")
+    async def read_user(user_id: int):
+        return {"user_id": user_id}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--routes", type=int, default=100, help="series in the registry when timing render()")
+    args = parser.parse_args()
+
+    scope = make_scope("GET", "/users/42")
+    registry = MetricsRegistry()
+    apps = {"plain": make_app(None), "metrics": make_app(registry)}
+    best = {name: 0.0 for name in apps}
+    # 两种交替跑几轮取最好的一次，减少顺序和机器抖动的影响
+    for _ in range(args.rounds):
+        for name, app in apps.items():
+            best[name] = max(best[name], asyncio.run(requests_per_second(app, scope, args.requests)))
+    plain, measured = best["plain"], best["metrics"]
+    overhead = (1 / measured - 1 / plain) * 1_000_000
+    print(f"without metrics: {plain:8.0f} req/s ({1_000_000 / plain:6.1f} us/request)")
+    print(f"   with metrics: {measured:8.0f} req/s ({1_000_000 / measured:6.1f} us/request), "
+          f"overhead {overhead:.1f} us/request")
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        registry.observe("GET", "/users/{user_id}", 200, 0.003, 0, 13)
+    print(f"observe(): {(time.perf_counter() - start) / args.requests * 1_000_000:.2f} us")
+
+    for index in range(args.routes):
+        registry.observe("GET", f"/route/{index}", 200, 0.003, 0, 13)
+    start = time.perf_counter()
+    text = registry.render()
+    print(f"render() with {len(registry.routes)} routes: {(time.perf_counter() - start) * 1000:.2f} ms, "
+          f"{len(text)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Requests/sec of test.py's /users/me chain with each middleware layer on its own and stacked.
+
+    python -m benchmarks.bench_middleware_layers --requests 2000 --rounds 15
+
+Every variant is a FastAPI app sharing test.py's routes, called in-process with a valid
+bearer token, an Origin header and Accept-Encoding: gzip. The "+us" column is the cost of the
+variant's middleware on top of the bare app. "@app.middleware" is the decorator-based
+X-Process-Time middleware test.py used before, kept here for comparison.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from fastapi import FastAPI
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+
+import test as auth
+from benchmarks.asgi import make_scope, requests_per_second
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, MetricsRegistry
+from middleware import ProcessTimeMiddleware, middleware_stack
+
+
+async def add_process_time_header(request, call_next):
+    start_time = time.perf_counter()
+    response = await call_next(request)
+    response.headers["X-Process-Time"] = str(time.perf_counter() - start_time)
+    return response
+
+
+def variants() -> dict[str, list[Middleware]]:
+    cors = Middleware(CORSMiddleware, allow_origins=auth.origins, allow_credentials=True,
+                      allow_methods=["*"], allow_headers=["*"])
+    decorator = Middleware(BaseHTTPMiddleware, dispatch=add_process_time_header)
+    return {
+        "no middleware": [],
+        "CORS": [cors],
+        "metrics": [Middleware(MetricsMiddleware, registry=MetricsRegistry())],
+        "process time": [Middleware(ProcessTimeMiddleware)],
+        "@app.middleware": [decorator],
+        "compression": [Middleware(CompressionMiddleware)],
+        "full stack": middleware_stack(auth.origins, metrics_registry=MetricsRegistry()),
+        "full stack, old timing": [cors, Middleware(MetricsMiddleware, registry=MetricsRegistry()), decorator,
+                                   Middleware(CompressionMiddleware)],
+    }
+
+
+def make_app(middleware: list[Middleware]) -> FastAPI:
+    app = FastAPI(middleware=middleware)
+    app.router.routes = auth.app.router.routes
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=15)
+    args = parser.parse_args()
+
+    token = auth.create_access_token({"sub": "johndoe"})
+    scope = make_scope("GET", "/users/me", [
+        (b"authorization", f"Bearer {token}".encode()),
+        (b"origin", b"http://localhost"),
+        (b"accept-encoding", b"gzip"),
+    ])
+    apps = {name: make_app(middleware) for name, middleware in variants().items()}
+    rates = {name: [] for name in apps}
+    # 每轮打乱顺序，取各个变体的中位数，机器抖动不会总落在同一个变体上
+    for _ in range(args.rounds):
+        for name in random.sample(list(apps), len(apps)):
+            rates[name].append(asyncio.run(requests_per_second(apps[name], scope, args.requests)))
+
+    base = 1_000_000 / statistics.median(rates["no middleware"])
+    for name, samples in rates.items():
+        rate = statistics.median(samples)
+        per_request = 1_000_000 / rate
+        print(f"{name:>24}: {rate:8.0f} req/s {per_request:7.1f} us/request {per_request - base:+7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Load test: latency under overload with and without a ConcurrencyLimiter in front of a route.
+
+    python -m benchmarks.bench_overload --capacity 4 --service-ms 20 --overload 2 --seconds 3
+
+The route holds one of `--capacity` worker slots for `--service-ms` (like bcrypt on
+/token, or the SQLite write lock on POST /heroes/), so it can serve capacity / service time
+requests per second. Requests arrive open-loop at `--overload` times that rate. Without the
+limiter every request is accepted and the backlog grows, so latency grows for as long as the
+overload lasts; with it the excess is shed with 503 and accepted requests stay fast.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import anyio
+import httpx
+from fastapi import Depends, FastAPI
+
+from ratelimit import ConcurrencyLimiter
+
+
+def make_app(capacity: int, service_seconds: float, limiter: ConcurrencyLimiter | None) -> FastAPI:
+    workers = anyio.CapacityLimiter(capacity)
+    app = FastAPI()
+
+    @app.post("/work", dependencies=[Depends(limiter)] if limiter else [])
+    async def work():
+        async with workers:
+            await asyncio.sleep(service_seconds)
+        return {"ok": True}
+
+    return app
+
+
+async def run(app: FastAPI, rate: float, seconds: float) -> tuple[list[float], int]:
+    latencies, shed = [], 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def one():
+            nonlocal shed
+            start = time.perf_counter()
+            response = await client.post("/work")
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                shed += 1
+
+        tasks = []
+        start = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - start < seconds:
+            # 按固定到达速率发请求，不等前面的返回（开环），和真实的突发流量一样
+            due = int((time.perf_counter() - start) * rate)
+            for _ in range(due - sent):
+                tasks.append(asyncio.create_task(one()))
+            sent = max(sent, due)
+            await asyncio.sleep(0.002)
+        await asyncio.gather(*tasks)
+    return sorted(latencies), shed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=20)
+    parser.add_argument("--overload", type=float, default=2.0, help="arrival rate / service rate")
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    service_seconds = args.service_ms / 1000
+    rate = args.capacity / service_seconds * args.overload
+    print(f"service rate {args.capacity / service_seconds:.0f} req/s, arrivals {rate:.0f} req/s for {args.seconds}s")
+    for label, limiter in [
+        ("unlimited", None),
+        ("limited", ConcurrencyLimiter(limit=args.capacity, max_waiting=args.capacity * 2, wait_timeout=0.25)),
+    ]:
+        latencies, shed = asyncio.run(run(make_app(args.capacity, service_seconds, limiter), rate, args.seconds))
+        print(f"{label:>10}: {len(latencies)} ok, {shed} shed, latency p50 {statistics.median(latencies):7.1f} ms "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:7.1f} ms max {latencies[-1]:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Load test the hero table with concurrent readers and writers, default engine vs. tuned engine.
+
+    python -m benchmarks.bench_sqlite_profile --readers 8 --writers 4 --seconds 5
+
+"default" is the engine sql.py used to build (rollback journal, synchronous=FULL);
+"tuned" is create_sqlite_engine() with the pragmas from the environment.
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine
+
+from sql import Hero, connect_args, create_sqlite_engine
+
+SEED_ROWS = 10_000
+
+
+def run_load(engine, readers: int, writers: int, seconds: float) -> dict:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(Hero(name=f"hero-{i}", secret_name="secret", age=i % 90) for i in range(SEED_ROWS))
+        session.commit()
+
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(write: bool):
+        done = locked = 0
+        while time.perf_counter() < deadline:
+            try:
+                with Session(engine) as session:
+                    if write:
+                        session.add(Hero(name="new hero", secret_name="secret"))
+                        session.commit()
+                    else:
+                        session.get(Hero, random.randint(1, SEED_ROWS))
+                done += 1
+            except OperationalError:
+                locked += 1
+        with lock:
+            counts["writes" if write else "reads"] += done
+            counts["locked"] += locked
+
+    threads = [threading.Thread(target=worker, args=(False,)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(True,)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = {
+            "default": lambda url: create_engine(url, connect_args=connect_args),
+            "tuned": lambda url: create_sqlite_engine(url),
+        }
+        for label, make_engine in profiles.items():
+            engine = make_engine(f"sqlite:///{Path(tmp) / label}.db")
+            counts = run_load(engine, args.readers, args.writers, args.seconds)
+            print(
+                f"{label:>8}: {counts['reads'] / args.seconds:10,.0f} reads/s"
+                f" {counts['writes'] / args.seconds:8,.0f} writes/s"
+                f" {counts['locked']:6} 'database is locked' errors"
+            )
+
+
+if __name__ == "__main__":
+    main()
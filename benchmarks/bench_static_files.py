@@ -0,0 +1,64 @@
+"""
+Compare /static throughput: Starlette's StaticFiles vs. CachedStaticFiles.
+
+    python -m benchmarks.bench_static_files --requests 5000
+
+Requests go straight to the ASGI app through httpx's ASGITransport, so the numbers are
+the per-request cost of the mount itself, without a server or network in the way.
+"""
+import argparse
+import asyncio
+import gzip
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from static_files import CachedStaticFiles
+
+CASES = [
+    ("image", "/static/test222.png", {}),
+    ("css, gzip accepted", "/static/site.css", {"Accept-Encoding": "gzip"}),
+    ("css, revalidate", "/static/site.css", None),
+]
+
+
+async def requests_per_second(static, path: str, headers: dict | None, requests: int) -> float:
+    app = FastAPI()
+    app.mount("/static", static)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        if headers is None:
+            headers = {"If-None-Match": (await client.get(path)).headers["etag"]}
+        await client.get(path, headers=headers)
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get(path, headers=headers)
+            assert response.status_code in (200, 304)
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        (directory / "test222.png").write_bytes(Path("static/test222.png").read_bytes())
+        css = b".hero { color: rebeccapurple; margin: 0 auto; }\n" * 1000
+        (directory / "site.css").write_bytes(css)
+        (directory / "site.css.gz").write_bytes(gzip.compress(css))
+
+        for label, path, headers in CASES:
+            plain = asyncio.run(requests_per_second(StaticFiles(directory=directory), path, headers, args.requests))
+            cached = asyncio.run(
+                requests_per_second(CachedStaticFiles(directory=directory), path, headers, args.requests)
+            )
+            print(f"{label:>20}: StaticFiles {plain:8,.0f} req/s, CachedStaticFiles {cached:8,.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Time to fetch one page of items from MemoryStore and SQLiteStore, by filter and offset or cursor.
+
+    python -m benchmarks.bench_store_pages --items 100000 --tags 20
+
+Every item gets 3 of `--tags` tags at random. "scan" is what a list of dicts can do: filter
+every item, sort the matches and slice. A "cursor" row fetches the same page as the row above
+it, starting from the cursor of the page before instead of counting `offset` entries.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from store import MemoryStore, SQLiteStore
+
+
+def best_of(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--tags", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    tag_names = [f"tag{index}" for index in range(args.tags)]
+    items = [(f"item{index}", {"name": f"item {index}"}, random.sample(tag_names, 3)) for index in range(args.items)]
+    directory = tempfile.mkdtemp()
+    stores = {"memory": MemoryStore(), "sqlite": SQLiteStore(os.path.join(directory, "store.db"))}
+    for name, store in stores.items():
+        start = time.perf_counter()
+        if isinstance(store, SQLiteStore):
+            # 只是灌测试数据，不用等每个事务落盘
+            store._connection().execute("PRAGMA synchronous=OFF")
+        for key, value, tags in items:
+            store.put("items", key, value, tags)
+        print(f"{name:>6}: {args.items} puts in {time.perf_counter() - start:.1f} s")
+    listed = [{"key": key, **value, "tags": set(tags), "created_at": index} for index, (key, value, tags) in
+              enumerate(items)]
+
+    def scan(limit, offset, tags):
+        matches = sorted((item for item in listed if set(tags) <= item["tags"]), key=lambda item: item["created_at"])
+        return matches[offset:offset + limit]
+
+    queries = [
+        ("first page", 100, 0, []),
+        ("deep page", 100, args.items // 2, []),
+        ("one tag", 100, 0, ["tag1"]),
+        ("one tag, deep", 100, args.items // 20, ["tag1"]),
+        ("two tags", 100, 0, ["tag1", "tag2"]),
+    ]
+    for label, limit, offset, tags in queries:
+        timings = {name: best_of(lambda: store.page("items", limit, offset, tags=tags), args.repeat)
+                   for name, store in stores.items()}
+        timings["scan"] = best_of(lambda: scan(limit, offset, tags), 3)
+        print(f"{label:>21}: " + ", ".join(f"{name} {seconds * 1000:8.3f} ms" for name, seconds in timings.items()))
+        if offset:
+            # 同一页，从前一条的游标开始
+            cursors = {name: store.page("items", 1, offset - 1, tags=tags).next_cursor
+                       for name, store in stores.items()}
+            timings = {name: best_of(lambda: store.page("items", limit, tags=tags, after=cursors[name]), args.repeat)
+                       for name, store in stores.items()}
+            print(f"{label + ', cursor':>21}: "
+                  + ", ".join(f"{name} {seconds * 1000:8.3f} ms" for name, seconds in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
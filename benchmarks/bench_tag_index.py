@@ -0,0 +1,80 @@
+"""
+Query latency of TagIndex (the index behind GET /items/) for 1M items and 50 tags.
+
+    python -m benchmarks.bench_tag_index --items 1000000 --tags 50
+
+Each item gets 1-5 tags, popular tags much more often than rare ones (tag N is picked with
+weight 1/(N+1)). Pages are 100 keys. Before querying, `--updates` random items are updated
+so that update order differs from creation order. "scan" is a filter + sort over a list of
+the same items, once, for scale.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from tag_index import TagIndex
+
+
+def median_us(function, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = [f"tag{index}" for index in range(args.tags)]
+    weights = [1 / (index + 1) for index in range(args.tags)]
+    item_tags = [frozenset(rng.choices(names, weights, k=rng.randint(1, 5))) for _ in range(args.items)]
+
+    index = TagIndex()
+    start = time.perf_counter()
+    for number, tags in enumerate(item_tags):
+        index.put(f"item{number}", tags)
+    print(f"built: {args.items} items in {time.perf_counter() - start:.1f} s")
+    start = time.perf_counter()
+    for number in rng.sample(range(args.items), args.updates):
+        index.put(f"item{number}", item_tags[number])
+    print(f"{args.updates} updates in {time.perf_counter() - start:.1f} s")
+    for tag in ("tag0", "tag1", "tag10", f"tag{args.tags - 1}"):
+        print(f"{tag:>6}: {index.count([tag])} items")
+
+    deep = args.items // 2
+    queries = [
+        ("all items, first page", {}),
+        (f"all items, offset {deep}", {"offset": deep}),
+        ("tag1", {"tags": ["tag1"]}),
+        ("tag1, offset 10000", {"tags": ["tag1"], "offset": 10_000}),
+        ("tag1 AND tag2", {"tags": ["tag1", "tag2"]}),
+        ("tag1 AND tag2, offset 1000", {"tags": ["tag1", "tag2"], "offset": 1000}),
+        ("tag0 AND tag1 AND tag2", {"tags": ["tag0", "tag1", "tag2"]}),
+        ("rare AND rare (tag40, tag45)", {"tags": ["tag40", "tag45"]}),
+        ("tag10 OR tag20", {"tags": ["tag10", "tag20"], "match": "any"}),
+        ("5 rare tags OR, offset 5000", {"tags": [f"tag{n}" for n in range(40, 45)], "match": "any", "offset": 5000}),
+        ("tag1 AND tag2 by updated_at", {"tags": ["tag1", "tag2"], "order_by": "updated_at"}),
+        ("all items by updated_at, offset 500000", {"order_by": "updated_at", "offset": deep}),
+    ]
+    for label, query in queries:
+        keys = index.query(**query)
+        print(f"{label:>40}: {median_us(lambda: index.query(**query), args.repeat):8.1f} us ({len(keys)} keys)")
+    print(f"{'count(tag1 AND tag2)':>40}: {median_us(lambda: index.count(['tag1', 'tag2']), args.repeat):8.1f} us")
+
+    wanted = {"tag1", "tag2"}
+    start = time.perf_counter()
+    [number for number, tags in enumerate(item_tags) if wanted <= tags][:100]
+    print(f"{'scan, tag1 AND tag2':>40}: {(time.perf_counter() - start) * 1_000_000:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure POST /uploadfiles/ throughput with 1, 4 and 8 analysis worker processes.
+
+    python -m benchmarks.bench_upload_batch --files 32 --size 1024
+
+Each run uploads the same batch of generated PNGs (size x size pixels) in one request.
+The process pool is started and warmed up before the clock starts. Thumbnails are only
+made when Pillow is installed, which is most of the CPU work per file.
+"""
+import argparse
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from fastapi.testclient import TestClient
+
+import main as demo
+from uploads import AnalysisPool
+
+
+def png(size: int, seed: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = bytes((x * 7 + seed) % 256 for x in range(size * 3))
+    rows = b"".join(b"\0" + row[y % 3:] + row[:y % 3] for y in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b"")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--size", type=int, default=1024)
+    args = parser.parse_args()
+
+    images = [("files", (f"image-{i}.png", png(args.size, i), "image/png")) for i in range(args.files)]
+    print(f"cpu cores: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        demo.UPLOAD_DIR = tmp
+        for workers in (1, 4, 8):
+            demo.upload_pool = AnalysisPool(workers)
+            with TestClient(demo.app) as client:
+                client.post("/uploadfiles/", files=images[:workers])
+                start = time.perf_counter()
+                response = client.post("/uploadfiles/", files=images)
+                elapsed = time.perf_counter() - start
+            assert response.status_code == 200 and all("error" not in f for f in response.json()["files"])
+            print(f"{workers} workers: {args.files / elapsed:8.1f} files/s ({elapsed:.2f}s for {args.files} files)")
+
+
+if __name__ == "__main__":
+    main()
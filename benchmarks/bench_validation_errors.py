@@ -0,0 +1,75 @@
+"""
+Throughput of invalid /offers/ payloads with 1,000-item lists, old vs lean 422 handler.
+
+    python -m benchmarks.bench_validation_errors --requests 100
+
+"jsonable_encoder" is main.py's previous handler: every error and the whole body echoed
+through jsonable_encoder and json.dumps. "lean" is the current one. A valid payload of the
+same size is timed for reference.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import main as demo
+from benchmarks.asgi import call, make_scope
+
+
+async def jsonable_encoder_handler(request, exc: RequestValidationError):
+    return JSONResponse(status_code=422, content=jsonable_encoder({"detail": exc.errors(), "body": exc.body}))
+
+
+def use_handler(handler) -> None:
+    demo.app.exception_handlers[RequestValidationError] = handler
+    # 异常处理器在第一次请求时装进中间件栈，换了之后要重建
+    demo.app.middleware_stack = None
+
+
+def make_offer(items: int, price: float) -> bytes:
+    items = [{"name": f"item-{i}", "description": "A long description " * 5, "price": price, "tags": ["a", "b"]}
+             for i in range(items)]
+    return json.dumps({"name": "offer", "price": 1.0, "items": items}).encode()
+
+
+async def requests_per_second(body: bytes, requests: int) -> float:
+    scope = make_scope("POST", "/offers/", [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ])
+    await call(demo.app, scope, body)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(demo.app, scope, body)
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--items", type=int, default=1000)
+    args = parser.parse_args()
+
+    lean_handler = demo.app.exception_handlers[RequestValidationError]
+    client = TestClient(demo.app)
+    runs = [
+        ("valid", make_offer(args.items, 1.0), "lean", lean_handler),
+        ("every item invalid", make_offer(args.items, -1.0), "jsonable_encoder", jsonable_encoder_handler),
+        ("every item invalid", make_offer(args.items, -1.0), "lean", lean_handler),
+    ]
+    for payload, body, label, handler in runs:
+        use_handler(handler)
+        rate = asyncio.run(requests_per_second(body, args.requests))
+        response = client.post("/offers/", content=body, headers={"content-type": "application/json"})
+        print(f"{payload:>18} / {label:>16}: {rate:6.1f} req/s, {response.status_code}, "
+              f"request {len(body)} bytes, response {len(response.content)} bytes")
+    use_handler(lean_handler)
+
+
+if __name__ == "__main__":
+    main()
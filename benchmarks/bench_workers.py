@@ -0,0 +1,101 @@
+"""
+Requests per second through serve.py for different worker counts.
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --duration 10
+
+For each worker count serve.py is started on `--port`, and `--clients` load processes keep
+`--connections` keep-alive connections each busy with `GET --path`, one request at a time
+per connection. The load generator runs on the same machine and takes CPU from the server,
+so compare the rows with each other, not with numbers from a separate load box.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+async def keep_busy(port: int, path: str, deadline: float) -> tuple[int, int]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+    done = errors = 0
+    while time.monotonic() < deadline:
+        writer.write(request)
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        if head.startswith(b"HTTP/1.1 200"):
+            done += 1
+        else:
+            errors += 1
+    writer.close()
+    return done, errors
+
+
+def load(port: int, path: str, connections: int, duration: float, results) -> None:
+    async def run():
+        deadline = time.monotonic() + duration
+        return await asyncio.gather(*(keep_busy(port, path, deadline) for _ in range(connections)))
+
+    counts = asyncio.run(run())
+    results.put((sum(done for done, _ in counts), sum(errors for _, errors in counts)))
+
+
+def wait_until_ready(port: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as connection:
+                connection.sendall(b"GET / HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+                if connection.recv(12).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("serve.py did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default=f"1,2,{os.cpu_count() or 1}")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    for workers in sorted({int(count) for count in args.workers.split(",")}):
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port), "--host", "127.0.0.1"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            # 多 worker 默认用 store.db，压测不用留下文件
+            env={**os.environ, "STORE_PATH": os.environ.get("STORE_PATH", "")},
+        )
+        try:
+            wait_until_ready(args.port)
+            results = multiprocessing.Queue()
+            clients = [multiprocessing.Process(target=load, args=(args.port, args.path, args.connections,
+                                                                  args.duration, results))
+                       for _ in range(args.clients)]
+            for client in clients:
+                client.start()
+            counts = [results.get() for _ in clients]
+            for client in clients:
+                client.join()
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        done, errors = sum(done for done, _ in counts), sum(errors for _, errors in counts)
+        print(f"{workers:>2} workers: {done / args.duration:8.0f} req/s, {errors} errors")
+
+
+if __name__ == "__main__":
+    main()
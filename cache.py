@@ -0,0 +1,257 @@
+"""
+Read-through caches with invalidation that can't be undone by a slow reader.
+
+A reader that misses calls `reserve(key)` *before* loading from the database and passes
+the token to `fill(...)`. `invalidate(key)` makes every outstanding token for that key
+stale, so a reader that loaded the old row before a write committed can't put it back
+into the cache after the writer has invalidated it.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+
+from pydantic import BaseModel
+
+
+class LRUTTLCache:
+    """
+    In-process LRU cache whose entries also expire after `ttl` seconds.
+
+    `maxsize=0` disables caching (every lookup is a miss). Only this process sees
+    the entries; with several workers use `SharedCache` so invalidations reach all of them.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = self.misses = self.evictions = 0
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        # 每个正在加载的 key 对应一个令牌，invalidate 时丢掉，晚到的 fill 就会被拒绝
+        self._pending: dict[Any, object] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def reserve(self, key) -> object:
+        token = object()
+        with self._lock:
+            self._pending[key] = token
+        return token
+
+    def fill(self, key, value, token: object, ttl: float | None = None) -> None:
+        """
+        Store `value` unless `key` was invalidated since `reserve`; `None` only releases the token.
+
+        `ttl` can shorten (never extend) the lifetime of this one entry.
+        """
+        with self._lock:
+            if self._pending.get(key) is not token:
+                return
+            del self._pending[key]
+            if value is None or self.maxsize <= 0:
+                return
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._pending.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class KeyValueStore(Protocol):
+    """The few operations `SharedCache` needs from a shared store such as Redis or memcached."""
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]: ...
+
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    def incr(self, key: str) -> int: ...
+
+
+class InMemoryKeyValueStore:
+    """Local stand-in for a shared store, for tests and single-process development."""
+
+    def __init__(self, maxsize: int = 10_000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.evictions = 0
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        now = self.clock()
+        with self._lock:
+            values = []
+            for key in keys:
+                entry = self._data.get(key)
+                values.append(entry[1] if entry is not None and entry[0] > now else None)
+            return values
+
+    def set(self, key: str, value: bytes, ttl: float = float("inf")) -> None:
+        with self._lock:
+            self._data[key] = (self.clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            entry = self._data.get(key)
+            value = int(entry[1]) + 1 if entry is not None else 1
+            self._data[key] = (float("inf"), str(value).encode())
+            return value
+
+
+class SQLiteKeyValueStore:
+    """
+    `KeyValueStore` in a SQLite file, shared by the worker processes of one machine.
+
+    Expiry uses wall-clock time, the only clock the processes have in common. Expired
+    entries are deleted every `purge_every` writes.
+    """
+
+    def __init__(self, path: str, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # 和 JobQueue 一样每个线程一个自动提交的连接
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        rows = dict(self._connection().execute(
+            f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(keys))}) AND expires_at > ?",
+            (*keys, time.time()),
+        ).fetchall())
+        return [rows.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: float = float("inf")) -> None:
+        connection = self._connection()
+        now = time.time()
+        connection.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, now + ttl))
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            connection.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str) -> int:
+        # 计数器存成文本形式的 bytes，和 InMemoryKeyValueStore 一样；整个读改写在一个写事务里
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row is not None else 1
+            connection.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, str(value).encode(), float("inf")))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return value
+
+
+class SharedCache:
+    """
+    Cache for pydantic models kept in a `KeyValueStore` shared by all workers.
+
+    Every key has a generation counter next to it. Entries are stored together with the
+    generation they were loaded under, and an entry whose generation is behind the
+    counter is treated as a miss, so invalidation is safe even without atomic
+    compare-and-set in the store.
+    """
+
+    def __init__(self, store: KeyValueStore, model: type[BaseModel], ttl: float = 60.0, prefix: str = "cache"):
+        self.store = store
+        self.model = model
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+
+    def _keys(self, key) -> tuple[str, str]:
+        return f"{self.prefix}:{key}:gen", f"{self.prefix}:{key}"
+
+    def get(self, key):
+        generation, entry = self.store.get_many(list(self._keys(key)))
+        if entry is not None:
+            data = json.loads(entry)
+            if data["gen"] == int(generation or 0):
+                self.hits += 1
+                return self.model.model_validate(data["value"])
+        self.misses += 1
+        return None
+
+    def reserve(self, key) -> int:
+        generation, = self.store.get_many([self._keys(key)[0]])
+        return int(generation or 0)
+
+    def fill(self, key, value: BaseModel | None, token: int) -> None:
+        if value is None:
+            return
+        entry = {"gen": token, "value": value.model_dump(mode="json")}
+        self.store.set(self._keys(key)[1], json.dumps(entry).encode(), self.ttl)
+
+    def invalidate(self, key) -> None:
+        generation_key, entry_key = self._keys(key)
+        self.store.incr(generation_key)
+        self.store.delete(entry_key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "shared",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": getattr(self.store, "evictions", None),
+        }
@@ -0,0 +1,232 @@
+"""
+Response compression middleware: gzip, plus brotli and zstd when their packages are installed.
+
+The coding is negotiated from Accept-Encoding (q-values first, then our own preference order).
+Responses smaller than `minimum_size`, already encoded, or of a content type that doesn't
+compress (images, archives...) are passed through untouched. Streaming responses are
+compressed chunk by chunk and every chunk is flushed, so a client reading NDJSON line by line
+doesn't wait for the compressor's buffer to fill.
+"""
+import functools
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+
+# 已经压缩过的格式，再压一遍只浪费 CPU；按前缀匹配
+EXCLUDED_CONTENT_TYPES = (
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "video/", "audio/", "font/woff",
+    "application/zip", "application/gzip", "application/x-gzip", "application/zstd", "application/octet-stream",
+)
+
+
+class GzipEncoder:
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int = BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encoders() -> dict[str, type]:
+    """Codings this process can produce, in order of preference."""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def negotiate(accept_encoding: str, supported: list[str]) -> str | None:
+    """Pick the coding with the highest q-value; ties go to the earlier entry of `supported`."""
+    weights, wildcard = {}, None
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == "*":
+            wildcard = q
+        elif coding:
+            weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in supported:
+        q = weights.get(coding, wildcard or 0.0)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(
+            self,
+            app: ASGIApp,
+            minimum_size: int = MINIMUM_SIZE,
+            levels: dict[str, int] | None = None,
+            encodings: list[str] | None = None,
+            excluded_content_types: tuple[str, ...] = EXCLUDED_CONTENT_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = levels or {}
+        encoders = available_encoders()
+        # encodings 可以限制或调整顺序，但不能包含没装的压缩库
+        self.encoders = {name: encoders[name] for name in (encodings or encoders) if name in encoders}
+        self.excluded_content_types = excluded_content_types
+        # 客户端的 Accept-Encoding 就那么几种写法，解析结果缓存起来
+        supported = list(self.encoders)
+        self.negotiate = functools.lru_cache(maxsize=256)(lambda header: negotiate(header, supported))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value for name, value in scope["headers"] if name == b"accept-encoding"), b"")
+        coding = self.negotiate(accept_encoding.decode("latin-1"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        await CompressionResponder(self, coding)(self.app, scope, receive, send)
+
+    def encoder(self, coding: str):
+        level = self.levels.get(coding)
+        return self.encoders[coding]() if level is None else self.encoders[coding](level)
+
+    def should_compress(self, headers: Headers, status: int) -> bool:
+        if status < 200 or status in (204, 206, 304):
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type.startswith(self.excluded_content_types):
+            return False
+        content_length = headers.get("content-length")
+        return content_length is None or int(content_length) >= self.minimum_size
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, coding: str):
+        self.middleware = middleware
+        self.coding = coding
+        self.start_message: Message | None = None
+        self.encoder = None
+        self.send: Send | None = None
+
+    async def __call__(self, app: ASGIApp, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # 先留着响应头，等看到第一段 body 再决定压不压
+            self.start_message = message
+            return
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            await self.start(start, message)
+            return
+        if self.encoder is None or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        await self.send_body(message.get("body", b""), message.get("more_body", False))
+
+    async def start(self, start: Message, message: Message) -> None:
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if (
+                message["type"] != "http.response.body"
+                or (not more_body and len(body) < self.middleware.minimum_size)
+                or not self.middleware.should_compress(Headers(raw=start["headers"]), start["status"])
+        ):
+            await self.send(start)
+            await self.send(message)
+            return
+
+        self.encoder = self.middleware.encoder(self.coding)
+        headers = MutableHeaders(raw=list(start["headers"]))
+        headers["content-encoding"] = self.coding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # 压缩后的字节和原来不同，强 ETag 要降成弱 ETag
+            headers["etag"] = f"W/{etag}"
+        if more_body:
+            # 流式响应：长度未知，分块发送
+            del headers["content-length"]
+            await self.send({**start, "headers": headers.raw})
+            await self.send_body(body, more_body)
+        else:
+            compressed = self.encoder.compress(body) + self.encoder.finish()
+            headers["content-length"] = str(len(compressed))
+            await self.send({**start, "headers": headers.raw})
+            await self.send({"type": "http.response.body", "body": compressed})
+
+    async def send_body(self, body: bytes, more_body: bool) -> None:
+        if more_body and not body:
+            return
+        if more_body:
+            # 每段都 flush，客户端能马上解出这一段，不用等压缩器缓冲区攒满
+            data = self.encoder.compress(body) + self.encoder.flush()
+        else:
+            data = self.encoder.compress(body) + self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
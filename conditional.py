@@ -0,0 +1,78 @@
+"""
+Helpers for conditional requests: ETag / Last-Modified validators and 304 / 412 answers.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+
+def content_etag(data) -> str:
+    """Strong ETag from the JSON form of `data`, for payloads that have no version of their own."""
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    """
+    Whether `etag` is in an If-None-Match / If-Match header value.
+
+    If-None-Match uses the weak comparison (`W/"x"` matches `"x"`); If-Match must pass
+    `weak=False`, which never matches a weak tag.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag.removeprefix("W/"):
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # 有 If-None-Match 时忽略 If-Modified-Since（RFC 9110 13.1.3）
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        # HTTP 日期只精确到秒
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: datetime | None = None) -> dict[str, str]:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def set_validators(response: Response, etag: str, last_modified: datetime | None = None) -> None:
+    response.headers.update(validator_headers(etag, last_modified))
+
+
+def not_modified(etag: str, last_modified: datetime | None = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
@@ -0,0 +1,230 @@
+"""
+A small durable job queue on SQLite, plus the worker loop that drains it.
+
+Jobs are claimed with a lease: a worker that dies mid-job stops renewing its leases and
+another worker picks the jobs up once they expire, so a job runs at least once. Handlers
+should therefore be idempotent.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS job (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        dedup_key TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        lease_until REAL,
+        worker TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        last_error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS job_status_run_at ON job (status, run_at)",
+    "CREATE INDEX IF NOT EXISTS job_status_finished_at ON job (status, finished_at)",
+    # 同一个 dedup_key 同时只能有一个排队或执行中的任务
+    """CREATE UNIQUE INDEX IF NOT EXISTS job_dedup_key ON job (dedup_key)
+        WHERE dedup_key IS NOT NULL AND status IN ('queued', 'running')""",
+]
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+class JobQueue:
+    def __init__(
+            self,
+            path: str,
+            lease_seconds: float = 30.0,
+            backoff_base: float = 1.0,
+            backoff_max: float = 300.0,
+            max_attempts: int = 5,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with self._connection() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        # 每个线程一个连接；isolation_level=None 是自动提交，每条语句各自是一个事务
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, kind: str, payload: dict, dedup_key: str | None = None, delay: float = 0.0,
+                max_attempts: int | None = None) -> int | None:
+        """Returns the job id, or `None` when a job with the same `dedup_key` is already pending."""
+        now = time.time()
+        cursor = self._connection().execute(
+            """INSERT OR IGNORE INTO job (kind, payload, dedup_key, max_attempts, run_at, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (kind, json.dumps(payload), dedup_key, max_attempts or self.max_attempts, now + delay, now),
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def claim(self, worker: str, limit: int = 1) -> list[Job]:
+        """
+        Lease up to `limit` due jobs, including ones whose previous worker let the lease run out.
+
+        A job whose lease ran out on its last attempt is marked failed instead: a job that
+        kills its worker would otherwise be leased again forever.
+        """
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                """UPDATE job SET status = 'failed', finished_at = :now, lease_until = NULL,
+                       last_error = 'lease expired on the last attempt'
+                   WHERE status = 'running' AND lease_until < :now AND attempts >= max_attempts""",
+                {"now": now},
+            )
+            rows = connection.execute(
+                """UPDATE job SET status = 'running', attempts = attempts + 1, worker = :worker,
+                       lease_until = :lease_until, started_at = :now
+                   WHERE id IN (
+                       SELECT id FROM job WHERE status = 'queued' AND run_at <= :now
+                       UNION ALL
+                       SELECT id FROM job WHERE status = 'running' AND lease_until < :now
+                       LIMIT :limit
+                   )
+                   RETURNING id, kind, payload, attempts, max_attempts""",
+                {"worker": worker, "lease_until": now + self.lease_seconds, "now": now, "limit": limit},
+            ).fetchall()
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return [Job(id, kind, json.loads(payload), attempts, max_attempts)
+                for id, kind, payload, attempts, max_attempts in rows]
+
+    def renew(self, worker: str, job_ids: list[int]) -> None:
+        if job_ids:
+            self._connection().execute(
+                f"""UPDATE job SET lease_until = ? WHERE worker = ? AND status = 'running'
+                    AND id IN ({','.join('?' * len(job_ids))})""",
+                (time.time() + self.lease_seconds, worker, *job_ids),
+            )
+
+    def complete(self, worker: str, job: Job) -> bool:
+        # 只认当前持有租约的 worker：租约过期被别人领走之后，旧 worker 的结果不算
+        cursor = self._connection().execute(
+            "UPDATE job SET status = 'done', finished_at = ?, lease_until = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job.id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, worker: str, job: Job, error: str) -> None:
+        now = time.time()
+        if job.attempts >= job.max_attempts:
+            status, run_at = "failed", now
+        else:
+            # 指数退避，加一点随机，避免一批失败的任务同时重试
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (job.attempts - 1))
+            status, run_at = "queued", now + delay * random.uniform(0.5, 1.0)
+        self._connection().execute(
+            """UPDATE job SET status = ?, run_at = ?, lease_until = NULL, last_error = ?,
+                   finished_at = CASE WHEN ? = 'failed' THEN ? END
+               WHERE id = ? AND worker = ? AND status = 'running'""",
+            (status, run_at, error, status, now, job.id, worker),
+        )
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs older than `older_than` seconds."""
+        cursor = self._connection().execute(
+            "DELETE FROM job WHERE status IN ('done', 'failed') AND finished_at < ?", (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def metrics(self, latency_sample: int = 1000) -> dict:
+        connection = self._connection()
+        depth = {status: 0 for status in ("queued", "running", "done", "failed")}
+        depth.update(connection.execute("SELECT status, count(*) FROM job GROUP BY status").fetchall())
+        oldest, = connection.execute("SELECT min(created_at) FROM job WHERE status = 'queued'").fetchone()
+        # 从入队到完成的耗时，取最近完成的一批任务
+        latencies = sorted(row[0] for row in connection.execute(
+            "SELECT finished_at - created_at FROM job WHERE status = 'done' ORDER BY finished_at DESC LIMIT ?",
+            (latency_sample,),
+        ))
+        return {
+            "depth": depth,
+            "oldest_queued_seconds": time.time() - oldest if oldest is not None else 0.0,
+            "latency_seconds": {
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p99": latencies[int(len(latencies) * 0.99)] if latencies else None,
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+
+def run_worker(
+        queue: JobQueue,
+        handlers: dict[str, Callable[..., Any]],
+        concurrency: int = 4,
+        poll_interval: float = 0.5,
+        stop: threading.Event | None = None,
+        worker: str | None = None,
+) -> None:
+    """
+    Claim jobs and run them on `concurrency` threads until `stop` is set (or forever).
+
+    Leases of running jobs are renewed from the claiming loop; after `stop` the jobs already
+    claimed are finished before returning.
+    """
+    stop = stop or threading.Event()
+    worker = worker or f"{os.uname().nodename}:{os.getpid()}"
+    in_flight: dict[int, Any] = {}
+    last_renew = time.monotonic()
+
+    def execute(job: Job):
+        try:
+            handlers[job.kind](**job.payload)
+        except Exception as exc:
+            queue.fail(worker, job, f"{type(exc).__name__}: {exc}")
+        else:
+            queue.complete(worker, job)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job") as executor:
+        while not stop.is_set():
+            for job_id in [job_id for job_id, future in in_flight.items() if future.done()]:
+                del in_flight[job_id]
+            if time.monotonic() - last_renew > queue.lease_seconds / 3:
+                queue.renew(worker, list(in_flight))
+                last_renew = time.monotonic()
+            free = concurrency - len(in_flight)
+            if not free:
+                wait(in_flight.values(), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                continue
+            jobs = queue.claim(worker, free)
+            for job in jobs:
+                in_flight[job.id] = executor.submit(execute, job)
+            if not jobs:
+                stop.wait(poll_interval)
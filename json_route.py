@@ -0,0 +1,94 @@
+"""
+JSON responses serialized straight to bytes by pydantic-core.
+
+FastAPI's default path turns a return value into plain dicts and lists first
+(`jsonable_encoder`, or `serialize` in python mode for a `response_model`) and then runs
+`json.dumps` over them. `PydanticJSONRoute` validates the return value against the
+response model as usual but serializes it with `TypeAdapter.dump_json`, skipping the
+intermediate objects. Use it per router:
+
+    router = APIRouter(route_class=PydanticJSONRoute)
+
+or for a whole app with `app.router.route_class = PydanticJSONRoute` before adding routes.
+"""
+import functools
+import inspect
+from typing import Any
+
+import pydantic_core
+from fastapi import Response
+from fastapi.exceptions import ResponseValidationError
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter, ValidationError
+
+# 加到处理函数签名里的参数名，FastAPI 会把子响应（处理函数设置的状态码和响应头）传进来
+_RESPONSE_PARAM = "_json_route_response"
+
+
+class PydanticJSONResponse(JSONResponse):
+    """A `JSONResponse` rendered by pydantic-core; also handles datetimes, UUIDs, models, sets..."""
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+class PydanticJSONRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        self._adapter: TypeAdapter | None = None
+        super().__init__(path, self._wrap(endpoint), **kwargs)
+        # response_model 可能是 FastAPI 从返回值注解推断出来的，super().__init__ 之后才确定
+        self._adapter = TypeAdapter(self.response_model if self.response_model is not None else Any)
+        self._dump_options = {
+            "include": self.response_model_include,
+            "exclude": self.response_model_exclude,
+            "by_alias": self.response_model_by_alias,
+            "exclude_unset": self.response_model_exclude_unset,
+            "exclude_defaults": self.response_model_exclude_defaults,
+            "exclude_none": self.response_model_exclude_none,
+        }
+
+    def render(self, content: Any, sub_response: Response) -> Response:
+        if isinstance(content, Response):
+            return content
+        if self.response_model is not None:
+            # 和 FastAPI 一样先按 response_model 校验：多出来的字段（比如密码）不会被序列化
+            try:
+                content = self._adapter.validate_python(content, from_attributes=True)
+            except ValidationError as exc:
+                raise ResponseValidationError(errors=exc.errors(include_url=False), body=content)
+        body = self._adapter.dump_json(content, **self._dump_options)
+        status_code = sub_response.status_code or self.status_code or 200
+        response = Response(body, status_code=status_code, media_type="application/json")
+        for key, value in sub_response.headers.raw:
+            if key != b"content-length":
+                response.raw_headers.append((key, value))
+        return response
+
+    def _wrap(self, endpoint):
+        # include_router 会用已经包装过的 endpoint 重新建路由，先拆掉旧的包装
+        endpoint = getattr(endpoint, "_json_route_endpoint", endpoint)
+        signature = inspect.signature(endpoint)
+        parameters = list(signature.parameters.values())
+        # FastAPI 只会填一个 Response 参数：处理函数自己声明了就共用它，否则加一个
+        name = next((parameter.name for parameter in parameters
+                     if inspect.isclass(parameter.annotation) and issubclass(parameter.annotation, Response)), None)
+        own_param = name is None
+        if own_param:
+            name = _RESPONSE_PARAM
+            parameters.append(inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, annotation=Response))
+
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                sub_response = kwargs.pop(name) if own_param else kwargs[name]
+                return self.render(await endpoint(*args, **kwargs), sub_response)
+        else:
+            # 普通 def 在线程池里执行，序列化也一起在线程池里完成
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kwargs):
+                sub_response = kwargs.pop(name) if own_param else kwargs[name]
+                return self.render(endpoint(*args, **kwargs), sub_response)
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        wrapper._json_route_endpoint = endpoint
+        return wrapper
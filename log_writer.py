@@ -0,0 +1,183 @@
+"""
+A long-lived, batched log file writer.
+
+`write()` only puts the message on a queue. One background thread collects messages and
+appends them in one `os.write` per batch, once `flush_bytes` are buffered or `flush_interval`
+seconds after the first buffered message, whichever comes first; `flush()` writes the batch
+right away and waits for it. Appends go through an `O_APPEND` descriptor, so batches from
+several worker processes don't overwrite each other.
+
+`QueueLogHandler` does the same for the `logging` module: records are queued and the real
+handlers (a stdout `StreamHandler`, say) run on a background thread.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+_STOP = object()
+
+
+class BufferedLogWriter:
+    def __init__(
+            self,
+            path: str,
+            flush_bytes: int = 64 * 1024,
+            flush_interval: float = 1.0,
+            max_bytes: int = 10 * 1024 * 1024,
+            backup_count: int = 5,
+    ):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        # max_bytes=0 关闭按大小轮转
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.messages = self.flushes = self.errors = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._fd: int | None = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, message: str) -> None:
+        if self._thread is None:
+            self.start()
+        self._queue.put(message)
+
+    def flush(self) -> None:
+        """Block until everything written so far is in the file; `OSError` if a write failed meanwhile."""
+        errors, flushed = self.errors, threading.Event()
+        if self._thread is None:
+            self.start()
+        self._queue.put(flushed)
+        flushed.wait()
+        if self.errors != errors:
+            raise OSError(f"could not write to {self.path}")
+
+    def close(self, timeout: float | None = None) -> None:
+        """Flush everything queued so far and stop the thread; a later `write` starts it again."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        buffer, size, deadline = [], 0, None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                if buffer:
+                    self._flush(buffer)
+                self._close_file()
+                return
+            if isinstance(item, threading.Event):
+                # flush() 在等：先写掉缓冲再叫醒它
+                if buffer:
+                    self._flush(buffer)
+                    buffer, size, deadline = [], 0, None
+                item.set()
+                continue
+            if item is not None:
+                data = item.encode()
+                buffer.append(data)
+                size += len(data)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if size >= self.flush_bytes or (deadline is not None and time.monotonic() >= deadline):
+                self._flush(buffer)
+                buffer, size, deadline = [], 0, None
+
+    def _flush(self, buffer: list[bytes]) -> None:
+        data = b"".join(buffer)
+        try:
+            fd = self._open()
+            if self.max_bytes and 0 < os.fstat(fd).st_size and os.fstat(fd).st_size + len(data) > self.max_bytes:
+                self._rotate()
+                fd = self._open()
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except OSError:
+            # 磁盘满之类的错误不能让线程退出，丢掉这一批继续
+            self.errors += 1
+            self._close_file()
+            return
+        self.messages += len(buffer)
+        self.flushes += 1
+
+    def _open(self) -> int:
+        if self._fd is not None:
+            try:
+                same_file = os.stat(self.path).st_ino == os.fstat(self._fd).st_ino
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                return self._fd
+            # 别的进程已经把文件轮转走了，重新打开新文件
+            self._close_file()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _rotate(self) -> None:
+        self._close_file()
+        if self.backup_count <= 0:
+            os.truncate(self.path, 0)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _close_file(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def stats(self) -> dict:
+        return {"messages": self.messages, "flushes": self.flushes, "errors": self.errors}
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Queues records for `handlers`, which a background thread runs. Like `BufferedLogWriter`
+    the thread starts with the first record; `close()` (also called by `logging.shutdown` at
+    exit) hands over everything queued so far and stops it.
+    """
+
+    def __init__(self, *handlers: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self._running = False
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if not self._running:
+                self.listener.start()
+                self._running = True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self._running:
+            self.start()
+        super().emit(record)
+
+    def close(self) -> None:
+        with self._start_lock:
+            if self._running:
+                self.listener.stop()
+                self._running = False
+        super().close()
@@ -1,18 +1,67 @@
-from datetime import datetime, time, timedelta
+import asyncio
+import logging
+import os
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, time, timedelta, timezone
 from enum import Enum
 from typing import Annotated, Literal, Any
-from uuid import UUID
+from uuid import UUID, uuid4
 
+import anyio
 from fastapi import FastAPI, Query, Path, Body, Cookie, Header, status, Form, UploadFile, File, HTTPException, Request, \
-    Depends
-from fastapi.encoders import jsonable_encoder
+    Depends, Response
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, PlainTextResponse
-from pydantic import BaseModel, Field, HttpUrl, EmailStr
+from pydantic import BaseModel, Field, HttpUrl, EmailStr, TypeAdapter
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
 
-app = FastAPI()
+from compression import CompressionMiddleware
+from ingest import BodySizeLimitMiddleware, ingest_ndjson, ndjson_openapi
+from json_route import PydanticJSONRoute
+from log_writer import QueueLogHandler
+from store import Record, default_store
+from token_store import TokenHeader, default_token_store
+from uploads import (AnalysisPool, ChunkedUploadStore, FileSink, SinkFactory, multipart_openapi,
+                     stream_upload)
+from validation_errors import ErrorShapeSampler, render_validation_error
+
+# 上传的文件按 sha256 存到 UPLOAD_DIR；请求体边收边处理，不会整个读进内存
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'uploads')
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 2 * 1024 ** 3))
+# 除文件内容外，表单字段和 multipart 分隔符允许占用的字节数
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', 100))
+# 图片解析、缩略图这些 CPU 活放到进程池里，最多同时占用这么多个核
+upload_pool = AnalysisPool(int(os.getenv('UPLOAD_WORKERS', os.cpu_count() or 1)))
+chunked_uploads = ChunkedUploadStore(os.path.join(UPLOAD_DIR, '.partial'))
+# JSON 列表请求体的上限：请求体超过 MAX_LIST_BODY_SIZE 直接 413，不解析；元素超过 MAX_LIST_ITEMS 个 422
+MAX_LIST_ITEMS = int(os.getenv('MAX_LIST_ITEMS', 1000))
+MAX_LIST_BODY_SIZE = int(os.getenv('MAX_LIST_BODY_SIZE', 1024 * 1024))
+# 更大的列表用 NDJSON 接口传，每 INGEST_BATCH_SIZE 行校验、处理一批
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    upload_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+# 返回值由 pydantic-core 直接序列化成 JSON 字节，不再先转成 dict 再 json.dumps
+app.router.route_class = PydanticJSONRoute
+# 超过阈值的响应按 Accept-Encoding 压缩（gzip，装了对应的包时还有 br、zstd）
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(BodySizeLimitMiddleware,
+                   limits={'/offers/': MAX_LIST_BODY_SIZE, '/images/multiple/': MAX_LIST_BODY_SIZE})
+
+# 收到的图片写到 stdout：先进队列，由后台线程输出，不在事件循环里做阻塞的 I/O
+images_logger = logging.getLogger('images')
+images_logger.setLevel(logging.INFO)
+images_logger.propagate = False
+images_logger.addHandler(QueueLogHandler(logging.StreamHandler(sys.stdout)))
 
 
 class Image(BaseModel):
@@ -48,7 +97,7 @@ class Offer(BaseModel):
     name: str
     description: str | None = None
     price: float
-    items: list[Item]
+    items: list[Item] = Field(max_length=MAX_LIST_ITEMS)
 
 
 class User(BaseModel):
@@ -68,9 +117,25 @@ class FilterParams(BaseModel):
     offset: int = Field(0, ge=0)
     order_by: Literal['created_at', 'updated_at'] = 'created_at'
     tags: list[str] = []
+    # 'all'：同时带有 tags 里的所有标签；'any'：带有其中任意一个
+    match: Literal['all', 'any'] = 'all'
+    # 上一页响应头里的 X-Next-Cursor；和 offset 不同，翻得再深也不会变慢
+    cursor: str | None = None
 
 
-fake_items_db = [{"item_name": "Foo"}, {"item_name": "Bar"}, {"item_name": "Baz"}]
+# 以前是模块级的 dict/list，每个 worker 一份、重启就丢；现在都放进 default_store（设了 STORE_PATH 时各 worker 共用）
+# add() 不覆盖已有的记录，几个 worker 同时启动也只会写入一次
+for name in ['Foo', 'Bar', 'Baz']:
+    default_store.add('item_names', name.lower(), {'item_name': name})
+
+
+def stored_item(record: Record) -> dict:
+    return {
+        'id': record.key,
+        **record.value,
+        'created_at': datetime.fromtimestamp(record.created_at, timezone.utc),
+        'updated_at': datetime.fromtimestamp(record.updated_at, timezone.utc),
+    }
 
 
 @app.get('/')
@@ -81,8 +146,22 @@ async def root():
 # 查询参数，默认值
 # 参数声明额外的信息和校验
 @app.get('/items/', tags=['items'])
-async def read_items(filter_query: Annotated[FilterParams, Query()]):
-    return filter_query
+def read_items(filter_query: Annotated[FilterParams, Query()], response: Response):
+    """
+    Items created with `POST /items/`, oldest first by `order_by`, only those with all (or any) of `tags`.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next page.
+    """
+    if filter_query.cursor and filter_query.offset:
+        raise HTTPException(status_code=400, detail='Use either offset or cursor, not both')
+    try:
+        page = default_store.page('items', filter_query.limit, filter_query.offset, filter_query.order_by,
+                                  filter_query.tags, filter_query.match, after=filter_query.cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if page.next_cursor:
+        response.headers['X-Next-Cursor'] = page.next_cursor
+    return [stored_item(record) for record in page.records]
 
 
 # 可选参数
@@ -113,7 +192,9 @@ def create_item(item: Item):
     - **tax**: if the item doesn't have tax, you can omit this
     - **tags**: a set of unique tag strings for this item
     """
-    item_dict = item.model_dump()
+    item_id = uuid4().hex
+    default_store.put('items', item_id, item.model_dump(mode='json'), item.tags)
+    item_dict = {'id': item_id, **item.model_dump()}
     if item.tax is not None:
         price_with_tax = item.price + item.tax
         item_dict.update({'price_with_tax': price_with_tax})
@@ -177,13 +258,32 @@ async def create_offer(offer: Offer):
     return offer
 
 
+async def log_images(images: list[Image]):
+    # 一批图片一条日志
+    if images_logger.isEnabledFor(logging.INFO):
+        images_logger.info('\n'.join(f'{image.name} {image.url}' for image in images))
+
+
 @app.post('/images/multiple/')
-async def create_multiple_images(images: list[Image]):
-    for image in images:
-        print(image.name, image.url)
+async def create_multiple_images(images: Annotated[list[Image], Body(max_length=MAX_LIST_ITEMS)]):
+    await log_images(images)
     return images
 
 
+image_adapter = TypeAdapter(Image)
+
+
+@app.post('/images/multiple/ndjson', openapi_extra=ndjson_openapi(Image))
+async def ingest_images(request: Request):
+    """
+    Send any number of images as NDJSON, one `Image` per line.
+
+    Lines are validated and logged `INGEST_BATCH_SIZE` at a time while the body is still
+    arriving; invalid lines are skipped and reported by line number.
+    """
+    return await ingest_ndjson(request, image_adapter, log_images, batch_size=INGEST_BATCH_SIZE)
+
+
 @app.post('/index-weights/')
 async def create_index_weights(weights: dict[int, float]):
     return weights
@@ -306,19 +406,20 @@ class PlaneItem(BaseItem):
     size: int
 
 
-items4 = {
-    "item1": {"description": "All my friends drive a low rider", "type": "car"},
-    "item2": {
-        "description": "Music is my aeroplane, it's my aeroplane",
-        "type": "plane",
-        "size": 5,
-    },
-}
+default_store.add('typed_items', 'item1', {"description": "All my friends drive a low rider", "type": "car"})
+default_store.add('typed_items', 'item2', {
+    "description": "Music is my aeroplane, it's my aeroplane",
+    "type": "plane",
+    "size": 5,
+})
 
 
 @app.get('/item4/{item_id}', response_model=CarItem | PlaneItem)
-async def read_item4(item_id: str):
-    return items4[item_id]
+def read_item4(item_id: str):
+    record = default_store.get('typed_items', item_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail='Item not found')
+    return record.value
 
 
 @app.post('/item5', status_code=status.HTTP_201_CREATED)
@@ -337,11 +438,20 @@ async def login(data: Annotated[FormData, Form()]):
     return {'username': data.username}
 
 
-@app.post('/files/')
-async def create_file(file: Annotated[bytes, File(description='A file read as bytes')]):
-    if not file:
+def get_upload_sink_factory() -> SinkFactory:
+    return lambda filename, content_type: FileSink(UPLOAD_DIR)
+
+
+UploadSinkDep = Annotated[SinkFactory, Depends(get_upload_sink_factory)]
+
+
+@app.post('/files/', openapi_extra=multipart_openapi(['file']))
+async def create_file(request: Request, sink_factory: UploadSinkDep):
+    form = await stream_upload(request, sink_factory, MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD)
+    file = form.files.get('file', [None])[0]
+    if not file or not file.size:
         return {'message': 'No file sent'}
-    return {'file_size': len(file)}
+    return {'file_size': file.size, 'sha256': file.sha256}
 
 
 @app.post('/uploadfile/')
@@ -351,24 +461,90 @@ async def create_upload_file(file: Annotated[UploadFile, File(description='A fil
     return {'filename': file.filename, 'content_type': file.content_type}
 
 
-@app.post('/files2/')
-async def create_file(file: Annotated[bytes, File()], fileb: Annotated[UploadFile, File()],
-                      token: Annotated[str, Form()]):
+async def analyze_upload(filename: str, content_type: str | None, size: int, sha256: str, location: str):
+    result = {'filename': filename, 'content_type': content_type, 'size': size, 'sha256': sha256}
+    try:
+        result.update(await upload_pool.analyze(location, os.path.join(UPLOAD_DIR, 'thumbnails')))
+    except Exception as exc:
+        # 一个文件处理失败不影响同一批里的其他文件
+        result['error'] = f'{type(exc).__name__}: {exc}'
+    return result
+
+
+@app.post('/uploadfiles/', openapi_extra=multipart_openapi(['files']))
+async def create_upload_files(request: Request, sink_factory: UploadSinkDep):
+    """
+    Upload several files at once (repeat the `files` field).
+
+    Each file is streamed to storage as it arrives; image metadata and thumbnails are then
+    worked out for all of them in parallel in the upload process pool.
+    """
+    max_body_size = MAX_BATCH_FILES * MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD
+    form = await stream_upload(request, sink_factory, MAX_UPLOAD_SIZE, max_body_size)
+    files = form.files.get('files', [])
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f'At most {MAX_BATCH_FILES} files per request')
+    results = await asyncio.gather(*(
+        analyze_upload(file.filename, file.content_type, file.size, file.sha256, file.location) for file in files
+    ))
+    return {'files': results}
+
+
+class ChunkedUploadCreate(BaseModel):
+    filename: str
+    size: int = Field(ge=0)
+    content_type: str | None = None
+
+
+# 可续传的分块上传：先 POST 拿到 upload_id，再按 Content-Range 顺序 PUT 各块，断了用 GET 查 offset 接着传
+@app.post('/uploads/', status_code=201)
+def create_chunked_upload(upload: ChunkedUploadCreate):
+    if upload.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail='Upload too large')
+    return chunked_uploads.status(chunked_uploads.create(upload.filename, upload.size, upload.content_type))
+
+
+@app.get('/uploads/{upload_id}')
+def read_chunked_upload(upload_id: str):
+    return chunked_uploads.status(upload_id)
+
+
+@app.put('/uploads/{upload_id}')
+async def upload_chunk(upload_id: str, request: Request, content_range: Annotated[str, Header()]):
+    info = await chunked_uploads.append(upload_id, content_range, request)
+    if info['offset'] < info['size']:
+        return info
+    # 最后一块到了：整个文件的哈希也在进程池里算，按哈希存好之后再生成缩略图
+    data_path = os.path.join(chunked_uploads.directory, upload_id + '.part')
+    sha256 = (await upload_pool.analyze(data_path, digest=True))['sha256']
+    location = await anyio.to_thread.run_sync(chunked_uploads.complete, upload_id, sha256, UPLOAD_DIR)
+    result = await analyze_upload(info['filename'], info['content_type'], info['size'], sha256, location)
+    return {'upload_id': upload_id, 'offset': info['offset'], 'location': location, **result}
+
+
+@app.post('/files2/', openapi_extra=multipart_openapi(['file', 'fileb'], ['token']))
+async def create_file(request: Request, sink_factory: UploadSinkDep):
+    form = await stream_upload(request, sink_factory, MAX_UPLOAD_SIZE, 2 * MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD)
+    missing = [name for name in ('file', 'fileb') if name not in form.files]
+    missing += [name for name in ('token',) if name not in form.fields]
+    if missing:
+        raise HTTPException(status_code=422, detail=f'Missing form fields: {", ".join(missing)}')
     return {
-        'file_size': len(file),
-        'token': token,
-        'fileb_content_type': fileb.content_type
+        'file_size': form.files['file'][0].size,
+        'token': form.fields['token'],
+        'fileb_content_type': form.files['fileb'][0].content_type
     }
 
 
-items = {"foo": "The Foo Wrestlers"}
+default_store.add('item_titles', 'foo', 'The Foo Wrestlers')
 
 
 @app.get('/items6/{item.id}', tags=['items'])
-async def read_item(item_id: str):
-    if item_id not in items:
+def read_item(item_id: str):
+    record = default_store.get('item_titles', item_id)
+    if record is None:
         raise HTTPException(status_code=404, detail='Item not found', headers={'X-ERROR': 'There goes my error'})
-    return {'item': items[item_id]}
+    return {'item': record.value}
 
 
 class UnicornException(Exception):
@@ -393,15 +569,29 @@ async def read_unicorn(name: str):
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc):
-    return PlainTextResponse(str(exc.detail), status_code=exc.status_code)
+    return PlainTextResponse(str(exc.detail), status_code=exc.status_code, headers=exc.headers)
+
+
+# 422 响应里最多带这么多条错误；请求体不超过 VALIDATION_ECHO_MAX_BYTES 才原样返回
+VALIDATION_MAX_ERRORS = int(os.getenv('VALIDATION_MAX_ERRORS', 20))
+VALIDATION_ECHO_MAX_BYTES = int(os.getenv('VALIDATION_ECHO_MAX_BYTES', 2048))
+validation_error_sampler = ErrorShapeSampler(window=float(os.getenv('VALIDATION_LOG_WINDOW', 60)))
 
 
 @app.exception_handler(RequestValidationError)
-async def validation_exception_handler(request, exc: RequestValidationError):
-    return JSONResponse(
-        status_code=HTTP_422_UNPROCESSABLE_ENTITY,
-        content=jsonable_encoder({"detail": exc.errors(), "body": exc.body}),
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    errors = exc.errors()
+    route = request.scope.get('route')
+    validation_error_sampler.log(route.path_format if route else request.url.path, errors)
+    content_length = request.headers.get('content-length')
+    body = render_validation_error(
+        errors,
+        exc.body,
+        int(content_length) if content_length and content_length.isdigit() else None,
+        max_errors=VALIDATION_MAX_ERRORS,
+        max_echo_bytes=VALIDATION_ECHO_MAX_BYTES,
     )
+    return Response(body, status_code=HTTP_422_UNPROCESSABLE_ENTITY, media_type='application/json')
 
 
 @app.get("/items7/{item_id}", tags=['items'])
@@ -427,13 +617,11 @@ class Item(BaseModel):
     description: str | None = None
 
 
-fake_db = {}
-
-
 @app.put('/item7/{id}', tags=['items'])
 def update_item(id: str, item: Item):
-    json_compatiable_item_data = jsonable_encoder(item)
-    fake_db[id] = json_compatiable_item_data
+    # mode='json' 直接得到能存成 JSON 的 dict（datetime 变成字符串），不用再走 jsonable_encoder
+    json_compatiable_item_data = item.model_dump(mode='json')
+    default_store.put('timestamped_items', id, json_compatiable_item_data)
     return json_compatiable_item_data
 
 
@@ -461,11 +649,11 @@ class CommonQueryParams:
 
 
 @app.get('/items9', tags=['items'])
-async def read_items(commons: Annotated[CommonQueryParams, Depends()]):
+def read_items(commons: Annotated[CommonQueryParams, Depends()]):
     response = {}
     if commons.q:
         response.update({'q': commons.q})
-    items = fake_items_db[commons.skip: commons.skip + commons.limit]
+    items = [record.value for record in default_store.page('item_names', commons.limit, commons.skip).records]
     response.update({"items": items})
     return response
 
@@ -490,19 +678,14 @@ async def read_query(
     return {"q_or_cookie": query_or_default}
 
 
-async def verify_token(x_token: Annotated[str, Header()]):
-    if x_token != "fake-super-secret-token":
-        raise HTTPException(status_code=400, detail="X-Token header invalid")
-
+verify_token = TokenHeader('X-Token', default_token_store, detail='X-Token header invalid')
 
-async def verify_key(x_key: Annotated[str, Header()]):
-    if x_key != "fake-super-secret-key":
-        raise HTTPException(status_code=400, detail="X-Key header invalid")
-    return x_key
+verify_key = TokenHeader('X-Key', default_token_store, detail='X-Key header invalid')
 
 
 @app.get("/items11/", dependencies=[Depends(verify_token), Depends(verify_key)], tags=['items'])
 async def read_items():
     return [{"item": "Foo"}, {"item": "Bar"}]
+# 开发时单独跑这个应用；生产环境用 python serve.py，所有应用挂在一起、多 worker
 # if __name__ == '__main__':
 #     uvicorn.run(app, host='0.0.0.0', port=9000)
@@ -0,0 +1,153 @@
+"""
+Request metrics as pure ASGI middleware, exposed in the Prometheus text format.
+
+Requests are labelled by route template (`/users/{user_id}`), not by raw path, so the
+number of series stays bounded; requests that match no route share one `<unmatched>` label.
+Everything is updated from the event loop thread, so plain dicts and ints are enough. Each
+worker process keeps its own numbers; Prometheus scrapes and sums them per instance.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 秒；比 Prometheus 默认的桶多几个毫秒级的，接口大多在这个范围
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 方法名来自客户端，不认识的归到 OTHER，免得随便发个方法就多出一组时间序列
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class RouteStats:
+    __slots__ = ("buckets", "count", "duration_sum", "request_bytes", "response_bytes")
+
+    def __init__(self, bucket_count: int):
+        # 每个桶只记落在自己区间里的次数，输出时再累加成 Prometheus 要的累计值
+        self.buckets = [0] * (bucket_count + 1)
+        self.count = 0
+        self.duration_sum = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bucket_bounds = buckets
+        self.routes: dict[tuple[str, str], RouteStats] = {}
+        self.statuses: defaultdict[tuple[str, str, int], int] = defaultdict(int)
+        self.in_progress: defaultdict[str, int] = defaultdict(int)
+
+    def observe(self, method: str, route: str, status: int, duration: float, request_bytes: int,
+                response_bytes: int) -> None:
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[method, route] = RouteStats(len(self.bucket_bounds))
+        stats.buckets[bisect_left(self.bucket_bounds, duration)] += 1
+        stats.count += 1
+        stats.duration_sum += duration
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+        self.statuses[method, route, status] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests by route template and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.statuses.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{escape(route)}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Time from receiving the request to sending the last body chunk.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), stats in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{escape(route)}"'
+            cumulative = 0
+            for bound, count in zip((*self.bucket_bounds, "+Inf"), stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.duration_sum}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        for name, attribute, help_text in [
+            ("http_request_body_bytes_total", "request_bytes", "Request body bytes received."),
+            ("http_response_body_bytes_total", "response_bytes", "Response body bytes sent."),
+        ]:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), stats in sorted(self.routes.items()):
+                lines.append(f'{name}{{method="{method}",route="{escape(route)}"}} {getattr(stats, attribute)}')
+
+        lines += [
+            "# HELP http_requests_in_progress Requests currently being handled.",
+            "# TYPE http_requests_in_progress gauge",
+        ]
+        for method, count in sorted(self.in_progress.items()):
+            lines.append(f'http_requests_in_progress{{method="{method}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    async def endpoint(self, request: Request) -> Response:
+        return Response(self.render(), media_type=CONTENT_TYPE)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def route_template(scope: Scope, root_path: str) -> str:
+    # 路由匹配时 FastAPI 把 APIRoute 放进 scope["route"]；Mount 会把前缀加到 root_path 上
+    prefix = scope.get("root_path", "")[len(root_path):]
+    route = scope.get("route")
+    if route is not None:
+        return prefix + route.path_format
+    if prefix:
+        # 挂载的子应用（静态文件等）没有 route，按挂载点归成一个标签
+        return prefix + "/*"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry | None = None):
+        self.app = app
+        self.registry = registry or default_registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in METHODS else "OTHER"
+        root_path = scope.get("root_path", "")
+        status = 500
+        request_bytes = response_bytes = 0
+
+        async def receive_counted() -> Message:
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Message) -> None:
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        registry = self.registry
+        registry.in_progress[method] += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            registry.in_progress[method] -= 1
+            registry.observe(method, route_template(scope, root_path), status, time.perf_counter() - start,
+                             request_bytes, response_bytes)
+
+
+default_registry = MetricsRegistry()
@@ -0,0 +1,71 @@
+"""
+The project's HTTP middleware stack, every layer pure ASGI.
+
+`@app.middleware("http")` builds on Starlette's `BaseHTTPMiddleware`: each request runs the
+rest of the app in a separate task and pipes the response body through a memory stream, which
+costs time per request and decouples the app from the client's read speed. The layers here
+only wrap `send` (and `receive` for metrics), so body messages go straight through.
+"""
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, MetricsRegistry
+
+
+class ProcessTimeMiddleware:
+    """Adds the time until the response headers were sent, in seconds, as `X-Process-Time`."""
+
+    def __init__(self, app: ASGIApp, header_name: str = "X-Process-Time"):
+        self.app = app
+        self.header_name = header_name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+
+        async def send_with_time(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(self.header_name, str(time.perf_counter() - start))
+            await send(message)
+
+        await self.app(scope, receive, send_with_time)
+
+
+def middleware_stack(
+        cors_origins: list[str] | None = None,
+        *,
+        metrics_registry: MetricsRegistry | None = None,
+        process_time: bool = True,
+        compression: bool = True,
+) -> list[Middleware]:
+    """
+    The middleware list for `FastAPI(middleware=...)`, outermost first.
+
+    CORS is outermost so that every response, including ones produced by the layers below it,
+    gets the CORS headers a browser needs to read it, and preflight requests are answered
+    without going through the rest. Metrics come next and time everything below; the process
+    time header is stamped outside compression so it includes compressing the first chunk.
+    """
+    stack = []
+    if cors_origins:
+        stack.append(Middleware(
+            CORSMiddleware,
+            allow_origins=cors_origins,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        ))
+    if metrics_registry is not None:
+        stack.append(Middleware(MetricsMiddleware, registry=metrics_registry))
+    if process_time:
+        stack.append(Middleware(ProcessTimeMiddleware))
+    if compression:
+        stack.append(Middleware(CompressionMiddleware))
+    return stack
@@ -0,0 +1,196 @@
+"""
+Admission control: per-client rate limits and per-route concurrency caps.
+
+`RateLimiter` is a token bucket per key (client IP, user name, API token...). Requests over
+the limit get 429 with Retry-After. `ConcurrencyLimiter` caps how many requests of a route
+run at once and how many may wait for a slot; the rest get 503 with Retry-After right away
+instead of piling up in the thread pool. Both are FastAPI dependencies.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+import anyio
+from fastapi import HTTPException, Request, status
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: float
+    burst: int | None = None
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        """`"10/minute"`, `"5/second"`, or `"100/30"` for 100 per 30 seconds."""
+        limit, _, period = value.partition("/")
+        period = period.strip()
+        return cls(int(limit), PERIODS[period] if period in PERIODS else float(period))
+
+    @property
+    def interval(self) -> float:
+        """Seconds it takes to earn back one request."""
+        return self.period / self.limit
+
+    @property
+    def capacity(self) -> int:
+        return self.burst if self.burst is not None else self.limit
+
+
+class RateLimitStore(Protocol):
+    """
+    What `RateLimiter` needs from a store. To share limits between workers, implement it on
+    something all of them reach, e.g. Redis with the same arithmetic in a Lua script.
+    """
+
+    def hit(self, key: str, rate: Rate, cost: int = 1) -> float:
+        """Spend `cost` requests from `key`'s bucket: 0 if allowed, else seconds to wait before retrying."""
+        ...
+
+
+class InMemoryRateLimitStore:
+    """
+    Token buckets for this process only, kept as one timestamp per key (GCRA).
+
+    The bucket of a key is full again once its timestamp is in the past, so forgetting the
+    least recently used keys beyond `maxsize` only ever gives a client a full bucket.
+    """
+
+    def __init__(self, maxsize: int = 100_000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        # key -> 桶里一个令牌都不剩的时刻（理论上下一个请求的到达时间）
+        self._empty_at: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, rate: Rate, cost: int = 1) -> float:
+        now = self.clock()
+        with self._lock:
+            empty_at = max(self._empty_at.get(key, now), now) + cost * rate.interval
+            # 桶满时 empty_at 最多比现在晚 capacity 个间隔，再晚就是超了
+            wait = empty_at - now - rate.capacity * rate.interval
+            if wait > 0:
+                return wait
+            self._empty_at[key] = empty_at
+            self._empty_at.move_to_end(key)
+            while len(self._empty_at) > self.maxsize:
+                self._empty_at.popitem(last=False)
+            return 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._empty_at.clear()
+
+
+def client_ip(request: Request) -> str:
+    # 部署在反向代理后面时，要让服务器（uvicorn --forwarded-allow-ips）按 X-Forwarded-For 设置 client
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(
+            self,
+            rate: Rate,
+            store: RateLimitStore | None = None,
+            key_func: Callable[[Request], str] = client_ip,
+            prefix: str = "ratelimit",
+    ):
+        self.rate = rate
+        self.store = store or default_store
+        self.key_func = key_func
+        self.prefix = prefix
+        self.rejected = 0
+
+    def check(self, key: str, cost: int = 1) -> None:
+        wait = self.store.hit(f"{self.prefix}:{key}", self.rate, cost)
+        if wait > 0:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    async def __call__(self, request: Request) -> None:
+        self.check(self.key_func(request))
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` requests inside the route; up to `max_waiting` more wait at most
+    `wait_timeout` seconds for a slot, in arrival order. Everything beyond that is shed.
+    Counters live on the event loop, so this is per worker process.
+    """
+
+    def __init__(self, limit: int, max_waiting: int = 0, wait_timeout: float = 1.0, retry_after: int = 1):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.shed = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_waiting:
+            self._reject()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            with anyio.move_on_after(self.wait_timeout):
+                await asyncio.shield(waiter)
+        except BaseException:
+            # 客户端断开等情况下请求被取消
+            self._abandon(waiter)
+            raise
+        if waiter.done():
+            # release() 把名额直接交给了这个等待者，in_flight 已经算上了
+            return
+        self._abandon(waiter)
+        self._reject()
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # 名额已经交过来了但用不上，转给下一个
+            self.release()
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _reject(self):
+        self.shed += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, try again later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def __call__(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": len(self._waiters), "shed": self.shed}
+
+
+default_store = InMemoryRateLimitStore()
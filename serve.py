@@ -0,0 +1,131 @@
+"""
+Production entry point: every app in the project behind one ASGI app, served by uvicorn workers.
+
+    python serve.py --workers 4 --port 8000
+
+    /             main.py
+    /sql          sql.py
+    /auth         test.py (OAuth2 / JWT)
+    /background   background.py
+    /bigger       app/main.py
+
+Each worker is a separate process with its own event loop (uvloop) and HTTP parser
+(httptools), falling back to asyncio / h11 where they can't be imported. Workers share the
+listening socket, and run the apps' startup (table creation, migrations) one at a time. On
+SIGTERM or SIGINT they stop accepting connections, let in-flight requests finish for up to
+`--graceful-timeout` seconds, then run the apps' shutdown.
+With more than one worker, items go to a shared SQLite store (STORE_PATH=store.db) and the
+per-process hero cache is turned off (HERO_CACHE_BACKEND=none) unless HERO_CACHE_BACKEND=shared.
+Every option can also be set through the environment variable named in its help.
+"""
+import argparse
+import fcntl
+import importlib.util
+import logging
+import os
+import tempfile
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+logger = logging.getLogger("serve")
+
+STARTUP_LOCK = os.getenv("STARTUP_LOCK", os.path.join(tempfile.gettempdir(), "python-fastapi-demo.startup.lock"))
+
+
+@contextmanager
+def startup_lock(path: str):
+    # sql.py 先查表结构再 ALTER TABLE，几个 worker 同时做会撞上；启动阶段按文件锁排队
+    with open(path, "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def create_app() -> Starlette:
+    """Called in each worker; the supervisor process never imports the apps."""
+    import background
+    import main
+    import sql
+    import test as auth
+    from app.main import app as bigger_app
+
+    # "" 匹配所有路径，要放在最后
+    apps = {"/sql": sql.app, "/auth": auth.app, "/background": background.app, "/bigger": bigger_app, "": main.app}
+
+    @asynccontextmanager
+    async def lifespan(_):
+        # Mount 不会替子应用执行 lifespan：这里依次启动，关闭时倒序收尾
+        async with AsyncExitStack() as stack:
+            with startup_lock(STARTUP_LOCK):
+                for sub_app in apps.values():
+                    await stack.enter_async_context(sub_app.router.lifespan_context(sub_app))
+            yield
+
+    return Starlette(routes=[Mount(path, app=sub_app) for path, sub_app in apps.items()], lifespan=lifespan)
+
+
+def default_workers() -> int:
+    # 容器里 cpu_count() 是宿主机的核数，按实际能用的核算
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def implementation(preferred: str, fallback: str) -> str:
+    if importlib.util.find_spec(preferred) is not None:
+        return preferred
+    logger.warning("%s is not installed, using %s", preferred, fallback)
+    return fallback
+
+
+def optional_int(value: str | None) -> int | None:
+    return int(value) if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"), help="HOST")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)), help="PORT")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", default_workers())),
+                        help="WEB_CONCURRENCY, one per available core by default")
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", 2048)),
+                        help="BACKLOG, connections the kernel queues before they are accepted")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", 5)),
+                        help="KEEP_ALIVE, seconds an idle connection is kept open")
+    parser.add_argument("--limit-concurrency", type=optional_int, default=optional_int(os.getenv("LIMIT_CONCURRENCY")),
+                        help="LIMIT_CONCURRENCY, connections + tasks per worker before answering 503")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", 30)),
+                        help="GRACEFUL_TIMEOUT, seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--access-log", action="store_true", default=bool(os.getenv("ACCESS_LOG")),
+                        help="ACCESS_LOG, log every request (off by default, it costs throughput)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # 内存里的 store 每个 worker 各一份；多 worker 时默认共用一个 SQLite 文件
+        os.environ.setdefault("STORE_PATH", "store.db")
+        # 每个 worker 一份的 hero 缓存收不到别的 worker 的失效，PATCH 之后会读到旧数据
+        if os.environ.get("HERO_CACHE_BACKEND", "memory") == "memory":
+            os.environ["HERO_CACHE_BACKEND"] = "none"
+    uvicorn.run(
+        "serve:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=implementation("uvloop", "asyncio"),
+        http=implementation("httptools", "h11"),
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        limit_concurrency=args.limit_concurrency,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=args.access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,33 @@
+import base64
+import binascii
+import inspect
+import json
+import os
 from contextlib import asynccontextmanager
-from typing import Annotated
-
-from fastapi import Depends, FastAPI, HTTPException, Query
+from datetime import datetime, timezone
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Body, Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, delete, event, insert, make_url, text, tuple_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import declared_attr
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import LRUTTLCache, SharedCache, SQLiteKeyValueStore
+from compression import CompressionMiddleware
+from conditional import content_etag, etag_matches, is_not_modified, not_modified, set_validators
+from json_route import PydanticJSONRoute
+from ratelimit import ConcurrencyLimiter, Rate, RateLimiter
+
+
+def utcnow() -> datetime:
+    # SQLite 不存时区，统一存不带时区的 UTC 时间
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
 class HeroBase(SQLModel):
@@ -13,12 +38,25 @@ class HeroBase(SQLModel):
 class Hero(HeroBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     secret_name: str
+    # 每次 UPDATE 都加一（ORM 的 version_id_col），用来生成 ETag 和做 If-Match 乐观锁
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+    updated_at: datetime = Field(default_factory=utcnow, sa_column_kwargs={"onupdate": utcnow})
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.__table__.c.version}
 
 
 class HeroPublic(HeroBase):
     id: int
 
 
+class HeroRecord(HeroPublic):
+    """What the hero cache keeps: the public fields plus what the ETag and Last-Modified come from."""
+    version: int
+    updated_at: datetime
+
+
 class HeroCreate(HeroBase):
     secret_name: str
 
@@ -29,15 +67,180 @@ class HeroUpdate(HeroBase):
     secret_name: str | None = None
 
 
-sqlite_file_name = "database.db"
+class HeroBulkUpdate(HeroUpdate):
+    id: int
+
+
+class HeroBulkError(SQLModel):
+    index: int
+    id: int | None = None
+    detail: str
+
+
+class HeroBulkWriteResult(SQLModel):
+    heroes: list[HeroPublic] = []
+    errors: list[HeroBulkError] = []
+
+
+class HeroBulkDeleteResult(SQLModel):
+    deleted: list[int] = []
+    errors: list[HeroBulkError] = []
+
+
+sqlite_file_name = os.getenv("SQLITE_FILE", "database.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
+async_sqlite_url = f"sqlite+aiosqlite:///{sqlite_file_name}"
+
+# sync：处理函数是普通 def，在线程池里用阻塞的 Session；async：处理函数是 async def，用 aiosqlite
+db_mode = os.getenv("DB_MODE", "sync")
+
+# 每个新连接都会执行的 PRAGMA，都可以用环境变量覆盖
+sqlite_pragmas = {
+    # WAL 下读写互不阻塞，提交时只追加写 WAL 文件
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # WAL 模式下 NORMAL 只在 checkpoint 时 fsync，断电最多丢最后几个事务，不会损坏数据库
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    # 负数的单位是 KiB，即每个连接 64 MiB 页缓存
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024)),
+    # 拿不到写锁时最多等待的毫秒数，而不是直接报 database is locked
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),
+}
+sqlite_pool_size = int(os.getenv("SQLITE_POOL_SIZE", 10))
+# 同步的 Session 要等响应校验完、依赖退出后才归还连接，而这两步都要再排队拿线程池的线程；
+# 溢出连接有上限时，线程全卡在等连接上，就没有线程去归还连接了。SQLite 连接很便宜，默认不限溢出（-1）
+sqlite_max_overflow = int(os.getenv("SQLITE_MAX_OVERFLOW", -1))
 
 connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
 
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def sqlite_engine_options(url: str, pragmas: dict | None, pool_size: int, max_overflow: int, kwargs: dict,
+                          queue_pool=QueuePool) -> tuple[dict, dict]:
+    """
+    Pick the pragmas and pool arguments shared by the sync and async engine factories.
+
+    Fills the pool defaults into `kwargs` in place (`queue_pool` is the pool class for
+    file databases) and drops the pragmas that don't apply to in-memory databases.
+    """
+    pragmas = sqlite_pragmas if pragmas is None else pragmas
+    in_memory = make_url(url).database in (None, "", ":memory:")
+    if in_memory:
+        kwargs.setdefault("poolclass", StaticPool)
+        # 内存库没有日志文件也没有可 mmap 的文件
+        pragmas = {k: v for k, v in pragmas.items() if k not in ("journal_mode", "mmap_size")}
+    else:
+        kwargs.setdefault("poolclass", queue_pool)
+        kwargs.setdefault("pool_size", pool_size)
+        kwargs.setdefault("max_overflow", max_overflow)
+    return pragmas, kwargs
+
+
+def set_pragmas_on_connect(sync_engine, pragmas: dict):
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_sqlite_engine(
+        url: str = sqlite_url,
+        pragmas: dict | None = None,
+        pool_size: int = sqlite_pool_size,
+        max_overflow: int = sqlite_max_overflow,
+        **kwargs,
+):
+    """
+    Create a SQLite engine with the performance pragmas applied to every connection.
+
+    File databases get a `QueuePool` of `pool_size` connections; in-memory databases
+    get a `StaticPool`, because each new connection to `:memory:` would be a new,
+    empty database.
+    """
+    pragmas, kwargs = sqlite_engine_options(url, pragmas, pool_size, max_overflow, kwargs)
+    new_engine = create_engine(url, connect_args=connect_args, **kwargs)
+    set_pragmas_on_connect(new_engine, pragmas)
+    return new_engine
+
+
+def create_async_sqlite_engine(
+        url: str = async_sqlite_url,
+        pragmas: dict | None = None,
+        pool_size: int = sqlite_pool_size,
+        max_overflow: int = sqlite_max_overflow,
+        **kwargs,
+):
+    """Same as `create_sqlite_engine`, but for the aiosqlite driver."""
+    pragmas, kwargs = sqlite_engine_options(url, pragmas, pool_size, max_overflow, kwargs, AsyncAdaptedQueuePool)
+    new_engine = create_async_engine(url, connect_args=connect_args, **kwargs)
+    set_pragmas_on_connect(new_engine.sync_engine, pragmas)
+    return new_engine
+
+
+engine = create_sqlite_engine()
+# 只有 async 模式才建 aiosqlite 连接池
+async_engine = create_async_sqlite_engine() if db_mode == "async" else None
+
+
+def create_hero_cache(backend: str = os.getenv("HERO_CACHE_BACKEND", "memory")):
+    """
+    `memory` is a per-process LRU, `shared` a SQLite file all workers read and invalidate
+    (`HERO_CACHE_PATH`), `none` turns caching off.
+
+    `memory` is only safe with a single worker: a write invalidates the cache of the worker
+    that handled it, and the others keep serving the old hero until the TTL runs out.
+    """
+    ttl = float(os.getenv("HERO_CACHE_TTL", 60))
+    maxsize = int(os.getenv("HERO_CACHE_MAXSIZE", 1024))
+    if backend == "shared":
+        # 换成 Redis 之类的客户端时只要实现 KeyValueStore 的四个方法
+        store = SQLiteKeyValueStore(os.getenv("HERO_CACHE_PATH", "hero_cache.db"))
+        return SharedCache(store, HeroRecord, ttl=ttl, prefix="hero")
+    return LRUTTLCache(maxsize=maxsize if backend == "memory" else 0, ttl=ttl)
+
+
+hero_cache = create_hero_cache()
+
+
+# hero.name 的 FTS5 全文索引（外部内容表，靠触发器和 hero 保持同步）
+HERO_FTS_DDL = [
+    "CREATE VIRTUAL TABLE hero_fts USING fts5(name, content='hero', content_rowid='id')",
+    """CREATE TRIGGER hero_fts_insert AFTER INSERT ON hero BEGIN
+        INSERT INTO hero_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER hero_fts_delete AFTER DELETE ON hero BEGIN
+        INSERT INTO hero_fts(hero_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER hero_fts_update AFTER UPDATE OF name ON hero BEGIN
+        INSERT INTO hero_fts(hero_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO hero_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    "INSERT INTO hero_fts(hero_fts) VALUES ('rebuild')",
+]
+fts_enabled = False
+
+
+def create_db_and_tables(bind=None):
+    global fts_enabled
+    bind = engine if bind is None else bind
+    SQLModel.metadata.create_all(bind)
+    with bind.begin() as connection:
+        # 旧库里的 hero 表没有 version / updated_at，补上这两列
+        columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(hero)")}
+        if "version" not in columns:
+            connection.exec_driver_sql("ALTER TABLE hero ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        if "updated_at" not in columns:
+            connection.exec_driver_sql("ALTER TABLE hero ADD COLUMN updated_at DATETIME")
+            connection.execute(update(Hero.__table__).values(updated_at=utcnow()))
+        if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'hero_fts'").first() is None:
+            try:
+                for statement in HERO_FTS_DDL:
+                    connection.exec_driver_sql(statement)
+            except OperationalError:
+                # 编译 SQLite 时没带 FTS5，只是用不了 q 参数
+                return
+    fts_enabled = True
 
 
 def get_session():
@@ -48,18 +251,323 @@ def get_session():
 SessionDep = Annotated[Session, Depends(get_session)]
 
 
+async def get_async_session():
+    async with AsyncSession(async_engine) as session:
+        yield session
+
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+HeroOrderBy = Literal["id", "name", "age"]
+HeroOrder = Literal["asc", "desc"]
+
+
+class HeroFilters:
+    def __init__(
+            self,
+            name: str | None = None,
+            name_prefix: str | None = None,
+            age_min: int | None = None,
+            age_max: int | None = None,
+            q: Annotated[str | None, Query(description="Full-text search over hero names")] = None,
+    ):
+        self.name = name
+        self.name_prefix = name_prefix
+        self.age_min = age_min
+        self.age_max = age_max
+        self.q = q
+
+
+EXPORT_BATCH_SIZE = 1000
+# SQLite 单条语句最多 32766 个参数，按 500 行一批留足余量
+BULK_CHUNK_SIZE = 500
+
+
+def encode_cursor(order_by: HeroOrderBy, order: HeroOrder, hero: Hero) -> str:
+    payload = [order_by, order, getattr(hero, order_by), hero.id]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: HeroOrderBy, order: HeroOrder) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_order_by, cursor_order, value, last_id = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (cursor_order_by, cursor_order) != (order_by, order) or not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Cursor does not match order_by and order")
+    return value, last_id
+
+
+def after_cursor(statement, order_by: HeroOrderBy, order: HeroOrder, cursor: str):
+    """只取游标之后的行：(排序列, id) 组成的行值比较，能直接走 id 主键或 name/age 索引"""
+    value, last_id = decode_cursor(cursor, order_by, order)
+    if order_by == "id":
+        return statement.where(Hero.id > last_id if order == "asc" else Hero.id < last_id)
+    column = getattr(Hero, order_by)
+    # SQLite 里 NULL 比任何值都小：升序时排在最前，降序时排在最后
+    if order == "asc":
+        if value is None:
+            return statement.where((column.is_(None) & (Hero.id > last_id)) | column.is_not(None))
+        return statement.where(tuple_(column, Hero.id) > tuple_(value, last_id))
+    if value is None:
+        return statement.where(column.is_(None) & (Hero.id < last_id))
+    return statement.where((tuple_(column, Hero.id) < tuple_(value, last_id)) | column.is_(None))
+
+
+def prefix_upper_bound(prefix: str) -> str | None:
+    """比所有以 prefix 开头的字符串都大的最小字符串，用来把前缀匹配改写成能走索引的范围查询"""
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def fts_query(q: str) -> str:
+    # 每个词都加引号当普通词处理，用户输入里的 FTS5 语法字符不会导致查询报错
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def filter_heroes(statement, filters: HeroFilters):
+    """
+    Apply the filters as plain comparisons on the indexed columns.
+
+    `name_prefix` becomes `name >= prefix AND name < next_prefix` instead of `LIKE`,
+    because SQLite only uses an index for `LIKE` with a case-insensitive collation.
+    """
+    if filters.name is not None:
+        statement = statement.where(Hero.name == filters.name)
+    if filters.name_prefix:
+        statement = statement.where(Hero.name >= filters.name_prefix)
+        upper = prefix_upper_bound(filters.name_prefix)
+        if upper is not None:
+            statement = statement.where(Hero.name < upper)
+    if filters.age_min is not None:
+        statement = statement.where(Hero.age >= filters.age_min)
+    if filters.age_max is not None:
+        statement = statement.where(Hero.age <= filters.age_max)
+    if filters.q and filters.q.strip():
+        if not fts_enabled:
+            raise HTTPException(status_code=400, detail="Full-text search is not available")
+        matches = text("SELECT rowid FROM hero_fts WHERE hero_fts MATCH :q").bindparams(q=fts_query(filters.q))
+        statement = statement.where(Hero.id.in_(matches))
+    return statement
+
+
+def heroes_page_statement(offset: int, limit: int, cursor: str | None, order_by: HeroOrderBy, order: HeroOrder,
+                          filters: HeroFilters):
+    column = getattr(Hero, order_by)
+    if order == "asc":
+        statement = select(Hero).order_by(column, Hero.id)
+    else:
+        statement = select(Hero).order_by(column.desc(), Hero.id.desc())
+    statement = filter_heroes(statement.limit(limit), filters)
+    if cursor:
+        if offset:
+            raise HTTPException(status_code=400, detail="Use either offset or cursor, not both")
+        return after_cursor(statement, order_by, order, cursor)
+    return statement.offset(offset)
+
+
+def set_next_cursor(response: Response, heroes: list[Hero], limit: int, order_by: HeroOrderBy, order: HeroOrder):
+    if heroes and len(heroes) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(order_by, order, heroes[-1])
+
+
+def hero_etag(hero: Hero | HeroRecord) -> str:
+    # 带上 updated_at：SQLite 会复用删掉的最大 id，只用 id + version 可能和已删除的行撞上
+    stamp = int(hero.updated_at.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+    return f'"{hero.id}-{hero.version}-{stamp:x}"'
+
+
+def heroes_etag(heroes: list[Hero]) -> str:
+    # 列表不给 Last-Modified：删掉一行不会让剩下行的 updated_at 变大
+    return content_etag([hero_etag(hero) for hero in heroes])
+
+
+def check_if_match(if_match: str | None, hero: Hero):
+    if if_match is not None and not etag_matches(if_match, hero_etag(hero), weak=False):
+        raise HTTPException(status_code=412, detail="Hero has been modified")
+
+
+def stale_hero_error(if_match: str | None) -> HTTPException:
+    # 读到提交之间被别的请求改过：UPDATE ... WHERE version = ? 一行都没匹配上
+    if if_match is not None:
+        return HTTPException(status_code=412, detail="Hero has been modified")
+    return HTTPException(status_code=409, detail="Hero was modified by another request")
+
+
+def read_hero_through_cache(hero_id: int, session: Session) -> HeroRecord | None:
+    hero = hero_cache.get(hero_id)
+    if hero is None:
+        # 先占位再读库：读库期间如果有写入失效了这个 key，读到的旧数据就不会写进缓存
+        token = hero_cache.reserve(hero_id)
+        db_hero = session.get(Hero, hero_id)
+        hero = HeroRecord.model_validate(db_hero) if db_hero else None
+        hero_cache.fill(hero_id, hero, token)
+    return hero
+
+
+async def read_hero_through_cache_async(hero_id: int, session: AsyncSession) -> HeroRecord | None:
+    hero = hero_cache.get(hero_id)
+    if hero is None:
+        token = hero_cache.reserve(hero_id)
+        db_hero = await session.get(Hero, hero_id)
+        hero = HeroRecord.model_validate(db_hero) if db_hero else None
+        hero_cache.fill(hero_id, hero, token)
+    return hero
+
+
+def chunked(rows: list, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield start, rows[start:start + size]
+
+
+def write_chunk(session: Session, rows: list[tuple[int, dict]], write, errors: list[HeroBulkError]) -> list:
+    """
+    在 savepoint 里整批写入；整批失败时再逐行重试，把出错的行记到 errors 里，
+    其余行照常写入，整个请求仍然只提交一次
+    """
+    try:
+        with session.begin_nested():
+            return write([row for _, row in rows])
+    except IntegrityError:
+        pass
+    written = []
+    for index, row in rows:
+        try:
+            with session.begin_nested():
+                written += write([row])
+        except IntegrityError as exc:
+            errors.append(HeroBulkError(index=index, id=row.get("id"), detail=str(exc.orig)))
+    return written
+
+
+def insert_heroes(session: Session, rows: list[dict]) -> list[Hero]:
+    # executemany + RETURNING，插入后不用再逐个 refresh
+    statement = insert(Hero).returning(Hero, sort_by_parameter_order=True)
+    return session.scalars(statement, rows).all()
+
+
+def update_heroes(session: Session, rows: list[dict]) -> list[int]:
+    """
+    按要改的列分组，每组一条 Core 的 executemany UPDATE；ORM 的按主键批量 UPDATE 不会递增 version。
+    SQLite 的 executemany 不支持 UPDATE ... RETURNING
+    """
+    table = Hero.__table__
+    statement = update(table).where(table.c.id == bindparam("hero_id")).values(version=table.c.version + 1)
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        changes = {key: value for key, value in row.items() if key != "id"}
+        if changes:
+            groups.setdefault(tuple(sorted(changes)), []).append({"hero_id": row["id"], **changes})
+    for params in groups.values():
+        session.execute(statement, params)
+    return [row["id"] for row in rows]
+
+
+def iter_heroes_ndjson(bind):
+    # yield_per 让驱动按批取行，导出多大的表内存占用都一样
+    with Session(bind) as session:
+        statement = select(Hero.id, Hero.name, Hero.age).order_by(Hero.id)
+        result = session.exec(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            yield "".join(
+                HeroPublic(id=row.id, name=row.name, age=row.age).model_dump_json() + "\n"
+                for row in rows
+            )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
     create_db_and_tables()
     yield
     # shutdown（如果你有需要在关闭时清理资源，可以在这里加）
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
 
+# SQLite 同一时间只有一个写事务，写接口并发再高也只是在锁上排队；超过的直接 503
+hero_write_rate_limit = RateLimiter(Rate.parse(os.getenv("HERO_WRITE_RATE_LIMIT", "60/minute")), prefix="hero-write")
+hero_write_concurrency = ConcurrencyLimiter(
+    limit=int(os.getenv("HERO_WRITE_CONCURRENCY", 4)),
+    max_waiting=int(os.getenv("HERO_WRITE_MAX_WAITING", 16)),
+    wait_timeout=float(os.getenv("HERO_WRITE_WAIT_TIMEOUT", 1.0)),
+)
+hero_write_limits = [Depends(hero_write_rate_limit), Depends(hero_write_concurrency)]
+# 列表页、导出都是大段重复的 JSON，压缩后小很多；流式导出按块压缩
+app.add_middleware(CompressionMiddleware)
+
+
+@app.post("/heroes/bulk", response_model=HeroBulkWriteResult, dependencies=hero_write_limits)
+def create_heroes(heroes: list[HeroCreate], session: SessionDep):
+    created, errors = [], []
+    for start, chunk in chunked(heroes):
+        rows = [(index, hero.model_dump()) for index, hero in enumerate(chunk, start)]
+        created += write_chunk(session, rows, lambda batch: insert_heroes(session, batch), errors)
+    session.commit()
+    return {"heroes": created, "errors": errors}
+
+
+@app.patch("/heroes/bulk", response_model=HeroBulkWriteResult)
+def update_heroes_bulk(heroes: list[HeroBulkUpdate], session: SessionDep):
+    updated_heroes, errors = [], []
+    for start, chunk in chunked(heroes):
+        found = set(session.exec(select(Hero.id).where(Hero.id.in_([hero.id for hero in chunk]))).all())
+        rows = []
+        for index, hero in enumerate(chunk, start):
+            if hero.id not in found:
+                errors.append(HeroBulkError(index=index, id=hero.id, detail="Hero not found"))
+                continue
+            rows.append((index, hero.model_dump(exclude_unset=True)))
+        updated = write_chunk(session, rows, lambda batch: update_heroes(session, batch), errors)
+        if updated:
+            statement = select(Hero).where(Hero.id.in_(updated)).order_by(Hero.id)
+            updated_heroes += session.exec(statement.execution_options(populate_existing=True)).all()
+    session.commit()
+    for hero in updated_heroes:
+        hero_cache.invalidate(hero.id)
+    return {"heroes": updated_heroes, "errors": errors}
+
+
+@app.delete("/heroes/bulk", response_model=HeroBulkDeleteResult)
+def delete_heroes(ids: Annotated[list[int], Body()], session: SessionDep):
+    deleted_ids, errors, seen = [], [], set()
+    for start, chunk in chunked(ids):
+        deleted = set(session.scalars(delete(Hero).where(Hero.id.in_(chunk)).returning(Hero.id)).all())
+        for index, hero_id in enumerate(chunk, start):
+            if hero_id in seen:
+                errors.append(HeroBulkError(index=index, id=hero_id, detail="Duplicate id"))
+            elif hero_id in deleted:
+                deleted_ids.append(hero_id)
+            else:
+                errors.append(HeroBulkError(index=index, id=hero_id, detail="Hero not found"))
+            seen.add(hero_id)
+    session.commit()
+    for hero_id in deleted_ids:
+        hero_cache.invalidate(hero_id)
+    return {"deleted": deleted_ids, "errors": errors}
+
+
+@app.get("/heroes/cache/stats")
+def read_hero_cache_stats():
+    return hero_cache.stats()
+
+
+@app.get("/heroes/export")
+def export_heroes(session: SessionDep):
+    # 依赖里的 session 在开始发送响应前就关闭了，流式导出要用同一个 engine 另开一个
+    return StreamingResponse(iter_heroes_ndjson(session.get_bind()), media_type="application/x-ndjson")
+
+
+sync_router = APIRouter(route_class=PydanticJSONRoute)
+
 
-@app.post("/heroes/", response_model=HeroPublic)
+@sync_router.post("/heroes/", response_model=HeroPublic, dependencies=hero_write_limits)
 def create_hero(hero: HeroCreate, session: SessionDep):
     db_hero = Hero.model_validate(hero)
     session.add(db_hero)
@@ -68,42 +576,166 @@ def create_hero(hero: HeroCreate, session: SessionDep):
     return db_hero
 
 
-@app.get("/heroes/", response_model=list[HeroPublic])
+@sync_router.get("/heroes/", response_model=list[HeroPublic])
 def read_heroes(
         session: SessionDep,
+        request: Request,
+        response: Response,
+        filters: Annotated[HeroFilters, Depends()],
         offset: int = 0,
         limit: Annotated[int, Query(le=100)] = 100,
+        cursor: str | None = None,
+        order_by: HeroOrderBy = "id",
+        order: HeroOrder = "asc",
 ):
-    heroes = session.exec(select(Hero).offset(offset).limit(limit)).all()
+    """
+    Read heroes page by page.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next page;
+    unlike `offset`, a cursor doesn't get slower the deeper you go.
+
+    - **name** / **name_prefix**: exact or prefix match on the name
+    - **age_min** / **age_max**: inclusive age range
+    - **q**: full-text search over names
+
+    Send the `ETag` back in `If-None-Match` to get `304 Not Modified` when the page is unchanged.
+    """
+    heroes = session.exec(heroes_page_statement(offset, limit, cursor, order_by, order, filters)).all()
+    set_next_cursor(response, heroes, limit, order_by, order)
+    etag = heroes_etag(heroes)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
     return heroes
 
 
-@app.get("/heroes/{hero_id}", response_model=HeroPublic)
-def read_hero(hero_id: int, session: SessionDep):
-    hero = session.get(Hero, hero_id)
+@sync_router.get("/heroes/{hero_id}", response_model=HeroPublic)
+def read_hero(hero_id: int, session: SessionDep, request: Request, response: Response):
+    hero = read_hero_through_cache(hero_id, session)
     if not hero:
         raise HTTPException(status_code=404, detail="Hero not found")
+    # 304 直接返回 Response，跳过响应模型的校验和序列化
+    if is_not_modified(request, hero_etag(hero), hero.updated_at):
+        return not_modified(hero_etag(hero), hero.updated_at)
+    set_validators(response, hero_etag(hero), hero.updated_at)
     return hero
 
 
-@app.patch("/heroes/{hero_id}", response_model=HeroPublic)
-def update_hero(hero_id: int, hero: HeroUpdate, session: SessionDep):
+@sync_router.patch("/heroes/{hero_id}", response_model=HeroPublic)
+def update_hero(
+        hero_id: int,
+        hero: HeroUpdate,
+        session: SessionDep,
+        response: Response,
+        if_match: Annotated[str | None, Header()] = None,
+):
     hero_db = session.get(Hero, hero_id)
     if not hero_db:
         raise HTTPException(status_code=404, detail="Hero not found")
+    check_if_match(if_match, hero_db)
     hero_data = hero.model_dump(exclude_unset=True)
     hero_db.sqlmodel_update(hero_data)
     session.add(hero_db)
-    session.commit()
+    try:
+        session.commit()
+    except StaleDataError:
+        raise stale_hero_error(if_match)
+    # 提交之后、返回之前失效，PATCH 一返回就不会再读到旧数据
+    hero_cache.invalidate(hero_id)
     session.refresh(hero_db)
+    set_validators(response, hero_etag(hero_db), hero_db.updated_at)
     return hero_db
 
 
-@app.delete("/heroes/{hero_id}")
+@sync_router.delete("/heroes/{hero_id}")
 def delete_hero(hero_id: int, session: SessionDep):
     hero = session.get(Hero, hero_id)
     if not hero:
         raise HTTPException(status_code=404, detail="Hero not found")
     session.delete(hero)
     session.commit()
+    hero_cache.invalidate(hero_id)
+    return {"ok": True}
+
+
+async_router = APIRouter(route_class=PydanticJSONRoute)
+
+
+@async_router.post("/heroes/", response_model=HeroPublic, dependencies=hero_write_limits)
+async def create_hero_async(hero: HeroCreate, session: AsyncSessionDep):
+    db_hero = Hero.model_validate(hero)
+    session.add(db_hero)
+    await session.commit()
+    await session.refresh(db_hero)
+    return db_hero
+
+
+@async_router.get("/heroes/", response_model=list[HeroPublic], description=inspect.cleandoc(read_heroes.__doc__))
+async def read_heroes_async(
+        session: AsyncSessionDep,
+        request: Request,
+        response: Response,
+        filters: Annotated[HeroFilters, Depends()],
+        offset: int = 0,
+        limit: Annotated[int, Query(le=100)] = 100,
+        cursor: str | None = None,
+        order_by: HeroOrderBy = "id",
+        order: HeroOrder = "asc",
+):
+    heroes = (await session.exec(heroes_page_statement(offset, limit, cursor, order_by, order, filters))).all()
+    set_next_cursor(response, heroes, limit, order_by, order)
+    etag = heroes_etag(heroes)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+    return heroes
+
+
+@async_router.get("/heroes/{hero_id}", response_model=HeroPublic)
+async def read_hero_async(hero_id: int, session: AsyncSessionDep, request: Request, response: Response):
+    hero = await read_hero_through_cache_async(hero_id, session)
+    if not hero:
+        raise HTTPException(status_code=404, detail="Hero not found")
+    if is_not_modified(request, hero_etag(hero), hero.updated_at):
+        return not_modified(hero_etag(hero), hero.updated_at)
+    set_validators(response, hero_etag(hero), hero.updated_at)
+    return hero
+
+
+@async_router.patch("/heroes/{hero_id}", response_model=HeroPublic)
+async def update_hero_async(
+        hero_id: int,
+        hero: HeroUpdate,
+        session: AsyncSessionDep,
+        response: Response,
+        if_match: Annotated[str | None, Header()] = None,
+):
+    hero_db = await session.get(Hero, hero_id)
+    if not hero_db:
+        raise HTTPException(status_code=404, detail="Hero not found")
+    check_if_match(if_match, hero_db)
+    hero_data = hero.model_dump(exclude_unset=True)
+    hero_db.sqlmodel_update(hero_data)
+    session.add(hero_db)
+    try:
+        await session.commit()
+    except StaleDataError:
+        raise stale_hero_error(if_match)
+    hero_cache.invalidate(hero_id)
+    await session.refresh(hero_db)
+    set_validators(response, hero_etag(hero_db), hero_db.updated_at)
+    return hero_db
+
+
+@async_router.delete("/heroes/{hero_id}")
+async def delete_hero_async(hero_id: int, session: AsyncSessionDep):
+    hero = await session.get(Hero, hero_id)
+    if not hero:
+        raise HTTPException(status_code=404, detail="Hero not found")
+    await session.delete(hero)
+    await session.commit()
+    hero_cache.invalidate(hero_id)
     return {"ok": True}
+
+
+app.include_router(async_router if db_mode == "async" else sync_router)
@@ -0,0 +1,212 @@
+"""
+A `StaticFiles` for directories whose contents don't change while the app runs.
+
+The directory is indexed once on the first request: strong content-hash ETags and
+precompressed `.br` / `.gz` siblings are worked out up front, so a hit costs neither a
+`stat` nor a hash. Small files are also kept in memory, within a byte budget.
+"""
+import hashlib
+import os
+import stat
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from mimetypes import guess_type
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# Accept-Encoding 里的编码 -> 预压缩文件的后缀，按优先级排列
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+
+
+@dataclass
+class StaticVariant:
+    path: str
+    stat_result: os.stat_result
+    etag: str
+    encoding: str | None = None
+
+    @property
+    def size(self) -> int:
+        return self.stat_result.st_size
+
+
+@dataclass
+class StaticEntry:
+    media_type: str
+    last_modified: str
+    identity: StaticVariant
+    encoded: dict[str, StaticVariant] = field(default_factory=dict)
+
+
+def file_etag(path: str) -> str:
+    digest = hashlib.sha1(usedforsecurity=False)
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()}"'
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip().removeprefix("q=") if params.strip().startswith("q=") else "1"
+        try:
+            if float(q) > 0:
+                accepted.add(coding.strip().lower())
+        except ValueError:
+            continue
+    return accepted
+
+
+class MemoryFileCache:
+    """LRU of file contents bounded by total bytes rather than by entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = self.hits = self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def get(self, path: str) -> bytes | None:
+        content = self._entries.get(path)
+        if content is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(path)
+        self.hits += 1
+        return content
+
+    def put(self, path: str, content: bytes) -> None:
+        if len(content) > self.max_bytes or path in self._entries:
+            return
+        self._entries[path] = content
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class PathSendResponse(Response):
+    """Hands the file to the server (ASGI `http.response.pathsend`) so it can use sendfile."""
+
+    def __init__(self, path: str, headers: dict[str, str]):
+        self.path = path
+        self.status_code = 200
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": self.path})
+
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(
+            self,
+            *,
+            directory: str | os.PathLike[str],
+            max_age: int = 3600,
+            memory_cache_bytes: int = 32 * 1024 * 1024,
+            memory_cache_file_bytes: int = 256 * 1024,
+            **kwargs,
+    ):
+        super().__init__(directory=directory, **kwargs)
+        self.cache_control = f"public, max-age={max_age}"
+        self.memory_cache = MemoryFileCache(memory_cache_bytes)
+        self.memory_cache_file_bytes = memory_cache_file_bytes
+        self.index: dict[str, StaticEntry] = {}
+
+    async def check_config(self) -> None:
+        await super().check_config()
+        self.index = await anyio.to_thread.run_sync(self.build_index)
+
+    def build_index(self) -> dict[str, StaticEntry]:
+        """Map every regular file under the directory (by its request path) to its precomputed headers."""
+        index = {}
+        if self.directory is None:
+            return index
+        root = os.path.realpath(self.directory)
+        for dirpath, _, filenames in os.walk(root, followlinks=self.follow_symlink):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                stat_result = os.stat(full_path)
+                if not stat.S_ISREG(stat_result.st_mode):
+                    continue
+                entry = StaticEntry(
+                    media_type=guess_type(filename)[0] or "text/plain",
+                    last_modified=formatdate(stat_result.st_mtime, usegmt=True),
+                    identity=StaticVariant(full_path, stat_result, file_etag(full_path)),
+                )
+                for encoding, suffix in PRECOMPRESSED:
+                    sibling = full_path + suffix
+                    try:
+                        sibling_stat = os.stat(sibling)
+                    except FileNotFoundError:
+                        continue
+                    # 比原文件旧的压缩文件可能已经过时，不用
+                    if sibling_stat.st_mtime >= stat_result.st_mtime:
+                        entry.encoded[encoding] = StaticVariant(sibling, sibling_stat, file_etag(sibling), encoding)
+                index[os.path.relpath(full_path, root)] = entry
+        return index
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        entry = self.index.get(path)
+        if entry is None or scope["method"] not in ("GET", "HEAD"):
+            # 索引里没有的路径（目录、html 模式、启动后新增的文件等）按原来的方式处理
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        variant = entry.identity
+        # Range 只对原文件生效，压缩版本的字节偏移对客户端没有意义
+        if entry.encoded and "range" not in request_headers:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            encodings = [encoding for encoding, _ in PRECOMPRESSED if encoding in entry.encoded and encoding in accepted]
+            if encodings:
+                variant = entry.encoded[encodings[0]]
+
+        headers = {
+            "content-type": entry.media_type,
+            "content-length": str(variant.size),
+            "last-modified": entry.last_modified,
+            "etag": variant.etag,
+            "cache-control": self.cache_control,
+            "accept-ranges": "bytes",
+        }
+        if entry.encoded:
+            headers["vary"] = "Accept-Encoding"
+        if variant.encoding:
+            headers["content-encoding"] = variant.encoding
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+
+        if "range" in request_headers:
+            # FileResponse 只 seek 并读取请求的区间，也会处理 If-Range
+            return FileResponse(variant.path, headers=headers, stat_result=variant.stat_result)
+        if variant.size <= self.memory_cache_file_bytes:
+            content = self.memory_cache.get(variant.path)
+            if content is None:
+                content = await anyio.to_thread.run_sync(read_file, variant.path)
+                self.memory_cache.put(variant.path, content)
+            return Response(content if scope["method"] == "GET" else b"", headers=headers)
+        if "http.response.pathsend" in scope.get("extensions", {}) and scope["method"] == "GET":
+            return PathSendResponse(variant.path, headers)
+        return FileResponse(variant.path, headers=headers, stat_result=variant.stat_result)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.index),
+            "memory_cache_bytes": self.memory_cache.size,
+            "memory_cache_hits": self.memory_cache.hits,
+            "memory_cache_misses": self.memory_cache.misses,
+        }
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
@@ -0,0 +1,296 @@
+"""
+Keyed JSON records in named collections, listed a page at a time by creation or update time.
+
+Every record has a key, a JSON value, a set of tags and `created_at` / `updated_at`
+timestamps. `page()` returns records in one of those two orders, optionally only those
+carrying all (or any) of the given tags, together with a cursor: passed back as `after`, it
+continues right after the page's last record.
+
+`MemoryStore` keeps everything in this process, with a `TagIndex` per collection: pages,
+tag filters included, come out of the index without looking at records that don't match.
+
+`SQLiteStore` keeps the same data in a SQLite file, so every worker process on the machine
+sees the same records. It indexes (collection, time, id) on the records and (collection,
+tag, time, id) on a table of their tags, and a cursor is the (time, id) of the last record,
+so the next page starts with an index seek. An `offset` is still stepped over entry by
+entry, and an "any" query walks records in time order checking their tags, so both cost
+more there than in memory.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable, Literal, Protocol
+
+from tag_index import Match, TagIndex
+
+OrderBy = Literal["created_at", "updated_at"]
+ORDERS = ("created_at", "updated_at")
+
+
+@dataclass
+class Record:
+    key: str
+    value: Any
+    tags: frozenset[str]
+    created_at: float
+    updated_at: float
+
+
+@dataclass
+class Page:
+    records: list[Record]
+    # 把它作为 after 传回 page() 就接着这一页往后取；最后一页是 None
+    next_cursor: str | None = None
+
+
+def encode_cursor(order_by: OrderBy, *position) -> str:
+    raw = json.dumps([order_by, *position], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: OrderBy, size: int) -> list:
+    """The position in `cursor`; `ValueError` if it is malformed or was made for another order or store."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(payload, list) or len(payload) != size + 1 or payload[0] != order_by:
+        raise ValueError("Invalid cursor")
+    position = payload[1:]
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in position):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+class Store(Protocol):
+    def get(self, collection: str, key: str) -> Record | None: ...
+
+    def put(self, collection: str, key: str, value: Any, tags: Iterable[str] = ()) -> Record:
+        """Insert or replace `key`; a replaced record keeps its `created_at`."""
+
+    def add(self, collection: str, key: str, value: Any, tags: Iterable[str] = ()) -> bool:
+        """Insert `key` unless it already exists (for seed data); whether it was inserted."""
+
+    def delete(self, collection: str, key: str) -> bool: ...
+
+    def page(self, collection: str, limit: int, offset: int = 0, order_by: OrderBy = "created_at",
+             tags: Iterable[str] = (), match: Match = "all", after: str | None = None) -> Page:
+        """
+        Records with all (or, `match="any"`, any) of `tags`, oldest first by `order_by`, skipping
+        `offset` records after the cursor `after`. `ValueError` for a cursor this store didn't make.
+        """
+
+
+class MemoryStore:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._records: dict[str, dict[str, Record]] = {}
+        self._indexes: dict[str, TagIndex] = {}
+        self._last_time = float("-inf")
+        self._lock = threading.Lock()
+
+    def _collection(self, name: str) -> tuple[dict[str, Record], TagIndex]:
+        records = self._records.get(name)
+        if records is None:
+            records = self._records[name] = {}
+            self._indexes[name] = TagIndex()
+        return records, self._indexes[name]
+
+    def get(self, collection: str, key: str) -> Record | None:
+        with self._lock:
+            return self._collection(collection)[0].get(key)
+
+    def put(self, collection: str, key: str, value: Any, tags: Iterable[str] = ()) -> Record:
+        with self._lock:
+            return self._put(collection, key, value, frozenset(tags))
+
+    def add(self, collection: str, key: str, value: Any, tags: Iterable[str] = ()) -> bool:
+        with self._lock:
+            if key in self._collection(collection)[0]:
+                return False
+            self._put(collection, key, value, frozenset(tags))
+            return True
+
+    def _put(self, collection: str, key: str, value: Any, tags: frozenset[str]) -> Record:
+        records, index = self._collection(collection)
+        # 时间不回退，索引里的创建、更新顺序就是 created_at、updated_at 的顺序
+        now = self._last_time = max(self.clock(), self._last_time)
+        old = records.get(key)
+        record = records[key] = Record(key, value, tags, now if old is None else old.created_at, now)
+        index.put(key, tags)
+        return record
+
+    def delete(self, collection: str, key: str) -> bool:
+        with self._lock:
+            records, index = self._collection(collection)
+            if records.pop(key, None) is None:
+                return False
+            index.remove(key)
+            return True
+
+    def page(self, collection: str, limit: int, offset: int = 0, order_by: OrderBy = "created_at",
+             tags: Iterable[str] = (), match: Match = "all", after: str | None = None) -> Page:
+        # 游标是最后一条在索引里的编号
+        number, = decode_cursor(after, order_by, 1) if after else (-1,)
+        with self._lock:
+            records, index = self._collection(collection)
+            keys = index.query(tags, match, order_by, limit, offset, after=int(number))
+            next_cursor = encode_cursor(order_by, index.position(keys[-1], order_by)) if len(keys) == limit else None
+            return Page([records[key] for key in keys], next_cursor)
+
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS record (
+        id INTEGER PRIMARY KEY,
+        collection TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        tags TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        UNIQUE (collection, key)
+    )""",
+    "CREATE INDEX IF NOT EXISTS record_created_at ON record (collection, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS record_updated_at ON record (collection, updated_at, id)",
+    # 时间冗余存一份，按标签分页时只走这张表的索引
+    """CREATE TABLE IF NOT EXISTS record_tag (
+        record_id INTEGER NOT NULL REFERENCES record (id) ON DELETE CASCADE,
+        tag TEXT NOT NULL,
+        collection TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (record_id, tag)
+    )""",
+    "CREATE INDEX IF NOT EXISTS record_tag_created_at ON record_tag (collection, tag, created_at, record_id)",
+    "CREATE INDEX IF NOT EXISTS record_tag_updated_at ON record_tag (collection, tag, updated_at, record_id)",
+]
+
+
+class SQLiteStore:
+    def __init__(self, path: str, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        with self._connection() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        # 和 JobQueue 一样每个线程一个连接，自动提交；多条语句的写入自己开事务
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _record(row) -> Record:
+        key, value, tags, created_at, updated_at = row
+        return Record(key, json.loads(value), frozenset(json.loads(tags)), created_at, updated_at)
+
+    def get(self, collection: str, key: str) -> Record | None:
+        row = self._connection().execute(
+            "SELECT key, value, tags, created_at, updated_at FROM record WHERE collection = ? AND key = ?",
+            (collection, key),
+        ).fetchone()
+        return None if row is None else self._record(row)
+
+    def put(self, collection: str, key: str, value: Any, tags: Iterable[str] = ()) -> Record:
+        return self._write(collection, key, value, frozenset(tags), replace=True)
+
+    def add(self, collection: str, key: str, value: Any, tags: Iterable[str] = ()) -> bool:
+        return self._write(collection, key, value, frozenset(tags), replace=False) is not None
+
+    def _write(self, collection: str, key: str, value: Any, tags: frozenset[str], replace: bool) -> Record | None:
+        connection = self._connection()
+        now = self.clock()
+        on_conflict = ("UPDATE SET value = excluded.value, tags = excluded.tags, "
+                       "updated_at = max(excluded.updated_at, created_at)") if replace else "NOTHING"
+        # BEGIN IMMEDIATE：记录和它的标签一起写，别的进程看不到写了一半的状态
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                f"""INSERT INTO record (collection, key, value, tags, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (collection, key) DO {on_conflict}
+                    RETURNING id, created_at, updated_at""",
+                (collection, key, json.dumps(value), json.dumps(sorted(tags)), now, now),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            record_id, created_at, updated_at = row
+            connection.execute("DELETE FROM record_tag WHERE record_id = ?", (record_id,))
+            connection.executemany(
+                "INSERT INTO record_tag (record_id, tag, collection, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(record_id, tag, collection, created_at, updated_at) for tag in tags],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return Record(key, value, tags, created_at, updated_at)
+
+    def delete(self, collection: str, key: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM record WHERE collection = ? AND key = ?", (collection, key))
+        return cursor.rowcount == 1
+
+    def page(self, collection: str, limit: int, offset: int = 0, order_by: OrderBy = "created_at",
+             tags: Iterable[str] = (), match: Match = "all", after: str | None = None) -> Page:
+        if order_by not in ORDERS:
+            raise ValueError(f"Can't order by {order_by!r}")
+        if limit <= 0:
+            return Page([])
+        connection = self._connection()
+        tags = sorted(set(tags))
+        # 游标是上一页最后一条的 (时间, id)：行值比较直接在索引上定位，不用一行行数过去
+        position = decode_cursor(after, order_by, 2) if after else ()
+        if not tags:
+            rows = connection.execute(
+                f"""SELECT key, value, tags, created_at, updated_at, id FROM record
+                    WHERE collection = ? {f"AND ({order_by}, id) > (?, ?)" if position else ""}
+                    ORDER BY {order_by}, id LIMIT ? OFFSET ?""",
+                (collection, *position, limit, max(offset, 0)),
+            ).fetchall()
+        elif match == "any" and len(tags) > 1:
+            # 按时间索引走记录，逐条看是否在这些标签的记录里
+            rows = connection.execute(
+                f"""SELECT key, value, tags, created_at, updated_at, id FROM record WHERE collection = ? AND id IN (
+                        SELECT record_id FROM record_tag WHERE collection = ? AND tag IN ({','.join('?' * len(tags))})
+                    ) {f"AND ({order_by}, id) > (?, ?)" if position else ""}
+                    ORDER BY {order_by}, id LIMIT ? OFFSET ?""",
+                (collection, collection, *tags, *position, limit, max(offset, 0)),
+            ).fetchall()
+        else:
+            # 第一个标签走 (collection, tag, 时间, id) 索引，其余标签按主键逐条查
+            others = " ".join(
+                "AND EXISTS (SELECT 1 FROM record_tag o WHERE o.record_id = t.record_id AND o.tag = ?)"
+                for _ in tags[1:]
+            )
+            rows = connection.execute(
+                f"""SELECT r.key, r.value, r.tags, r.created_at, r.updated_at, r.id
+                    FROM record_tag t JOIN record r ON r.id = t.record_id
+                    WHERE t.collection = ? AND t.tag = ? {others}
+                        {f"AND (t.{order_by}, t.record_id) > (?, ?)" if position else ""}
+                    ORDER BY t.{order_by}, t.record_id LIMIT ? OFFSET ?""",
+                (collection, tags[0], *tags[1:], *position, limit, max(offset, 0)),
+            ).fetchall()
+        records = [self._record(row[:5]) for row in rows]
+        if len(rows) < limit:
+            return Page(records)
+        return Page(records, encode_cursor(order_by, getattr(records[-1], order_by), rows[-1][5]))
+
+
+def open_store(path: str | None) -> Store:
+    """A `SQLiteStore` at `path`, shared by every worker, or a `MemoryStore` when `path` is empty."""
+    return SQLiteStore(path) if path else MemoryStore()
+
+
+# 设了 STORE_PATH 时所有 worker 共用这个 SQLite 文件，否则每个进程各自一份内存数据
+default_store = open_store(os.getenv("STORE_PATH"))
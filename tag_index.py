@@ -0,0 +1,221 @@
+"""
+An inverted index from tags to keys that answers "page N of the keys with all / any of these
+tags, in creation or update order" without scanning.
+
+Every key gets a number when it is added, and a second number each time it is added or
+updated; both only ever grow, so numbering order *is* creation order and update order. Each
+tag's posting list is a `Bitmap` of those numbers, one per order, split into 4096-bit blocks
+held as Python ints. AND / OR of posting lists is `&` / `|` block by block, `int.bit_count()`
+skips whole blocks of an offset, and a page is read off the lowest set bits of the first
+blocks that have any. A page can also start right after a given number instead of at an
+offset, which is what the cursor of the next page is.
+"""
+from typing import Iterable, Iterator, Literal
+
+BLOCK_BITS = 4096
+
+Match = Literal["all", "any"]
+
+
+class Bitmap:
+    """A set of non-negative ints, as a dict of block number -> `BLOCK_BITS`-bit int."""
+
+    __slots__ = ("blocks",)
+
+    def __init__(self):
+        self.blocks: dict[int, int] = {}
+
+    def add(self, number: int) -> None:
+        index, bit = divmod(number, BLOCK_BITS)
+        block = self.blocks.get(index)
+        if block is not None:
+            self.blocks[index] = block | (1 << bit)
+            return
+        out_of_order = self.blocks and index < next(reversed(self.blocks))
+        self.blocks[index] = 1 << bit
+        if out_of_order:
+            # 新编号总在最后；只有旧条目加了新标签时会落到前面的块，重新排一下保证按块号迭代
+            self.blocks = dict(sorted(self.blocks.items()))
+
+    def discard(self, number: int) -> None:
+        index, bit = divmod(number, BLOCK_BITS)
+        block = self.blocks.get(index, 0) & ~(1 << bit)
+        if block:
+            self.blocks[index] = block
+        else:
+            self.blocks.pop(index, None)
+
+    def __len__(self) -> int:
+        return sum(block.bit_count() for block in self.blocks.values())
+
+
+def _intersect(bitmaps: list[Bitmap]) -> Iterator[tuple[int, int]]:
+    # 以块最少的那个为准，其余的按块号查
+    driver = min(bitmaps, key=lambda bitmap: len(bitmap.blocks))
+    others = [bitmap.blocks for bitmap in bitmaps if bitmap is not driver]
+    for index, block in driver.blocks.items():
+        for other in others:
+            block &= other.get(index, 0)
+            if not block:
+                break
+        else:
+            yield index, block
+
+
+def _union(bitmaps: list[Bitmap]) -> Iterator[tuple[int, int]]:
+    for index in sorted(set().union(*(bitmap.blocks for bitmap in bitmaps))):
+        block = 0
+        for bitmap in bitmaps:
+            block |= bitmap.blocks.get(index, 0)
+        yield index, block
+
+
+def _after(blocks: Iterable[tuple[int, int]], number: int) -> Iterator[tuple[int, int]]:
+    first, bit = divmod(number + 1, BLOCK_BITS)
+    for index, block in blocks:
+        if index == first:
+            block &= ~((1 << bit) - 1)
+        if index >= first and block:
+            yield index, block
+
+
+def _page(blocks: Iterable[tuple[int, int]], limit: int, offset: int) -> list[int]:
+    numbers = []
+    for index, block in blocks:
+        count = block.bit_count()
+        if offset >= count:
+            offset -= count
+            continue
+        if offset:
+            # 二分找到块内第 offset 个位的位置，把它前面的位去掉
+            low, high = 0, BLOCK_BITS
+            while low < high:
+                middle = (low + high) // 2
+                if (block & ((1 << middle) - 1)).bit_count() < offset:
+                    low = middle + 1
+                else:
+                    high = middle
+            block >>= low
+            base, offset = index * BLOCK_BITS + low, 0
+        else:
+            base = index * BLOCK_BITS
+        while block:
+            lowest = block & -block
+            numbers.append(base + lowest.bit_length() - 1)
+            if len(numbers) == limit:
+                return numbers
+            block ^= lowest
+    return numbers
+
+
+class TagIndex:
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        # 创建序号是连续的，按序号存在列表里比 dict 省内存；删掉的位置留 None
+        self._keys: list[str | None] = []
+        self._update_numbers: list[int] = []
+        self._tags: dict[int, frozenset[str]] = {}
+        # 标签组合远少于条目，相同的组合共用一个 frozenset
+        self._tag_sets: dict[frozenset[str], frozenset[str]] = {}
+        self._ids_by_update: dict[int, int] = {}
+        self._next_update = 0
+        self._everything = {"created_at": Bitmap(), "updated_at": Bitmap()}
+        self._postings: dict[str, dict[str, Bitmap]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    def put(self, key: str, tags: Iterable[str]) -> None:
+        """Add `key`, or move it to the end of the update order and replace its tags."""
+        tags = frozenset(tags)
+        tags = self._tag_sets.setdefault(tags, tags)
+        item_id = self._ids.get(key)
+        if item_id is None:
+            item_id = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._update_numbers.append(-1)
+            old_tags = frozenset()
+            self._everything["created_at"].add(item_id)
+        else:
+            old_tags = self._tags[item_id]
+            old_update = self._update_numbers[item_id]
+            del self._ids_by_update[old_update]
+            for bitmap in self._bitmaps("updated_at", old_tags):
+                bitmap.discard(old_update)
+            for tag in old_tags - tags:
+                self._posting(tag, "created_at").discard(item_id)
+            self._drop_empty(old_tags - tags)
+        update = self._next_update
+        self._next_update += 1
+        self._update_numbers[item_id], self._ids_by_update[update] = update, item_id
+        self._tags[item_id] = tags
+        for tag in tags - old_tags:
+            self._posting(tag, "created_at").add(item_id)
+        for bitmap in self._bitmaps("updated_at", tags):
+            bitmap.add(update)
+
+    def remove(self, key: str) -> bool:
+        item_id = self._ids.pop(key, None)
+        if item_id is None:
+            return False
+        self._keys[item_id] = None
+        tags = self._tags.pop(item_id)
+        update = self._update_numbers[item_id]
+        del self._ids_by_update[update]
+        for bitmap in self._bitmaps("created_at", tags):
+            bitmap.discard(item_id)
+        for bitmap in self._bitmaps("updated_at", tags):
+            bitmap.discard(update)
+        self._drop_empty(tags)
+        return True
+
+    def _posting(self, tag: str, order: str) -> Bitmap:
+        orders = self._postings.get(tag)
+        if orders is None:
+            orders = self._postings[tag] = {"created_at": Bitmap(), "updated_at": Bitmap()}
+        return orders[order]
+
+    def _bitmaps(self, order: str, tags: Iterable[str]) -> list[Bitmap]:
+        return [self._everything[order], *(self._posting(tag, order) for tag in tags)]
+
+    def _drop_empty(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            if not self._postings[tag]["created_at"].blocks:
+                del self._postings[tag]
+
+    def _blocks(self, tags: Iterable[str], match: Match, order_by: str) -> Iterator[tuple[int, int]]:
+        tags = set(tags)
+        if not tags:
+            return iter(self._everything[order_by].blocks.items())
+        bitmaps = [self._postings[tag][order_by] for tag in tags if tag in self._postings]
+        if match == "all":
+            return _intersect(bitmaps) if len(bitmaps) == len(tags) else iter(())
+        return _union(bitmaps) if bitmaps else iter(())
+
+    def position(self, key: str, order_by: str = "created_at") -> int:
+        """The number of `key` in `order_by` order, to pass as `after` for the keys that follow it."""
+        item_id = self._ids[key]
+        return self._update_numbers[item_id] if order_by == "updated_at" else item_id
+
+    def query(self, tags: Iterable[str] = (), match: Match = "all", order_by: str = "created_at",
+              limit: int = 100, offset: int = 0, after: int = -1) -> list[str]:
+        """
+        Keys with all (`match="all"`) or any (`match="any"`) of `tags`, every key when `tags` is
+        empty, oldest first by `order_by` ("created_at" or "updated_at"), skipping `offset`;
+        with `after`, only the keys whose `position` is greater.
+        """
+        if limit <= 0:
+            return []
+        blocks = self._blocks(tags, match, order_by)
+        if after >= 0:
+            blocks = _after(blocks, after)
+        numbers = _page(blocks, limit, max(offset, 0))
+        if order_by == "updated_at":
+            return [self._keys[self._ids_by_update[number]] for number in numbers]
+        return [self._keys[number] for number in numbers]
+
+    def count(self, tags: Iterable[str] = (), match: Match = "all") -> int:
+        return sum(block.bit_count() for _, block in self._blocks(tags, match, "created_at"))
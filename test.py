@@ -1,21 +1,105 @@
+import hashlib
+import hmac
+import os
+import secrets
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
-from fastapi.middleware.cors import CORSMiddleware
 
+import anyio
 import jwt
-from fastapi import Depends, FastAPI, HTTPException, status, Request
+from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
 from pydantic import BaseModel
 
+from cache import LRUTTLCache
+from metrics import default_registry
+from middleware import middleware_stack
+from ratelimit import ConcurrencyLimiter, Rate, RateLimiter
+
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = "e7e08f1e3bf961eead05543e49aa7f929185c280c7b0acc523d9c5991af7ea4d"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+
+class JWTKey:
+    """
+    One signing key, parsed once into the key objects PyJWT would otherwise rebuild on every call.
+
+    RS256 / EdDSA need `pip install "pyjwt[crypto]"`; pass PEM text and the public key is derived
+    from the private one when only the private key is given.
+    """
+
+    def __init__(self, kid: str | None, algorithm: str, signing_key: str | bytes | None,
+                 verifying_key: str | bytes | None = None):
+        try:
+            alg = jwt.get_algorithm_by_name(algorithm)
+        except NotImplementedError:
+            raise RuntimeError(f'JWT algorithm {algorithm} needs the cryptography package: pip install "pyjwt[crypto]"')
+        self.kid = kid
+        self.algorithm = algorithm
+        self.signing_key = alg.prepare_key(signing_key) if signing_key is not None else None
+        if verifying_key is not None:
+            self.verifying_key = alg.prepare_key(verifying_key)
+        elif hasattr(self.signing_key, "public_key"):
+            self.verifying_key = self.signing_key.public_key()
+        else:
+            self.verifying_key = self.signing_key
+
+
+class JWTKeyRing:
+    """
+    Keys by `kid`. New tokens are signed with the current key; older keys keep verifying
+    the tokens they signed until they are removed, which is how a key is rotated out.
+    """
+
+    def __init__(self):
+        self.keys: dict[str | None, JWTKey] = {}
+        self.current: JWTKey | None = None
+
+    def add(self, key: JWTKey, current: bool = False) -> None:
+        self.keys[key.kid] = key
+        if current or self.current is None:
+            self.current = key
+
+    def remove(self, kid: str | None) -> None:
+        if self.current is not None and self.current.kid == kid:
+            raise ValueError("Can't remove the current signing key")
+        self.keys.pop(kid, None)
+
+    def encode(self, payload: dict) -> str:
+        headers = {"kid": self.current.kid} if self.current.kid is not None else None
+        return jwt.encode(payload, self.current.signing_key, algorithm=self.current.algorithm, headers=headers)
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.keys.get(kid)
+        if key is None or key.verifying_key is None:
+            raise InvalidTokenError(f"Unknown key id {kid!r}")
+        # 每个 kid 只认它自己的算法，防止用公钥冒充 HMAC 密钥之类的算法混淆
+        return jwt.decode(token, key.verifying_key, algorithms=[key.algorithm])
+
+
+# 不带 kid 的令牌（包括之前签发的）用 SECRET_KEY 验证
+jwt_keys = JWTKeyRing()
+jwt_keys.add(JWTKey(None, ALGORITHM, SECRET_KEY))
+if os.getenv("JWT_PRIVATE_KEY_FILE"):
+    with open(os.environ["JWT_PRIVATE_KEY_FILE"]) as key_file:
+        jwt_keys.add(
+            JWTKey(os.getenv("JWT_KID", "1"), os.getenv("JWT_ALGORITHM", "RS256"), key_file.read()),
+            current=True,
+        )
+
+# 令牌 -> 已校验的用户，条目最多活到令牌的 exp
+token_cache = LRUTTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_MAXSIZE", 10_000)),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", 60)),
+)
+
 fake_users_db = {
     "johndoe": {
         "username": "johndoe",
@@ -26,8 +110,6 @@ fake_users_db = {
     }
 }
 
-app = FastAPI()
-
 origins = [
     "http://localhost.tiangolo.com",
     "https://localhost.tiangolo.com",
@@ -35,22 +117,9 @@ origins = [
     "http://localhost:8080",
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.perf_counter()
-    response = await call_next(request)
-    process_time = time.perf_counter() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+# 中间件都是纯 ASGI 的，按从外到内的顺序：CORS、指标、X-Process-Time、压缩
+app = FastAPI(middleware=middleware_stack(origins, metrics_registry=default_registry))
+app.add_route("/metrics", default_registry.endpoint, include_in_schema=False)
 
 
 class Token(BaseModel):
@@ -80,7 +149,29 @@ class UserInDB(User):
     hashed_password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 改了 cost 之后，旧 cost 的哈希会被 needs_update 标出来，登录成功时顺便重新哈希
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt 一次要几百毫秒，放到线程里跑；最多同时跑这么多个，其余的登录排队，不会占满整个线程池
+password_hash_limiter = anyio.CapacityLimiter(int(os.getenv("PASSWORD_HASH_CONCURRENCY", 2)))
+
+# 最近验证成功的 (用户名, 哈希, 密码)，key 是用进程内随机密钥算的 HMAC，内存里不留明文密码
+verified_passwords = LRUTTLCache(
+    maxsize=int(os.getenv("PASSWORD_CACHE_MAXSIZE", 1024)),
+    ttl=float(os.getenv("PASSWORD_CACHE_TTL", 300)),
+)
+_verified_passwords_key = secrets.token_bytes(32)
+
+# 登录按来源 IP 和用户名分别限速：单个 IP 猜很多账号、很多 IP 猜同一个账号都挡得住
+login_rate_limit = RateLimiter(Rate.parse(os.getenv("LOGIN_RATE_LIMIT", "20/minute")), prefix="login-ip")
+login_user_rate_limit = RateLimiter(Rate.parse(os.getenv("LOGIN_USER_RATE_LIMIT", "10/minute")), prefix="login-user")
+# 排队等 bcrypt 的登录也有上限，超过的直接 503，不让等待时间无限变长
+login_concurrency = ConcurrencyLimiter(
+    limit=int(os.getenv("LOGIN_CONCURRENCY", 8)),
+    max_waiting=int(os.getenv("LOGIN_MAX_WAITING", 32)),
+    wait_timeout=float(os.getenv("LOGIN_WAIT_TIMEOUT", 2.0)),
+)
 
 
 def verify_password(plain_password, hashed_password):
@@ -91,18 +182,48 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def run_password_hashing(func, *args):
+    # bcrypt 计算时会释放 GIL，线程里跑不会卡住事件循环
+    return await anyio.to_thread.run_sync(func, *args, limiter=password_hash_limiter)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await run_password_hashing(pwd_context.hash, password)
+
+
+async def verify_and_update_password(username: str, plain_password: str, hashed_password: str):
+    """
+    Verify in the worker pool, skipping bcrypt for a password that verified recently.
+
+    Returns `(verified, new_hash)`; `new_hash` is set when the stored hash was made
+    with a different cost than `BCRYPT_ROUNDS`.
+    """
+    message = "\0".join([username, hashed_password, plain_password]).encode()
+    key = hmac.new(_verified_passwords_key, message, hashlib.sha256).digest()
+    if verified_passwords.get(key):
+        return True, None
+    token = verified_passwords.reserve(key)
+    verified, new_hash = await run_password_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+    # 只缓存成功的结果，重新哈希之后 key 里的哈希变了，旧条目自然用不上
+    verified_passwords.fill(key, True if verified and new_hash is None else None, token)
+    return verified, new_hash
+
+
 def get_user(db, username: str):
     if username in db:
         user_dict = db[username]
         return UserInDB(**user_dict)
 
 
-def authenticate_user(fake_db, username: str, password: str):
+async def authenticate_user(fake_db, username: str, password: str):
     user = get_user(fake_db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await verify_and_update_password(username, password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash is not None:
+        fake_db[username]["hashed_password"] = user.hashed_password = new_hash
     return user
 
 
@@ -113,7 +234,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_keys.encode(to_encode)
     return encoded_jwt
 
 
@@ -125,20 +246,29 @@ def fake_decode_token(token):
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    user = token_cache.get(token)
+    if user is not None:
+        return user
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt_keys.decode(token)
         username = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
+    cache_token = token_cache.reserve(token)
     user = get_user(fake_users_db, username=token_data.username)
+    if user is not None:
+        # 缓存里放不带密码哈希的 User
+        user = User.model_validate(user.model_dump(exclude={"hashed_password"}))
+    ttl = payload["exp"] - time.time() if "exp" in payload else None
+    token_cache.fill(token, user, cache_token, ttl=ttl)
     if user is None:
         raise credentials_exception
     return user
@@ -152,11 +282,12 @@ async def get_current_active_user(
     return current_user
 
 
-@app.post("/token")
+@app.post("/token", dependencies=[Depends(login_rate_limit), Depends(login_concurrency)])
 async def login_for_access_token(
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+    login_user_rate_limit.check(form_data.username)
+    user = await authenticate_user(fake_users_db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
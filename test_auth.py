@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+
+import ratelimit
+import test as auth
+from test import JWTKey, app, create_access_token, fake_users_db, jwt_keys, token_cache, verified_passwords
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def restore_users():
+    hashed_password = fake_users_db["johndoe"]["hashed_password"]
+    verified_passwords.clear()
+    token_cache.clear()
+    ratelimit.default_store.clear()
+    yield
+    fake_users_db["johndoe"]["hashed_password"] = hashed_password
+
+
+def read_me(token: str):
+    return client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+
+
+def login(password: str = "secret"):
+    return client.post("/token", data={"username": "johndoe", "password": password})
+
+
+def test_login_caches_successful_verification(monkeypatch):
+    assert login().status_code == 200
+    assert login("wrong").status_code == 401
+
+    def fail(*args):
+        raise AssertionError("bcrypt should not run for a cached password")
+
+    monkeypatch.setattr(auth.pwd_context, "verify_and_update", fail)
+    token = login().json()["access_token"]
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {token}"}).json()["username"] == "johndoe"
+
+
+def test_login_rehashes_when_cost_changes(monkeypatch):
+    monkeypatch.setattr(auth, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4))
+
+    assert login().status_code == 200
+    assert fake_users_db["johndoe"]["hashed_password"].startswith("$2b$04$")
+    assert login().status_code == 200
+
+
+def test_cached_token_expires_with_exp(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(token_cache, "clock", lambda: now[0])
+    token = create_access_token({"sub": "johndoe"}, expires_delta=timedelta(seconds=5))
+
+    def misses_after(seconds: float) -> int:
+        now[0] = seconds
+        before = token_cache.stats()["misses"]
+        assert read_me(token).status_code == 200
+        return token_cache.stats()["misses"] - before
+
+    assert misses_after(0) == 1
+    assert misses_after(3) == 0
+    # 缓存默认活 60 秒，但这个令牌 5 秒后就过期了
+    assert misses_after(6) == 1
+
+
+def test_rotate_to_asymmetric_key():
+    serialization = pytest.importorskip("cryptography.hazmat.primitives.serialization")
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    pem = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    old_token = create_access_token({"sub": "johndoe"})
+    previous = jwt_keys.current
+    jwt_keys.add(JWTKey("ed-1", "EdDSA", pem), current=True)
+    try:
+        new_token = create_access_token({"sub": "johndoe"})
+        assert auth.jwt.get_unverified_header(new_token)["kid"] == "ed-1"
+        assert read_me(new_token).status_code == 200
+        assert read_me(old_token).status_code == 200
+    finally:
+        jwt_keys.add(previous, current=True)
+        jwt_keys.remove("ed-1")
+    token_cache.clear()
+    assert read_me(new_token).status_code == 401
@@ -0,0 +1,49 @@
+from cache import InMemoryKeyValueStore, LRUTTLCache, SharedCache, SQLiteKeyValueStore
+from sql import HeroPublic
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def load(cache, key, value):
+    token = cache.reserve(key)
+    cache.fill(key, value, token)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUTTLCache(maxsize=2)
+    load(cache, 1, "a")
+    load(cache, 2, "b")
+    cache.get(1)
+    load(cache, 3, "c")
+
+    assert cache.get(2) is None
+    assert (cache.get(1), cache.get(3)) == ("a", "c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUTTLCache(ttl=10, clock=clock)
+    load(cache, 1, "a")
+
+    clock.now = 11
+    assert cache.get(1) is None
+
+
+def test_fill_after_invalidate_is_dropped(tmp_path):
+    shared_stores = (InMemoryKeyValueStore(), SQLiteKeyValueStore(str(tmp_path / "cache.db")))
+    for cache in (LRUTTLCache(), *(SharedCache(store, HeroPublic) for store in shared_stores)):
+        # 读者先占位并读到旧数据，写者提交后失效，读者这时才回填
+        token = cache.reserve(1)
+        cache.invalidate(1)
+        cache.fill(1, HeroPublic(id=1, name="old"), token)
+
+        assert cache.get(1) is None
+        load(cache, 1, HeroPublic(id=1, name="new"))
+        assert cache.get(1).name == "new"
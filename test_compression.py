@@ -0,0 +1,113 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, negotiate
+
+PAYLOAD = [{"id": i, "name": f"hero-{i}", "secret_name": "Dive Wilson", "age": None} for i in range(200)]
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+
+@app.get("/big")
+def big():
+    return JSONResponse(PAYLOAD, headers={"ETag": '"abc"'})
+
+
+@app.get("/small")
+def small():
+    return {"ok": True}
+
+
+@app.get("/png")
+def png():
+    return Response(b"\x89PNG" + b"\0" * 5000, media_type="image/png")
+
+
+@app.get("/stream")
+def stream():
+    def lines():
+        for hero in PAYLOAD:
+            yield json.dumps(hero) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+client = TestClient(app)
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate, br", ["zstd", "br", "gzip"]) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate("gzip;q=0", ["gzip"]) is None
+    assert negotiate("*", ["br", "gzip"]) == "br"
+    assert negotiate("*;q=0, gzip", ["br", "gzip"]) == "gzip"
+    assert negotiate("", ["gzip"]) is None
+
+
+def test_large_json_is_gzipped():
+    with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-length"] == str(len(raw))
+    # 压缩后字节变了，强 ETag 降成弱 ETag
+    assert response.headers["etag"] == 'W/"abc"'
+    assert json.loads(gzip.decompress(raw)) == PAYLOAD
+    assert len(raw) * 5 < len(json.dumps(PAYLOAD))
+
+
+def test_passthrough():
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"abc"'
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"ok": True}
+
+    response = client.get("/png", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert len(response.content) == 5004
+
+
+def test_streaming_chunks_decompress_as_they_arrive():
+    # TestClient 会把分块合并，这里直接调 ASGI 应用，看每一条 http.response.body
+    messages = []
+
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # StreamingResponse 一直在等断开连接，响应发完它就会被取消
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/stream", "raw_path": b"/stream", "root_path": "",
+        "query_string": b"", "headers": [(b"accept-encoding", b"gzip")], "http_version": "1.1", "scheme": "http",
+        "server": ("testserver", 80), "client": ("testclient", 50000),
+    }
+    asyncio.run(app(scope, receive, send))
+
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    bodies = [message["body"] for message in messages[1:]]
+    # 每一块都 flush 过，单独解压就能得到这一块对应的完整一行
+    for hero, body in zip(PAYLOAD, bodies):
+        assert decompressor.decompress(body) == (json.dumps(hero) + "\n").encode()
+    assert messages[-1]["more_body"] is False
+    decompressor.decompress(bodies[-1])
+    assert decompressor.eof
@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, TypeAdapter
+
+import main
+from ingest import BodySizeLimitMiddleware, ingest_ndjson
+
+
+class Point(BaseModel):
+    x: int
+
+
+point_adapter = TypeAdapter(Point)
+
+
+def make_app(process, batch_size: int = 2) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, limits={"/points": 100})
+
+    @app.post("/points")
+    async def create_points(points: list[Point]):
+        return len(points)
+
+    @app.post("/points/ndjson")
+    async def ingest_points(request: Request):
+        return await ingest_ndjson(request, point_adapter, process, batch_size=batch_size)
+
+    return app
+
+
+def test_body_size_limit():
+    client = TestClient(make_app(None))
+    points = [{"x": i} for i in range(5)]
+    assert client.post("/points", json=points).json() == 5
+
+    response = client.post("/points", json=points * 10)
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+
+    # 没有 Content-Length 的分块请求体，读到超限就停
+    chunks = (b"[" + b'{"x": 1},' * 10 for _ in range(3))
+    response = client.post("/points", content=chunks, headers={"content-type": "application/json"})
+    assert response.status_code == 413
+
+    # 其他路径不限
+    assert client.post("/points/ndjson", content=b"x" * 200).status_code == 415
+
+
+def test_list_length_limit():
+    client = TestClient(main.app)
+    images = [{"url": "https://example.com/a.png", "name": "a"}] * (main.MAX_LIST_ITEMS + 1)
+    response = client.post("/images/multiple/", json=images)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "too_long"
+
+
+def test_ndjson_batches_and_errors():
+    batches = []
+
+    async def process(points):
+        batches.append([point.x for point in points])
+
+    client = TestClient(make_app(process))
+    body = b'{"x": 1}\n{"x": 2}\n\n{"x": "a"}\n{"x": 3}\n{"x": 4}\n{"x": 5}'
+    response = client.post("/points/ndjson", content=body, headers={"content-type": "application/x-ndjson"})
+
+    assert batches == [[1, 2], [3], [4, 5]]
+    data = response.json()
+    assert (data["accepted"], data["rejected"], data["batches"]) == (5, 1, 3)
+    assert data["errors"][0]["line"] == 4
+    assert data["errors"][0]["detail"][0]["type"] == "int_parsing"
+
+
+def test_ndjson_reads_on_only_after_batch_is_processed():
+    received = 0
+    processing = asyncio.Event()
+    release = asyncio.Event()
+
+    async def process(points):
+        processing.set()
+        await release.wait()
+
+    chunks = [json.dumps({"x": i}).encode() + b"\n" for i in range(4)]
+
+    async def receive():
+        nonlocal received
+        received += 1
+        return {"type": "http.request", "body": chunks[received - 1], "more_body": received < len(chunks)}
+
+    async def run():
+        scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"content-type", b"application/x-ndjson")]}
+        task = asyncio.create_task(ingest_ndjson(Request(scope, receive), point_adapter, process, batch_size=2))
+        await processing.wait()
+        # 第一批还没处理完，后面的块不会被读
+        assert received == 2
+        release.set()
+        return await task
+
+    assert asyncio.run(run())["accepted"] == 4
+    assert received == 4
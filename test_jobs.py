@@ -0,0 +1,126 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import background
+from jobs import JobQueue, run_worker
+from log_writer import BufferedLogWriter
+
+DOOMED_WORKER = """
+import sys, time
+from jobs import JobQueue, run_worker
+
+def record(n):
+    with open(sys.argv[2], "a") as output:
+        output.write(f"{n}\\n")
+    time.sleep(0.05)
+
+run_worker(JobQueue(sys.argv[1], lease_seconds=1), {"record": record}, concurrency=4, poll_interval=0.05,
+           worker="doomed")
+"""
+
+
+def wait_until(condition, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def run_in_thread(queue: JobQueue, handlers: dict, worker: str):
+    stop = threading.Event()
+    thread = threading.Thread(target=run_worker, args=(queue, handlers),
+                              kwargs={"poll_interval": 0.05, "stop": stop, "worker": worker})
+    thread.start()
+    return stop, thread
+
+
+def test_killed_worker_loses_no_jobs(tmp_path):
+    db, output = str(tmp_path / "jobs.db"), tmp_path / "done.txt"
+    queue = JobQueue(db, lease_seconds=1)
+    for n in range(100):
+        queue.enqueue("record", {"n": n})
+
+    doomed = subprocess.Popen([sys.executable, "-c", DOOMED_WORKER, db, str(output)], cwd=os.getcwd())
+    wait_until(lambda: output.exists() and len(output.read_text().splitlines()) >= 10)
+    doomed.send_signal(signal.SIGKILL)
+    doomed.wait()
+    assert queue.metrics()["depth"]["done"] < 100
+
+    def record(n):
+        with open(output, "a") as file:
+            file.write(f"{n}\n")
+
+    stop, thread = run_in_thread(queue, {"record": record}, "survivor")
+    # 被杀掉的 worker 手里的任务要等租约过期才会被重新领取
+    wait_until(lambda: queue.metrics()["depth"]["done"] == 100)
+    stop.set()
+    thread.join()
+
+    # 至少执行一次：被杀时正在执行的任务可能跑了两遍，但一个都不能少
+    assert {int(line) for line in output.read_text().splitlines()} == set(range(100))
+    assert queue.metrics()["depth"] == {"queued": 0, "running": 0, "done": 100, "failed": 0}
+
+
+def test_retries_with_backoff_then_fails(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), backoff_base=0.01)
+    calls = []
+
+    def flaky(n):
+        calls.append(n)
+        if n == 0 or len(calls) < 2:
+            raise RuntimeError("boom")
+
+    queue.enqueue("flaky", {"n": 1})
+    queue.enqueue("flaky", {"n": 0}, max_attempts=3)
+    stop, thread = run_in_thread(queue, {"flaky": flaky}, "worker")
+    wait_until(lambda: queue.metrics()["depth"]["queued"] + queue.metrics()["depth"]["running"] == 0)
+    stop.set()
+    thread.join()
+
+    assert queue.metrics()["depth"] == {"queued": 0, "running": 0, "done": 1, "failed": 1}
+    assert calls.count(0) == 3
+
+
+def test_job_that_keeps_killing_its_worker_fails(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=0.05)
+    queue.enqueue("poison", {}, max_attempts=2)
+
+    # 两次都领走了却没有结果，就像 worker 每次执行都被杀掉
+    for worker in ("first", "second"):
+        assert [job.attempts for job in queue.claim(worker)] == [1 if worker == "first" else 2]
+        time.sleep(0.1)
+
+    assert queue.claim("third") == []
+    assert queue.metrics()["depth"]["failed"] == 1
+
+
+def test_notification_is_in_the_log_before_the_job_is_done(tmp_path, monkeypatch):
+    path = tmp_path / "log.txt"
+    # 不靠定时刷盘：任务完成时这一行必须已经写进文件
+    monkeypatch.setattr(background, "log_writer", BufferedLogWriter(str(path), flush_interval=60))
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("send_notification", {"email": "a@example.com", "message": "message to a@example.com\n"})
+
+    stop, thread = run_in_thread(queue, background.job_handlers, "worker")
+    try:
+        wait_until(lambda: queue.metrics()["depth"]["done"] == 1)
+        assert path.read_text() == "message to a@example.com\n"
+    finally:
+        stop.set()
+        thread.join()
+        background.log_writer.close()
+
+def test_send_notification_enqueues_once_per_email(tmp_path, monkeypatch):
+    monkeypatch.setattr(background, "job_queue", JobQueue(str(tmp_path / "jobs.db")))
+    client = TestClient(background.app)
+
+    for email in ["a@example.com", "a@example.com", "b@example.com"]:
+        assert client.post(f"/send-notification/{email}").status_code == 200
+
+    assert client.get("/jobs/metrics").json()["depth"]["queued"] == 2
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from json_route import PydanticJSONRoute
+
+
+class UserIn(BaseModel):
+    username: str
+    password: str
+    created_at: datetime
+
+
+class UserOut(BaseModel):
+    username: str
+    created_at: datetime
+    full_name: str | None = None
+
+
+router = APIRouter(route_class=PydanticJSONRoute)
+plain_router = APIRouter()
+
+
+@router.get("/fast/user", response_model=UserOut, response_model_exclude_unset=True)
+def read_user():
+    return UserIn(username="john", password="secret", created_at=datetime(2024, 1, 2, 3, 4, 5))
+
+
+@router.post("/fast/created", status_code=201)
+async def create(response: Response) -> dict[str, int]:
+    response.headers["X-Created"] = "1"
+    return {"id": 1}
+
+
+@router.get("/fast/teapot")
+async def teapot(response: Response):
+    response.status_code = 418
+    return {"short": "stout"}
+
+
+@plain_router.get("/plain/user", response_model=UserOut, response_model_exclude_unset=True)
+def read_user_plain():
+    return read_user()
+
+
+app = FastAPI()
+app.include_router(router)
+app.include_router(plain_router)
+client = TestClient(app)
+
+
+def test_same_body_as_default_route():
+    fast = client.get("/fast/user")
+    plain = client.get("/plain/user")
+
+    assert fast.status_code == plain.status_code == 200
+    assert fast.content == plain.content
+    assert fast.json() == {"username": "john", "created_at": "2024-01-02T03:04:05"}
+    # 只有选用了的 router 换了路由类，其他路由不受影响
+    route_classes = {route.path: type(route) for route in app.routes}
+    assert route_classes["/fast/user"] is PydanticJSONRoute
+    assert route_classes["/plain/user"] is not PydanticJSONRoute
+
+
+def test_status_code_and_headers_from_sub_response():
+    response = client.post("/fast/created")
+    assert response.status_code == 201
+    assert response.headers["x-created"] == "1"
+    assert response.json() == {"id": 1}
+
+    response = client.get("/fast/teapot")
+    assert response.status_code == 418
+    assert response.json() == {"short": "stout"}
+
+
+def test_invalid_return_value_is_a_server_error():
+    failing = APIRouter(route_class=PydanticJSONRoute)
+
+    @failing.get("/broken", response_model=UserOut)
+    def broken():
+        return {"username": "john"}
+
+    broken_app = FastAPI()
+    broken_app.include_router(failing)
+    response = TestClient(broken_app, raise_server_exceptions=False).get("/broken")
+    assert response.status_code == 500
@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import background
+from jobs import JobQueue
+from log_writer import BufferedLogWriter, QueueLogHandler
+
+
+def test_batches_by_size_and_drains_on_close(tmp_path):
+    path = tmp_path / "log.txt"
+    writer = BufferedLogWriter(str(path), flush_bytes=100, flush_interval=60)
+    for i in range(50):
+        writer.write(f"message {i:02}\n")
+    writer.close()
+
+    assert path.read_text().splitlines() == [f"message {i:02}" for i in range(50)]
+    # 每批至少 100 字节，50 条 11 字节的消息不会超过 6 次写入
+    assert writer.stats()["flushes"] <= 6
+
+
+def test_flushes_after_interval(tmp_path):
+    path = tmp_path / "log.txt"
+    writer = BufferedLogWriter(str(path), flush_bytes=1 << 20, flush_interval=0.05)
+    writer.write("hello\n")
+    deadline = time.monotonic() + 5
+    while not (path.exists() and path.read_text()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert path.read_text() == "hello\n"
+    writer.close()
+
+
+def test_rotates_by_size(tmp_path):
+    path = tmp_path / "log.txt"
+    writer = BufferedLogWriter(str(path), flush_bytes=1, max_bytes=30, backup_count=2)
+    for i in range(10):
+        writer.write(f"line {i}\n")
+    writer.close()
+
+    files = [path, tmp_path / "log.txt.1", tmp_path / "log.txt.2"]
+    assert all(file.stat().st_size <= 30 for file in files)
+    assert not (tmp_path / "log.txt.3").exists()
+    assert path.read_text().splitlines()[-1] == "line 9"
+
+
+def test_send_notification_logs_through_writer(tmp_path, monkeypatch):
+    path = tmp_path / "log.txt"
+    monkeypatch.setattr(background, "log_writer", BufferedLogWriter(str(path)))
+    monkeypatch.setattr(background, "job_queue", JobQueue(str(tmp_path / "jobs.db")))
+
+    with TestClient(background.app) as client:
+        assert client.post("/send-notification/foo@example.com", params={"q": "bar"}).status_code == 200
+
+    # 通知本身由 worker 发送，请求里只写查询日志
+    assert path.read_text() == "found query: bar\n"
+
+
+def test_queue_log_handler_hands_records_to_a_thread():
+    records = []
+
+    class Collect(logging.Handler):
+        def emit(self, record):
+            records.append((threading.current_thread().name, record.getMessage()))
+
+    handler = QueueLogHandler(Collect())
+    logger = logging.getLogger("test_queue_log_handler")
+    logger.addHandler(handler)
+    logger.propagate = False
+    for i in range(3):
+        logger.warning("message %d", i)
+    logger.removeHandler(handler)
+    handler.close()
+
+    assert [message for _, message in records] == ["message 0", "message 1", "message 2"]
+    assert all(thread != threading.current_thread().name for thread, _ in records)
@@ -0,0 +1,54 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from metrics import MetricsMiddleware, MetricsRegistry
+
+registry = MetricsRegistry(buckets=(0.5, 10.0))
+app = FastAPI()
+app.add_middleware(MetricsMiddleware, registry=registry)
+app.add_route("/metrics", registry.endpoint)
+
+
+@app.get("/users/{user_id}")
+async def read_user(user_id: int):
+    if user_id == 0:
+        raise HTTPException(status_code=404)
+    return {"user_id": user_id}
+
+
+@app.post("/echo")
+async def echo(body: dict):
+    return body
+
+
+client = TestClient(app)
+
+
+def test_labels_use_route_template():
+    for user_id in (1, 2, 3, 0):
+        client.get(f"/users/{user_id}")
+    client.get("/nowhere")
+    client.request("BREW", "/users/1")
+    client.post("/echo", json={"a": "b"})
+
+    stats = registry.routes["GET", "/users/{user_id}"]
+    assert stats.count == 4
+    assert registry.statuses["GET", "/users/{user_id}", 200] == 3
+    assert registry.statuses["GET", "/users/{user_id}", 404] == 1
+    assert registry.statuses["GET", "<unmatched>", 404] == 1
+    assert registry.statuses["OTHER", "/users/{user_id}", 405] == 1
+    assert registry.routes["POST", "/echo"].request_bytes == len(b'{"a":"b"}')
+    assert registry.routes["POST", "/echo"].response_bytes == len(b'{"a":"b"}')
+    assert registry.in_progress["GET"] == 0
+
+
+def test_prometheus_exposition():
+    client.get("/users/7")
+    text = client.get("/metrics").text
+
+    assert 'http_requests_total{method="GET",route="/users/{user_id}",status="200"}' in text
+    count = registry.routes["GET", "/users/{user_id}"].count
+    # 直方图的桶是累计值，最后一个 +Inf 等于总数
+    assert f'http_request_duration_seconds_bucket{{method="GET",route="/users/{{user_id}}",le="+Inf"}} {count}' in text
+    assert f'http_request_duration_seconds_count{{method="GET",route="/users/{{user_id}}"}} {count}' in text
+    assert 'http_requests_in_progress{method="GET"} 1' in text
@@ -0,0 +1,75 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.middleware import Middleware
+
+import test as auth
+from middleware import ProcessTimeMiddleware, middleware_stack
+
+
+class RejectAll:
+    """Stands in for a layer below CORS that answers on its own, like a rate limiter."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/rejected":
+            await PlainTextResponse("slow down", status_code=429)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+app = FastAPI(middleware=[*middleware_stack(["http://localhost"], compression=False), Middleware(RejectAll)])
+
+
+@app.get("/ok")
+def ok():
+    return {"ok": True}
+
+
+def test_process_time_header():
+    client = TestClient(auth.app)
+    response = client.get("/users/me")
+    assert response.status_code == 401
+    assert float(response.headers["x-process-time"]) >= 0
+
+
+def test_cors_headers_on_responses_from_inner_layers():
+    client = TestClient(app)
+    response = client.get("/rejected", headers={"Origin": "http://localhost"})
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] == "http://localhost"
+
+    # 预检请求由最外层的 CORS 直接回答
+    response = client.options("/ok", headers={
+        "Origin": "http://localhost",
+        "Access-Control-Request-Method": "POST",
+    })
+    assert response.status_code == 200
+    assert "x-process-time" not in response.headers
+
+
+def test_process_time_keeps_streaming_chunks():
+    async def body():
+        for index in range(3):
+            yield f"{index}\n"
+
+    async def endpoint(scope, receive, send):
+        await StreamingResponse(body())(scope, receive, send)
+
+    messages = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    asyncio.run(ProcessTimeMiddleware(endpoint)(scope, receive, send))
+
+    assert any(name == b"x-process-time" for name, _ in messages[0]["headers"])
+    assert [message["body"] for message in messages[1:]] == [b"0\n", b"1\n", b"2\n", b""]
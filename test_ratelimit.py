@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import test as auth
+from ratelimit import ConcurrencyLimiter, InMemoryRateLimitStore, Rate, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    store = InMemoryRateLimitStore(clock=clock)
+    rate = Rate(limit=2, period=10, burst=3)
+
+    assert [store.hit("k", rate) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.hit("k", rate) == pytest.approx(5.0)
+    # 另一个 key 有自己的桶
+    assert store.hit("other", rate) == 0.0
+
+    clock.now += 5
+    assert store.hit("k", rate) == 0.0
+    assert store.hit("k", rate) == pytest.approx(5.0)
+
+
+def test_rate_parse():
+    assert Rate.parse("10/minute") == Rate(10, 60)
+    assert Rate.parse("100/30").interval == pytest.approx(0.3)
+
+
+def test_login_is_rate_limited_per_user(monkeypatch):
+    store = InMemoryRateLimitStore()
+    monkeypatch.setattr(auth.login_user_rate_limit, "store", store)
+    monkeypatch.setattr(auth.login_user_rate_limit, "rate", Rate(2, 60))
+    client = TestClient(auth.app)
+
+    def login():
+        return client.post("/token", data={"username": "johndoe", "password": "wrong"})
+
+    assert [login().status_code for _ in range(2)] == [401, 401]
+    response = login()
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) == 30
+
+
+def test_concurrency_limiter_sheds_beyond_the_queue():
+    limiter = ConcurrencyLimiter(limit=2, max_waiting=2, wait_timeout=5)
+    release = asyncio.Event()
+    app = FastAPI()
+
+    @app.get("/slow", dependencies=[Depends(limiter)])
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [asyncio.create_task(client.get("/slow")) for _ in range(6)]
+            while limiter.in_flight + len(limiter._waiters) + limiter.shed < 6:
+                await asyncio.sleep(0.01)
+            assert limiter.stats() == {"in_flight": 2, "waiting": 2, "shed": 2}
+            release.set()
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(run())
+    assert sorted(response.status_code for response in responses) == [200, 200, 200, 200, 503, 503]
+    assert all(response.headers["retry-after"] == "1" for response in responses if response.status_code == 503)
+    assert limiter.in_flight == 0
+
+
+def test_waiting_request_gives_up_after_timeout():
+    limiter = ConcurrencyLimiter(limit=1, max_waiting=1, wait_timeout=0.05)
+
+    async def run():
+        await limiter.acquire()
+        with pytest.raises(Exception) as exc_info:
+            await limiter.acquire()
+        limiter.release()
+        return exc_info.value
+
+    assert asyncio.run(run()).status_code == 503
+    assert limiter.stats() == {"in_flight": 0, "waiting": 0, "shed": 1}
@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+import background
+import serve
+
+
+def test_apps_are_mounted_with_their_lifespans(tmp_path, monkeypatch):
+    monkeypatch.setattr(serve, "STARTUP_LOCK", str(tmp_path / "startup.lock"))
+    with TestClient(serve.create_app()) as client:
+        # background 的 lifespan 启动了写日志的线程
+        assert background.log_writer._thread is not None
+        assert client.get("/").json() == {"message": "Hello World"}
+        assert client.get("/sql/heroes/").status_code == 200
+        assert client.get("/auth/metrics").status_code == 200
+        assert client.get("/background/items/").status_code == 200
+        response = client.get("/bigger/items/plumbus", params={"token": "jessica"},
+                              headers={"X-Token": "fake-super-secret-token"})
+        assert response.json() == {"name": "Plumbus", "item_id": "plumbus"}
+        assert client.get("/sql/openapi.json").json()["servers"] == [{"url": "/sql"}]
+    assert background.log_writer._thread is None
@@ -0,0 +1,312 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import sql
+from cache import SharedCache, SQLiteKeyValueStore
+from sql import (Hero, HeroFilters, HeroRecord, app, async_router, create_async_sqlite_engine, create_db_and_tables,
+                 create_sqlite_engine, get_async_session, get_session, hero_cache, heroes_page_statement)
+
+
+@pytest.fixture(name="session")
+def session_fixture():
+    engine = create_sqlite_engine("sqlite://")
+    create_db_and_tables(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture(name="client")
+def client_fixture(session: Session):
+    app.dependency_overrides[get_session] = lambda: session
+    hero_cache.clear()
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+
+def add_heroes(session: Session, heroes: list[dict]):
+    session.add_all(Hero(secret_name="secret", **hero) for hero in heroes)
+    session.commit()
+
+
+def read_all_pages(client: TestClient, **params):
+    names, cursor = [], None
+    while True:
+        response = client.get("/heroes/", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        names += [hero["name"] for hero in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return names
+
+
+def test_cursor_pagination_by_id(session: Session, client: TestClient):
+    add_heroes(session, [{"name": f"hero-{i:02}"} for i in range(25)])
+
+    assert read_all_pages(client, limit=10) == [f"hero-{i:02}" for i in range(25)]
+
+
+def test_cursor_pagination_by_age_with_nulls(session: Session, client: TestClient):
+    heroes = [{"name": f"hero-{i:02}", "age": None if i % 3 == 0 else i % 4} for i in range(20)]
+    add_heroes(session, heroes)
+
+    expected = [h["name"] for h in sorted(heroes, key=lambda h: (h["age"] is not None, h["age"] or 0))]
+    assert read_all_pages(client, limit=3, order_by="age") == expected
+
+
+def test_cursor_must_match_order_by(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}, {"name": "Rusty-Man"}])
+
+    cursor = client.get("/heroes/", params={"limit": 1}).headers["X-Next-Cursor"]
+
+    assert client.get("/heroes/", params={"cursor": cursor, "order_by": "name"}).status_code == 400
+    assert client.get("/heroes/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_export_heroes_ndjson(session: Session, client: TestClient):
+    add_heroes(session, [{"name": f"hero-{i}", "age": i} for i in range(2500)])
+
+    response = client.get("/heroes/export")
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 2500
+    assert rows[0] == {"name": "hero-0", "age": 0, "id": 1}
+
+
+def test_bulk_create_update_delete(session: Session, client: TestClient):
+    heroes = [{"name": f"hero-{i}", "secret_name": f"secret-{i}", "age": i} for i in range(1200)]
+
+    created = client.post("/heroes/bulk", json=heroes).json()
+    assert created["errors"] == []
+    assert [hero["name"] for hero in created["heroes"]] == [hero["name"] for hero in heroes]
+
+    updated = client.patch("/heroes/bulk", json=[{"id": 1, "age": 99}, {"id": 5000, "age": 1}, {"id": 2}]).json()
+    assert [(hero["id"], hero["age"]) for hero in updated["heroes"]] == [(1, 99), (2, 1)]
+    assert updated["errors"] == [{"index": 1, "id": 5000, "detail": "Hero not found"}]
+
+    deleted = client.request("DELETE", "/heroes/bulk", json=[1, 2, 5000, 1]).json()
+    assert deleted["deleted"] == [1, 2]
+    assert deleted["errors"] == [
+        {"index": 2, "id": 5000, "detail": "Hero not found"},
+        {"index": 3, "id": 1, "detail": "Duplicate id"},
+    ]
+    assert session.get(Hero, 1) is None
+
+
+def test_bulk_update_reports_rows_that_violate_constraints(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}, {"name": "Rusty-Man"}])
+
+    result = client.patch("/heroes/bulk", json=[{"id": 1, "age": 30}, {"id": 2, "name": None}]).json()
+
+    assert [hero["age"] for hero in result["heroes"]] == [30]
+    assert [(error["index"], error["id"]) for error in result["errors"]] == [(1, 2)]
+
+
+def test_file_engine_applies_pragmas(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'heroes.db'}", pool_size=2)
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+    assert engine.pool.size() == 2
+
+
+def test_async_hero_handlers(tmp_path):
+    url = tmp_path / "heroes.db"
+    SQLModel.metadata.create_all(create_sqlite_engine(f"sqlite:///{url}"))
+    engine = create_async_sqlite_engine(f"sqlite+aiosqlite:///{url}")
+
+    async def get_async_session_override():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    async_app = FastAPI()
+    async_app.include_router(async_router)
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+
+    # 用 with 让所有请求跑在同一个事件循环里，aiosqlite 连接不能跨循环复用
+    with TestClient(async_app) as client:
+        hero = client.post("/heroes/", json={"name": "Deadpond", "secret_name": "Dive Wilson"}).json()
+        assert client.patch(f"/heroes/{hero['id']}", json={"age": 30}).json()["age"] == 30
+        assert client.get("/heroes/").json() == [{"name": "Deadpond", "age": 30, "id": hero["id"]}]
+        assert client.delete(f"/heroes/{hero['id']}").json() == {"ok": True}
+        assert client.get(f"/heroes/{hero['id']}").status_code == 404
+        client.portal.call(engine.dispose)
+
+
+def test_read_hero_is_cached_and_invalidated_by_writes(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}])
+    before = client.get("/heroes/cache/stats").json()
+
+    assert client.get("/heroes/1").json()["name"] == "Deadpond"
+    assert client.get("/heroes/1").json()["name"] == "Deadpond"
+    assert client.patch("/heroes/1", json={"name": "Deadpool"}).status_code == 200
+    assert client.get("/heroes/1").json()["name"] == "Deadpool"
+    assert client.delete("/heroes/1").status_code == 200
+    assert client.get("/heroes/1").status_code == 404
+
+    stats = client.get("/heroes/cache/stats").json()
+    assert (stats["hits"] - before["hits"], stats["misses"] - before["misses"]) == (1, 3)
+
+
+def test_shared_hero_cache_is_invalidated_for_every_worker(session: Session, client: TestClient, tmp_path,
+                                                           monkeypatch):
+    # 两个 worker 各有自己的连接，但缓存在同一个文件里
+    workers = [SharedCache(SQLiteKeyValueStore(str(tmp_path / "cache.db")), HeroRecord) for _ in range(2)]
+    add_heroes(session, [{"name": "Deadpond"}])
+    for worker in workers:
+        monkeypatch.setattr(sql, "hero_cache", worker)
+        assert client.get("/heroes/1").json()["name"] == "Deadpond"
+
+    monkeypatch.setattr(sql, "hero_cache", workers[0])
+    assert client.patch("/heroes/1", json={"name": "Deadpool"}).status_code == 200
+    monkeypatch.setattr(sql, "hero_cache", workers[1])
+    assert client.get("/heroes/1").json()["name"] == "Deadpool"
+    assert workers[1].stats()["hits"] == 1
+
+def test_filter_and_sort_heroes(session: Session, client: TestClient):
+    add_heroes(session, [
+        {"name": "Deadpond", "age": 30},
+        {"name": "Dead Pool", "age": 48},
+        {"name": "Rusty-Man", "age": 48},
+        {"name": "Spider-Boy"},
+    ])
+
+    def names(**params):
+        return [hero["name"] for hero in client.get("/heroes/", params=params).json()]
+
+    assert names(name="Rusty-Man") == ["Rusty-Man"]
+    assert names(name_prefix="Dead", order_by="name") == ["Dead Pool", "Deadpond"]
+    assert names(age_min=40, order_by="age", order="desc") == ["Rusty-Man", "Dead Pool"]
+    assert names(age_max=40) == ["Deadpond"]
+    assert names(q="pool") == ["Dead Pool"]
+    assert names(q='"unbalanced') == []
+
+
+def test_descending_cursor_pagination_with_nulls(session: Session, client: TestClient):
+    heroes = [{"name": f"hero-{i:02}", "age": None if i % 3 == 0 else i % 4} for i in range(20)]
+    add_heroes(session, heroes)
+
+    rows = sorted(enumerate(heroes, 1), key=lambda row: (row[1]["age"] is not None, row[1]["age"] or 0, row[0]))
+    expected = [hero["name"] for _, hero in reversed(rows)]
+    assert read_all_pages(client, limit=3, order_by="age", order="desc") == expected
+
+
+def test_full_text_index_follows_updates(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}])
+
+    client.patch("/heroes/1", json={"name": "Captain North"})
+
+    assert [hero["id"] for hero in client.get("/heroes/", params={"q": "north"}).json()] == [1]
+    assert client.get("/heroes/", params={"q": "deadpond"}).json() == []
+
+
+def test_read_hero_answers_conditional_requests(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}])
+
+    response = client.get("/heroes/1")
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+    not_modified = client.get("/heroes/1", headers={"If-None-Match": etag})
+    assert (not_modified.status_code, not_modified.content) == (304, b"")
+    assert not_modified.headers["ETag"] == etag
+    assert client.get("/heroes/1", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    client.patch("/heroes/1", json={"age": 30})
+    response = client.get("/heroes/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_read_heroes_etag_changes_with_the_page(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}, {"name": "Rusty-Man"}])
+
+    etag = client.get("/heroes/").headers["ETag"]
+    assert client.get("/heroes/", headers={"If-None-Match": etag}).status_code == 304
+
+    client.delete("/heroes/2")
+    assert client.get("/heroes/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_patch_with_if_match(session: Session, client: TestClient):
+    add_heroes(session, [{"name": "Deadpond"}, {"name": "Rusty-Man"}])
+    etag = client.get("/heroes/1").headers["ETag"]
+
+    response = client.patch("/heroes/1", json={"age": 30}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert client.patch("/heroes/1", json={"age": 31}, headers={"If-Match": etag}).status_code == 412
+    assert client.patch("/heroes/1", json={"age": 31}, headers={"If-Match": response.headers["ETag"]}).status_code == 200
+
+    # 批量更新也会递增 version，之前拿到的 ETag 随之失效
+    etag = client.get("/heroes/2").headers["ETag"]
+    client.patch("/heroes/bulk", json=[{"id": 2, "age": 48}])
+    assert client.patch("/heroes/2", json={"age": 49}, headers={"If-Match": etag}).status_code == 412
+    assert session.get(Hero, 2).version == 2
+
+
+def test_create_db_and_tables_adds_version_columns(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE hero (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, age INTEGER, secret_name VARCHAR NOT NULL)"
+        )
+        connection.exec_driver_sql("INSERT INTO hero (name, secret_name) VALUES ('Deadpond', 'Dive Wilson')")
+
+    create_db_and_tables(engine)
+
+    with Session(engine) as session:
+        hero = session.get(Hero, 1)
+        assert hero.version == 1 and hero.updated_at is not None
+    engine.dispose()
+
+
+@pytest.mark.parametrize("params", [
+    {"name": "Deadpond"},
+    {"name_prefix": "Dead", "order_by": "name"},
+    {"name_prefix": "Dead", "order_by": "name", "order": "desc"},
+    {"age_min": 18, "age_max": 40},
+    {"age_min": 18, "order_by": "age"},
+    {"age_max": 40, "order_by": "age", "order": "desc"},
+    {"q": "deadpond"},
+])
+def test_filters_use_indexes(session: Session, params: dict):
+    filters = HeroFilters(**{key: value for key, value in params.items() if key not in ("order_by", "order")})
+    statement = heroes_page_statement(0, 100, None, params.get("order_by", "id"), params.get("order", "asc"), filters)
+    sql = str(statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True}))
+
+    plan = [row[3] for row in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+    # 全表扫描在计划里是 "SCAN hero"；走索引是 "SEARCH hero USING ..."
+    assert "SCAN hero" not in plan, plan
+    assert any(step.startswith("SEARCH hero USING") for step in plan), plan
+
+
+DB_MODE_CHECK = """
+from fastapi.testclient import TestClient
+from sql import app, async_engine
+
+endpoints = {route.endpoint.__name__ for route in app.routes if hasattr(route, "endpoint")}
+assert {"read_hero_async", "read_heroes_async", "update_hero_async"} <= endpoints, endpoints
+assert "read_hero" not in endpoints
+assert async_engine is not None
+
+with TestClient(app) as client:
+    hero = client.post("/heroes/", json={"name": "Rusty-Man", "secret_name": "Tommy Sharp"}).json()
+    assert client.get(f"/heroes/{hero['id']}").json()["name"] == "Rusty-Man"
+"""
+
+
+def test_db_mode_async_mounts_async_handlers(tmp_path):
+    # 模型注册在全局 metadata 上，不能在同一个进程里重新导入 sql.py，放到子进程里检查
+    env = {**os.environ, "DB_MODE": "async", "SQLITE_FILE": str(tmp_path / "heroes.db")}
+    result = subprocess.run([sys.executable, "-c", DB_MODE_CHECK], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,72 @@
+import asyncio
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from static_files import CachedStaticFiles
+
+CSS = b"body { color: rebeccapurple; }\n" * 200
+
+
+@pytest.fixture(name="static")
+def static_fixture(tmp_path):
+    (tmp_path / "site.css").write_bytes(CSS)
+    (tmp_path / "site.css.gz").write_bytes(gzip.compress(CSS))
+    (tmp_path / "big.bin").write_bytes(bytes(range(256)) * 64)
+    return CachedStaticFiles(directory=tmp_path, memory_cache_file_bytes=8 * 1024)
+
+
+@pytest.fixture(name="client")
+def client_fixture(static: CachedStaticFiles):
+    app = FastAPI()
+    app.mount("/static", static)
+    return TestClient(app)
+
+
+def test_serves_precompressed_sibling_with_strong_etag(client: TestClient, static: CachedStaticFiles):
+    plain = client.get("/static/site.css", headers={"Accept-Encoding": "identity"})
+    assert plain.content == CSS and "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding" and plain.headers["cache-control"].startswith("public")
+
+    compressed = client.get("/static/site.css", headers={"Accept-Encoding": "br;q=0, gzip"})
+    assert compressed.headers["content-encoding"] == "gzip" and compressed.content == CSS
+    assert compressed.headers["etag"] != plain.headers["etag"]
+    assert not compressed.headers["etag"].startswith("W/")
+
+    not_modified = client.get("/static/site.css", headers={"If-None-Match": compressed.headers["etag"]})
+    assert not_modified.status_code == 304
+
+    assert client.get("/static/site.css", headers={"Accept-Encoding": "gzip"}).content == CSS
+    assert static.stats()["memory_cache_hits"] == 1
+
+
+def test_range_request(client: TestClient):
+    response = client.get("/static/big.bin", headers={"Range": "bytes=256-511"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 256-511/16384"
+    assert response.content == bytes(range(256))
+
+
+def test_large_file_uses_pathsend_when_server_supports_it(static: CachedStaticFiles):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/big.bin", "root_path": "", "headers": [],
+        "query_string": b"", "extensions": {"http.response.pathsend": {}},
+    }
+    asyncio.run(static(scope, receive, send))
+
+    assert messages[0]["status"] == 200
+    assert messages[1] == {"type": "http.response.pathsend", "path": str(static.index["big.bin"].identity.path)}
+
+
+def test_unindexed_paths_fall_back_to_static_files(client: TestClient):
+    assert client.get("/static/missing.css").status_code == 404
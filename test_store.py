@@ -0,0 +1,124 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from store import MemoryStore, SQLiteStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore(clock=FakeClock())
+    return SQLiteStore(str(tmp_path / "store.db"), clock=FakeClock())
+
+
+def keys(page):
+    return [record.key for record in page.records]
+
+
+def test_put_get_add_delete(store):
+    store.put("things", "a", {"name": "A"}, ["red"])
+    assert not store.add("things", "a", {"name": "other"})
+    assert store.add("things", "b", "just a string")
+
+    record = store.get("things", "a")
+    assert (record.value, record.tags) == ({"name": "A"}, frozenset({"red"}))
+    assert store.get("things", "b").value == "just a string"
+    assert store.get("other things", "a") is None
+
+    assert store.delete("things", "a")
+    assert not store.delete("things", "a")
+    assert store.get("things", "a") is None
+    assert keys(store.page("things", 10, tags=["red"])) == []
+
+
+def test_pages_by_order_and_tags(store):
+    for index in range(10):
+        tags = ["even" if index % 2 == 0 else "odd"] + (["three"] if index % 3 == 0 else [])
+        store.put("things", f"k{index}", {"index": index}, tags)
+    # 更新后 updated_at 变了，created_at 和位置不变
+    store.put("things", "k0", {"index": 0, "updated": True}, ["odd"])
+
+    assert keys(store.page("things", 3, offset=2)) == ["k2", "k3", "k4"]
+    assert keys(store.page("things", 3, order_by="updated_at", offset=8)) == ["k9", "k0"]
+    assert keys(store.page("things", 10, tags=["even"])) == ["k2", "k4", "k6", "k8"]
+    assert keys(store.page("things", 2, offset=1, tags=["odd", "three"])) == ["k9"]
+    assert keys(store.page("things", 10, tags=["odd", "three"], order_by="updated_at")) == ["k3", "k9"]
+    assert keys(store.page("things", 3, tags=["even", "three"], match="any")) == ["k2", "k3", "k4"]
+    assert keys(store.page("things", 10, tags=["missing"])) == []
+    assert store.get("things", "k0").created_at < store.get("things", "k1").created_at
+
+
+@pytest.mark.parametrize("query", [
+    {},
+    {"order_by": "updated_at"},
+    {"tags": ["even"]},
+    {"tags": ["odd", "three"], "order_by": "updated_at"},
+    {"tags": ["even", "three"], "match": "any"},
+])
+def test_cursor_pages_match_offset_pages(store, query):
+    for index in range(20):
+        tags = ["even" if index % 2 == 0 else "odd"] + (["three"] if index % 3 == 0 else [])
+        store.put("things", f"k{index}", {"index": index}, tags)
+    for index in range(0, 20, 4):
+        store.put("things", f"k{index}", {"index": index, "updated": True}, ["odd", "three"])
+    expected = keys(store.page("things", 100, **query))
+
+    pages, cursor = [], None
+    while True:
+        page = store.page("things", 3, after=cursor, **query)
+        pages += keys(page)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert pages == expected
+
+    # 游标之后插入的记录出现在后面的页里，前面的不会重复或漏掉
+    first = store.page("things", 2, **query)
+    store.put("things", "new", {}, ["even", "odd", "three"])
+    rest = store.page("things", 100, after=first.next_cursor, **query)
+    assert keys(first) + keys(rest) == keys(store.page("things", 100, **query))
+
+
+def test_invalid_cursors_are_rejected(store, tmp_path):
+    store.put("things", "a", {}, [])
+    cursor = store.page("things", 1).next_cursor
+    other = SQLiteStore(str(tmp_path / "other.db")) if isinstance(store, MemoryStore) else MemoryStore()
+    other.put("things", "a", {}, [])
+    wrong_order = store.page("things", 1, order_by="updated_at").next_cursor
+    for bad in ["garbage", wrong_order, other.page("things", 1).next_cursor]:
+        with pytest.raises(ValueError):
+            store.page("things", 1, after=bad)
+    assert keys(store.page("things", 1, after=cursor)) == []
+
+
+def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "store.db")
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    first.put("things", "a", {"name": "A"}, ["red"])
+    assert second.get("things", "a").value == {"name": "A"}
+    assert keys(second.page("things", 10, tags=["red"])) == ["a"]
+
+
+def test_items_endpoint_filters_by_tags():
+    client = TestClient(main.app)
+    tag = "test-store-tag"
+    ids = [client.post("/items/", json={"name": f"item {index}", "price": 1, "tags": [tag] * (index % 2)}).json()["id"]
+           for index in range(5)]
+
+    response = client.get("/items/", params={"tags": [tag], "limit": 1, "offset": 1})
+    assert [item["id"] for item in response.json()] == [ids[3]]
+    cursor = client.get("/items/", params={"tags": [tag], "limit": 1}).headers["X-Next-Cursor"]
+    response = client.get("/items/", params={"tags": [tag], "limit": 1, "cursor": cursor})
+    assert [item["id"] for item in response.json()] == [ids[3]]
+    assert client.get("/items/", params={"cursor": "garbage"}).status_code == 400
+    assert client.get("/items/", params={"order_by": "name"}).status_code == 422
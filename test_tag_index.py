@@ -0,0 +1,47 @@
+import random
+
+import tag_index
+from tag_index import TagIndex
+
+
+def test_matches_a_scan(monkeypatch):
+    # 块小一些，几百个条目就跨很多块，偏移也会落在块中间
+    monkeypatch.setattr(tag_index, "BLOCK_BITS", 16)
+    rng = random.Random(0)
+    tags = [f"t{index}" for index in range(6)]
+    index = TagIndex()
+    # key -> (标签, 创建序号, 更新序号)
+    model: dict[str, tuple[frozenset, int, int]] = {}
+    step = 0
+    for _ in range(2000):
+        step += 1
+        key = f"k{rng.randrange(400)}"
+        if key in model and rng.random() < 0.2:
+            assert index.remove(key)
+            del model[key]
+            continue
+        item_tags = frozenset(rng.sample(tags, rng.randrange(4)))
+        index.put(key, item_tags)
+        model[key] = (item_tags, model[key][1] if key in model else step, step)
+
+    for _ in range(200):
+        wanted = set(rng.sample(tags, rng.randrange(4)))
+        match = rng.choice(["all", "any"])
+        order_by = rng.choice(["created_at", "updated_at"])
+        limit, offset = rng.randrange(1, 30), rng.randrange(0, 300)
+
+        def matches(item_tags):
+            if not wanted:
+                return True
+            return wanted <= item_tags if match == "all" else bool(wanted & item_tags)
+
+        position = 1 if order_by == "created_at" else 2
+        expected = sorted((entry[position], key) for key, entry in model.items() if matches(entry[0]))
+        assert index.query(wanted, match, order_by, limit, offset) == [key for _, key in expected][offset:offset + limit]
+        assert index.count(wanted, match) == len(expected)
+
+        # 从某个条目之后开始，不管它自己匹不匹配
+        anchor = rng.choice(sorted(model))
+        after = [key for number, key in expected if number > model[anchor][position]]
+        assert index.query(wanted, match, order_by, limit, after=index.position(anchor, order_by)) == after[:limit]
+    assert len(index) == len(model)
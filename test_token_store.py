@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from token_store import TokenHeader, TokenStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def write_tokens(path, data, mtime):
+    path.write_text(json.dumps(data))
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "tokens.json"
+    write_tokens(path, {"X-Token": ["old"]}, 1_000_000_000)
+    clock = FakeClock()
+    store = TokenStore(str(path), check_interval=1.0, clock=clock)
+    assert store.is_valid("x-token", "old")
+
+    write_tokens(path, {"x-token": ["new"]}, 2_000_000_000)
+    # 还没到下一次检查的时间，继续用旧的
+    clock.now = 0.5
+    assert store.is_valid("x-token", "old")
+    clock.now = 1.5
+    assert store.is_valid("x-token", "new")
+    assert not store.is_valid("x-token", "old")
+
+    path.write_text("{broken")
+    os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+    clock.now = 3.0
+    # 文件写坏了保留上一次加载成功的 token
+    assert store.is_valid("x-token", "new")
+    assert store.stats() == {"kinds": {"x-token": 1}, "reloads": 2, "errors": 1}
+
+
+def test_configured_file_replaces_defaults_and_must_load(tmp_path):
+    path = tmp_path / "tokens.json"
+    defaults = {"x-token": ["fake-super-secret-token"]}
+    # 文件不存在或者写坏了不能退回到示例 token
+    with pytest.raises(FileNotFoundError):
+        TokenStore(str(path), defaults=defaults)
+    path.write_text('["not", "a", "mapping"]')
+    with pytest.raises(ValueError):
+        TokenStore(str(path), defaults=defaults)
+
+    write_tokens(path, {"x-token": ["real"]}, 1_000_000_000)
+    store = TokenStore(str(path), defaults=defaults)
+    assert store.is_valid("x-token", "real")
+    assert not store.is_valid("x-token", "fake-super-secret-token")
+
+def test_check_runs_once_per_request():
+    store = TokenStore(defaults={"x-token": ["secret"]})
+    calls = []
+    is_valid = store.is_valid
+    store.is_valid = lambda kind, token: calls.append(token) or is_valid(kind, token)
+
+    app_level = TokenHeader("X-Token", store, detail="X-Token header invalid")
+    # 另一个对象检查同一个 header，也共用这个请求里的结果
+    router_level = TokenHeader("X-Token", store, detail="X-Token header invalid")
+    router = APIRouter(dependencies=[Depends(router_level)])
+
+    @router.get("/items")
+    async def items():
+        return ["plumbus"]
+
+    app = FastAPI(dependencies=[Depends(app_level)])
+    app.include_router(router, dependencies=[Depends(app_level)])
+    client = TestClient(app)
+
+    assert client.get("/items", headers={"X-Token": "secret"}).json() == ["plumbus"]
+    assert calls == ["secret"]
+
+    response = client.get("/items", headers={"X-Token": "wrong"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "X-Token header invalid"}
+    assert client.get("/items").status_code == 400
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+import struct
+import tracemalloc
+import zlib
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from main import app, get_upload_sink_factory
+from uploads import ChunkedUploadStore, NullSink
+
+client = TestClient(app)
+
+
+def test_files_streams_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    content = os.urandom(300_000)
+
+    response = client.post("/files/", files={"file": ("a.bin", content)})
+
+    digest = hashlib.sha256(content).hexdigest()
+    assert response.json() == {"file_size": len(content), "sha256": digest}
+    assert (tmp_path / digest).read_bytes() == content
+    assert [path.name for path in tmp_path.iterdir()] == [digest]
+
+
+def test_files2_reads_files_and_fields(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+
+    response = client.post(
+        "/files2/",
+        files={"file": ("a.txt", b"hello"), "fileb": ("b.png", b"\x89PNG", "image/png")},
+        data={"token": "abc"},
+    )
+    assert response.json() == {"file_size": 5, "token": "abc", "fileb_content_type": "image/png"}
+    assert client.post("/files2/", files={"file": ("a.txt", b"hello")}).status_code == 422
+
+
+def test_oversized_upload_is_rejected_and_cleaned_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "MAX_UPLOAD_SIZE", 1000)
+
+    assert client.post("/files/", files={"file": ("a.bin", b"x" * 1001)}).status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_malformed_or_truncated_body_is_rejected_and_cleaned_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    headers = {"Content-Type": "multipart/form-data; boundary=xyz"}
+    part = b'--xyz\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n' + b"x" * 1000
+
+    # 请求体开头不是声明的边界
+    malformed = client.post("/files/", content=part.replace(b"--xyz", b"--abc"), headers=headers)
+    assert (malformed.status_code, malformed.text) == (400, "Malformed multipart body")
+    # 文件还没传完，也没有结束边界
+    truncated = client.post("/files/", content=part, headers=headers)
+    assert (truncated.status_code, truncated.text) == (400, "Incomplete multipart body")
+    assert list(tmp_path.iterdir()) == []
+
+def test_1gb_upload_memory_stays_flat():
+    size, chunk = 1024 ** 3, b"\0" * (1024 * 1024)
+    boundary = b"memoryprofile"
+    head = (b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="big.bin"\r\n'
+            b"Content-Type: application/octet-stream\r\n\r\n")
+    tail = b"\r\n--" + boundary + b"--\r\n"
+    body = [head, *[chunk] * (size // len(chunk)), tail]
+    messages = []
+
+    async def receive():
+        data = body.pop(0) if body else b""
+        return {"type": "http.request", "body": data, "more_body": bool(body)}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/files/", "raw_path": b"/files/", "root_path": "", "query_string": b"",
+        "server": ("test", 80), "client": ("test", 1234),
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + boundary)],
+    }
+    app.dependency_overrides[get_upload_sink_factory] = lambda: lambda filename, content_type: NullSink()
+    tracemalloc.start()
+    try:
+        asyncio.run(app(scope, receive, send))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        app.dependency_overrides.clear()
+
+    assert messages[0]["status"] == 200
+    assert str(size).encode() in messages[1]["body"]
+    # 整个 1 GB 读进内存的话峰值会超过 1 GB；流式处理只和块大小有关
+    assert peak < 16 * 1024 * 1024, peak
+
+
+def png(width: int, height: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\0" + bytes((x * 7 + y) % 256 for x in range(width * 3)) for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def test_upload_files_returns_per_file_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+
+    with TestClient(app) as client:
+        response = client.post("/uploadfiles/", files=[
+            ("files", ("a.png", png(640, 480), "image/png")),
+            ("files", ("b.png", png(20, 10), "image/png")),
+            ("files", ("notes.txt", b"not an image", "text/plain")),
+        ])
+
+    results = response.json()["files"]
+    assert [result["filename"] for result in results] == ["a.png", "b.png", "notes.txt"]
+    assert results[0]["image"] == {"format": "png", "width": 640, "height": 480}
+    assert results[1]["image"] == {"format": "png", "width": 20, "height": 10}
+    assert results[2]["image"] is None
+    assert results[2]["sha256"] == hashlib.sha256(b"not an image").hexdigest()
+
+
+def test_chunked_upload_can_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "chunked_uploads", ChunkedUploadStore(str(tmp_path / ".partial")))
+    content = png(64, 64)
+    total, half = len(content), len(content) // 2
+
+    with TestClient(app) as client:
+        upload_id = client.post("/uploads/", json={"filename": "c.png", "size": total}).json()["upload_id"]
+        headers = {"Content-Range": f"bytes 0-{half - 1}/{total}"}
+        assert client.put(f"/uploads/{upload_id}", content=content[:half], headers=headers).json()["offset"] == half
+
+        # 重发已经收到的块会被拒绝，并告诉客户端从哪里接着传
+        retry = client.put(f"/uploads/{upload_id}", content=content[:half], headers=headers)
+        assert retry.status_code == 409 and retry.headers["Upload-Offset"] == str(half)
+        assert client.get(f"/uploads/{upload_id}").json()["offset"] == half
+
+        headers = {"Content-Range": f"bytes {half}-{total - 1}/{total}"}
+        result = client.put(f"/uploads/{upload_id}", content=content[half:], headers=headers).json()
+
+    assert result["sha256"] == hashlib.sha256(content).hexdigest()
+    assert result["image"] == {"format": "png", "width": 64, "height": 64}
+    assert (tmp_path / result["sha256"]).read_bytes() == content
+
+
+def test_concurrent_chunks_for_one_upload_are_serialized(tmp_path):
+    store = ChunkedUploadStore(str(tmp_path))
+    upload_id = store.create("a.bin", 10)
+
+    class Body:
+        def __init__(self, gate: asyncio.Event | None = None):
+            self.gate = gate
+
+        async def stream(self):
+            yield b"01234"
+            if self.gate is not None:
+                await self.gate.wait()
+            yield b"56789"
+
+    async def race():
+        gate = asyncio.Event()
+        first = asyncio.create_task(store.append(upload_id, "bytes 0-9/10", Body(gate)))
+        await asyncio.sleep(0.1)
+        # 同一块的重试在第一个请求还没写完时到了
+        with pytest.raises(HTTPException) as busy:
+            await store.append(upload_id, "bytes 0-9/10", Body())
+        gate.set()
+        await first
+        with pytest.raises(HTTPException) as late:
+            await store.append(upload_id, "bytes 0-9/10", Body())
+        return busy.value, late.value
+
+    busy, late = asyncio.run(race())
+    assert busy.status_code == 409 and late.status_code == 409 and late.headers == {"Upload-Offset": "10"}
+    assert (tmp_path / f"{upload_id}.part").read_bytes() == b"0123456789"
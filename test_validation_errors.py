@@ -0,0 +1,60 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from main import app
+from validation_errors import ErrorShapeSampler
+
+client = TestClient(app)
+
+
+def test_small_invalid_body_is_echoed():
+    response = client.post("/items3/", json={"name": "n"})
+
+    assert response.status_code == 422
+    assert response.json() == {
+        "detail": [{"type": "missing", "loc": ["body", "price"], "msg": "Field required", "input": {"name": "n"}}],
+        "body": {"name": "n"},
+    }
+
+
+def test_large_invalid_body_is_cut_down():
+    items = [{"name": f"item-{i}", "price": -1} for i in range(1000)]
+    response = client.post("/offers/", json={"name": "offer", "price": 1, "items": items})
+
+    data = response.json()
+    assert response.status_code == 422
+    assert len(data["detail"]) == 20
+    assert data["error_count"] == 1000
+    assert data["body"] is None
+    assert data["detail"][0]["loc"] == ["body", "items", 0, "price"]
+    assert data["detail"][0]["ctx"] == {"gt": 0.0}
+
+    response = client.post("/offers/", json=[1] * 5000)
+    assert response.json()["detail"][0]["input"] == "<list of 5000 items>"
+
+
+def test_sampler_logs_each_shape_once_per_window(caplog):
+    class Clock:
+        now = 0.0
+
+        def __call__(self):
+            return self.now
+
+    clock = Clock()
+    sampler = ErrorShapeSampler(window=60, clock=clock)
+    errors = [{"type": "greater_than", "loc": ("body", "items", index, "price")} for index in range(3)]
+
+    with caplog.at_level(logging.WARNING, logger="validation"):
+        for _ in range(5):
+            sampler.log("/offers/", errors)
+        clock.now = 61
+        sampler.log("/offers/", errors[:1])
+        sampler.log("/items3/", [{"type": "missing", "loc": ("body", "price")}])
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "validation failed on /offers/: (('greater_than', ('body', 'items', '*', 'price')),)",
+        "validation failed on /offers/ 5 more times since the last report: "
+        "(('greater_than', ('body', 'items', '*', 'price')),)",
+        "validation failed on /items3/: (('missing', ('body', 'price')),)",
+    ]
@@ -0,0 +1,139 @@
+"""
+API token checks backed by a token store that reloads itself when its file changes.
+
+The store file is JSON mapping a token kind (the header or query parameter name, lower
+case) to the accepted tokens, e.g. `{"x-token": ["..."], "token": ["..."]}`. Tokens are kept
+as SHA-256 digests in frozensets, so a check is one hash plus one set lookup, and a reload
+swaps the whole mapping at once.
+
+`TokenHeader` / `TokenQuery` are FastAPI dependencies built on `APIKeyHeader` /
+`APIKeyQuery`: they read the raw header or query string themselves, so FastAPI has no
+parameter to validate for them, and they show up as security schemes in OpenAPI. A token
+that passed once is remembered in the request scope, so the same check declared at app,
+router and `include_router` level costs one lookup per request.
+"""
+import hashlib
+import json
+import os
+import time
+
+from fastapi import HTTPException, Request
+from fastapi.security import APIKeyHeader, APIKeyQuery
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenStore:
+    def __init__(
+            self,
+            path: str | None = None,
+            defaults: dict[str, list[str]] | None = None,
+            check_interval: float = 1.0,
+            clock=time.monotonic,
+    ):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self.reloads = self.errors = 0
+        self._next_check = 0.0
+        if path is None:
+            self._tokens, self._mtime = self._digests(defaults or {}), None
+        else:
+            # 配了文件就只认文件里的 token；启动时读不了直接报错，不能退回到示例 token
+            self._tokens, self._mtime = self._load()
+            self.reloads += 1
+
+    @staticmethod
+    def _digests(data: dict[str, list[str]]) -> dict[str, frozenset[bytes]]:
+        return {kind.lower(): frozenset(map(token_digest, tokens)) for kind, tokens in data.items()}
+
+    def _load(self) -> tuple[dict[str, frozenset[bytes]], int]:
+        with open(self.path, encoding="utf-8") as file:
+            mtime = os.fstat(file.fileno()).st_mtime_ns
+            try:
+                return self._digests(json.load(file)), mtime
+            except (ValueError, TypeError, AttributeError) as exc:
+                raise ValueError(f"{self.path} is not a JSON object of token lists: {exc}") from exc
+
+    def reload(self) -> bool:
+        """Load the file now; a missing or malformed file keeps the tokens loaded before."""
+        try:
+            tokens, mtime = self._load()
+        except (OSError, ValueError):
+            self.errors += 1
+            return False
+        self._tokens, self._mtime = tokens, mtime
+        self.reloads += 1
+        return True
+
+    def _maybe_reload(self) -> None:
+        # 最多每 check_interval 秒 stat 一次文件，修改时间变了才重新加载
+        now = self.clock()
+        if self.path is None or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self.errors += 1
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def is_valid(self, kind: str, token: str | None) -> bool:
+        self._maybe_reload()
+        return token is not None and token_digest(token) in self._tokens.get(kind, ())
+
+    def stats(self) -> dict:
+        return {
+            "kinds": {kind: len(tokens) for kind, tokens in self._tokens.items()},
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+
+def verify(request: Request, store: TokenStore, kind: str, token: str | None, detail: str) -> str:
+    # 同一个请求里校验过的 (kind, token) 记在 scope 里，重复声明的依赖不用再查
+    verified = request.scope.setdefault("verified_tokens", set())
+    if (kind, token) in verified:
+        return token
+    if not store.is_valid(kind, token):
+        raise HTTPException(status_code=400, detail=detail)
+    verified.add((kind, token))
+    return token
+
+
+class TokenHeader(APIKeyHeader):
+    def __init__(self, name: str, store: TokenStore, detail: str, kind: str | None = None):
+        super().__init__(name=name, scheme_name=name, auto_error=False)
+        self.store = store
+        self.detail = detail
+        self.kind = kind or name.lower()
+
+    async def __call__(self, request: Request) -> str:
+        return verify(request, self.store, self.kind, request.headers.get(self.model.name), self.detail)
+
+
+class TokenQuery(APIKeyQuery):
+    def __init__(self, name: str, store: TokenStore, detail: str, kind: str | None = None):
+        super().__init__(name=name, scheme_name=name, auto_error=False)
+        self.store = store
+        self.detail = detail
+        self.kind = kind or name.lower()
+
+    async def __call__(self, request: Request) -> str:
+        return verify(request, self.store, self.kind, request.query_params.get(self.model.name), self.detail)
+
+
+# 没配 API_TOKENS_FILE 时用示例里写死的这几个 token；配了但读不了，导入时就报错
+default_token_store = TokenStore(
+    os.getenv("API_TOKENS_FILE"),
+    defaults={
+        "token": ["jessica"],
+        "x-token": ["fake-super-secret-token"],
+        "x-key": ["fake-super-secret-key"],
+    },
+    check_interval=float(os.getenv("API_TOKENS_CHECK_INTERVAL", 1.0)),
+)
@@ -0,0 +1,442 @@
+"""
+Streaming multipart/form-data uploads.
+
+`stream_upload` feeds the request body to python-multipart's callback parser as it
+arrives. File parts are hashed and handed to a sink chunk by chunk, so memory use stays
+flat however large the upload is, and a part that goes over the size limit is rejected
+with 413 as soon as it does, not after the whole body has been read.
+
+CPU-heavy follow-up work (image metadata, thumbnails, hashing whole files) runs in an
+`AnalysisPool` of worker processes, and `ChunkedUploadStore` keeps resumable uploads.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import struct
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Protocol
+
+import anyio
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadSink(Protocol):
+    """Where the bytes of one uploaded file go."""
+
+    def write(self, data: memoryview) -> None: ...
+
+    def commit(self, sha256: str) -> str | None:
+        """Called once the whole file has arrived; returns where it was stored, if anywhere."""
+
+    def abort(self) -> None: ...
+
+
+SinkFactory = Callable[[str, str | None], UploadSink]
+
+
+class NullSink:
+    """Only size and hash are wanted; the bytes are dropped."""
+
+    def write(self, data: memoryview) -> None:
+        pass
+
+    def commit(self, sha256: str) -> str | None:
+        return None
+
+    def abort(self) -> None:
+        pass
+
+
+class FileSink:
+    """
+    Writes to a temp file in `directory` and renames it to its SHA-256 on commit,
+    so identical uploads are stored once and a half-written file is never visible.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", delete=False)
+
+    def write(self, data: memoryview) -> None:
+        self.file.write(data)
+
+    def commit(self, sha256: str) -> str | None:
+        self.file.close()
+        path = os.path.join(self.directory, sha256)
+        os.replace(self.file.name, path)
+        return path
+
+    def abort(self) -> None:
+        self.file.close()
+        try:
+            os.unlink(self.file.name)
+        except FileNotFoundError:
+            pass
+
+
+@dataclass
+class UploadedFile:
+    field: str
+    filename: str
+    content_type: str | None
+    size: int = 0
+    sha256: str = ""
+    location: str | None = None
+
+
+@dataclass
+class UploadForm:
+    files: dict[str, list[UploadedFile]] = field(default_factory=dict)
+    fields: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _Part:
+    headers: dict[bytes, bytes] = field(default_factory=dict)
+    name: str = ""
+    upload: UploadedFile | None = None
+    sink: UploadSink | None = None
+    digest: "hashlib._Hash | None" = None
+    value: bytearray = field(default_factory=bytearray)
+
+
+def _write_chunk(part: _Part, data: memoryview) -> None:
+    # 哈希和写盘都在线程里做；hashlib 处理大块数据时会释放 GIL
+    part.digest.update(data)
+    part.sink.write(data)
+
+
+async def stream_upload(
+        request: Request,
+        sink_factory: SinkFactory,
+        max_file_size: int,
+        max_body_size: int | None = None,
+        max_field_size: int = 64 * 1024,
+) -> UploadForm:
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+    content_length = request.headers.get("content-length")
+    if max_body_size is not None and content_length and content_length.isdigit() and int(content_length) > max_body_size:
+        # 声明的长度已经超了，不用读请求体
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    form, events, parts = UploadForm(), [], []
+    state = {"part": None, "header_field": bytearray(), "header_value": bytearray(), "complete": False}
+
+    def on_part_begin():
+        state["part"] = _Part()
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["part"].headers[bytes(state["header_field"]).lower()] = bytes(state["header_value"])
+        state["header_field"], state["header_value"] = bytearray(), bytearray()
+
+    def on_headers_finished():
+        events.append(("begin", state["part"], None))
+
+    def on_part_data(data, start, end):
+        # 只记下切片，不复制；这块数据在本轮 parser.write 返回后处理完之前都有效
+        events.append(("data", state["part"], memoryview(data)[start:end]))
+
+    def on_part_end():
+        events.append(("end", state["part"], None))
+
+    def on_end():
+        state["complete"] = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_end": on_end,
+    })
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if max_body_size is not None and received > max_body_size:
+                raise HTTPException(status_code=413, detail="Upload too large")
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status_code=400, detail="Malformed multipart body") from None
+            for kind, part, data in events:
+                if kind == "begin":
+                    await _begin_part(part, sink_factory, parts)
+                elif kind == "data" and part.upload is not None:
+                    part.upload.size += len(data)
+                    if part.upload.size > max_file_size:
+                        raise HTTPException(status_code=413, detail=f"File {part.upload.filename!r} is too large")
+                    await anyio.to_thread.run_sync(_write_chunk, part, data)
+                elif kind == "data":
+                    part.value += data
+                    if len(part.value) > max_field_size:
+                        raise HTTPException(status_code=413, detail=f"Field {part.name!r} is too large")
+                elif part.upload is not None:
+                    part.upload.sha256 = part.digest.hexdigest()
+                    part.upload.location = await anyio.to_thread.run_sync(part.sink.commit, part.upload.sha256)
+                    part.sink = None
+                    form.files.setdefault(part.name, []).append(part.upload)
+                else:
+                    form.fields[part.name] = part.value.decode()
+            events.clear()
+        parser.finalize()
+        if not state["complete"]:
+            # 请求体在结束边界之前断了：最后一个文件不完整，下面的 except 会把它删掉
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+    except BaseException:
+        for part in parts:
+            if part.sink is not None:
+                await anyio.to_thread.run_sync(part.sink.abort)
+        raise
+    return form
+
+
+async def _begin_part(part: _Part, sink_factory: SinkFactory, parts: list[_Part]) -> None:
+    _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+    part.name = options.get(b"name", b"").decode()
+    if b"filename" in options:
+        content_type = part.headers.get(b"content-type")
+        part.upload = UploadedFile(
+            field=part.name,
+            filename=options[b"filename"].decode(),
+            content_type=content_type.decode() if content_type else None,
+        )
+        part.digest = hashlib.sha256()
+        part.sink = await anyio.to_thread.run_sync(sink_factory, part.upload.filename, part.upload.content_type)
+        parts.append(part)
+
+
+# 给 openapi_extra 用：处理函数直接读请求体时，/docs 里仍然显示表单字段
+def multipart_openapi(files: list[str], fields: list[str] = ()) -> dict:
+    properties = {name: {"type": "string", "format": "binary"} for name in files}
+    properties.update({name: {"type": "string"} for name in fields})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"multipart/form-data": {"schema": {
+                "type": "object", "properties": properties, "required": [*files, *fields],
+            }}},
+        }
+    }
+
+
+def image_info(header: bytes) -> dict | None:
+    """Format and size from the first bytes of a PNG, GIF, JPEG or WebP file, without decoding it."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", header[16:24])
+        return {"format": "png", "width": width, "height": height}
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        width, height = struct.unpack("<HH", header[6:10])
+        return {"format": "gif", "width": width, "height": height}
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        chunk = header[12:16]
+        if chunk == b"VP8X":
+            width = int.from_bytes(header[24:27], "little") + 1
+            height = int.from_bytes(header[27:30], "little") + 1
+        elif chunk == b"VP8L":
+            bits = int.from_bytes(header[21:25], "little")
+            width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif chunk == b"VP8 ":
+            width, height = (value & 0x3FFF for value in struct.unpack("<HH", header[26:30]))
+        else:
+            return None
+        return {"format": "webp", "width": width, "height": height}
+    if header.startswith(b"\xff\xd8"):
+        # 跳过各个段，直到 SOFn 段（C4/C8/CC 不是 SOF）
+        offset = 2
+        while offset + 9 < len(header):
+            if header[offset] != 0xFF:
+                return None
+            marker = header[offset + 1]
+            length = struct.unpack(">H", header[offset + 2:offset + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", header[offset + 5:offset + 9])
+                return {"format": "jpeg", "width": width, "height": height}
+            offset += 2 + length
+    return None
+
+
+IMAGE_HEADER_BYTES = 64 * 1024
+THUMBNAIL_SIZE = (256, 256)
+
+
+def analyze_file(path: str, thumbnail_dir: str | None = None, digest: bool = False) -> dict:
+    """
+    The CPU-bound part of handling an upload, run in the process pool: image metadata,
+    a thumbnail when Pillow is installed, and optionally the SHA-256 of the whole file.
+    """
+    result = {}
+    with open(path, "rb") as file:
+        header = file.read(IMAGE_HEADER_BYTES)
+        if digest:
+            sha256 = hashlib.sha256(header)
+            while chunk := file.read(1024 * 1024):
+                sha256.update(chunk)
+            result["sha256"] = sha256.hexdigest()
+    result["image"] = info = image_info(header)
+    if info is not None and thumbnail_dir is not None:
+        result["thumbnail"] = make_thumbnail(path, thumbnail_dir)
+    return result
+
+
+def make_thumbnail(path: str, thumbnail_dir: str) -> str | None:
+    try:
+        from PIL import Image
+    except ImportError:
+        # 缩略图是可选功能：pip install pillow
+        return None
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    target = os.path.join(thumbnail_dir, os.path.basename(path) + ".png")
+    try:
+        with Image.open(path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            image.save(target, "PNG")
+    except OSError:
+        return None
+    return target
+
+
+class AnalysisPool:
+    """
+    A process pool for `analyze_file`, started on first use.
+
+    The pool size bounds how many CPU-heavy analyses run at once; the event loop only
+    awaits the results.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    async def analyze(self, path: str, thumbnail_dir: str | None = None, digest: bool = False) -> dict:
+        if self._executor is None:
+            # spawn 而不是 fork：服务进程里有线程，fork 出来的子进程可能拿着别的线程的锁
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, analyze_file, path, thumbnail_dir, digest
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads kept as `<directory>/<upload_id>.part` plus a small JSON sidecar.
+
+    The offset to resume from is simply the size of the part file, so it survives restarts;
+    a chunk must start exactly there, which also makes a retried chunk harmless to detect.
+    A chunk is written under an exclusive `flock` on the part file, so only one request at
+    a time can append to an upload.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _paths(self, upload_id: str) -> tuple[str, str]:
+        if not UPLOAD_ID.match(upload_id):
+            raise HTTPException(status_code=404, detail="Upload not found")
+        base = os.path.join(self.directory, upload_id)
+        return base + ".part", base + ".json"
+
+    def create(self, filename: str, size: int, content_type: str | None = None) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        data_path, meta_path = self._paths(upload_id)
+        with open(meta_path, "w") as meta:
+            json.dump({"filename": filename, "size": size, "content_type": content_type}, meta)
+        open(data_path, "wb").close()
+        return upload_id
+
+    def status(self, upload_id: str) -> dict:
+        data_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as meta:
+                info = json.load(meta)
+            info["offset"] = os.path.getsize(data_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return {"upload_id": upload_id, **info}
+
+    async def append(self, upload_id: str, content_range: str, request: Request) -> dict:
+        """Append one chunk from `request`'s body; its `Content-Range` must start at the current offset."""
+        info = await anyio.to_thread.run_sync(self.status, upload_id)
+        match = CONTENT_RANGE.match(content_range or "")
+        if match is None:
+            raise HTTPException(status_code=400, detail="Content-Range must look like 'bytes start-end/total'")
+        start, end, total = map(int, match.groups())
+        if total != info["size"] or end < start or end >= total:
+            raise HTTPException(status_code=416, detail="Content-Range does not fit the upload")
+        data_path, _ = self._paths(upload_id)
+        expected, written = end - start + 1, 0
+        try:
+            file = open(data_path, "r+b")
+        except FileNotFoundError:
+            # 上一块刚好把它传完了
+            raise HTTPException(status_code=404, detail="Upload not found")
+        with file:
+            # offset 要拿到文件锁之后再看：两个 Content-Range 相同的请求同时到，否则都会追加一遍。
+            # flock 对别的 worker 进程也有效，文件关闭时释放
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise HTTPException(status_code=409, detail="Another chunk of this upload is being written")
+            offset = os.fstat(file.fileno()).st_size
+            if start != offset:
+                # 客户端按返回的 offset 续传
+                raise HTTPException(status_code=409, detail=f"Upload is at offset {offset}",
+                                    headers={"Upload-Offset": str(offset)})
+            file.seek(start)
+            try:
+                async for chunk in request.stream():
+                    written += len(chunk)
+                    if written > expected:
+                        raise HTTPException(status_code=400, detail="Body is longer than Content-Range")
+                    await anyio.to_thread.run_sync(file.write, chunk)
+            except BaseException:
+                # 只保留完整的块，下次从块的开头重传
+                file.truncate(start)
+                raise
+            if written != expected:
+                file.truncate(start)
+                raise HTTPException(status_code=400, detail="Body is shorter than Content-Range")
+        info["offset"] = start + written
+        return info
+
+    def complete(self, upload_id: str, sha256: str, directory: str) -> str:
+        """Move a finished upload into `directory` under its SHA-256 and forget the upload id."""
+        data_path, meta_path = self._paths(upload_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, sha256)
+        os.replace(data_path, path)
+        os.unlink(meta_path)
+        return path
@@ -0,0 +1,95 @@
+"""
+Cheap 422 responses for request validation errors, and sampled logging of them.
+
+A malformed 1000-item body can produce thousands of errors, each carrying its offending
+input. `render_validation_error` serializes straight to bytes with pydantic-core, returns at
+most `max_errors` errors, shortens large inputs, and only echoes the request body back when
+it is small. `ErrorShapeSampler` logs the first occurrence of each kind of error (route +
+error types and locations, list indices folded) and then a count once per window.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+import pydantic_core
+
+logger = logging.getLogger("validation")
+
+
+def short_input(value: Any, max_items: int, max_chars: int) -> Any:
+    if isinstance(value, (list, tuple, set, dict)) and len(value) > max_items:
+        return f"<{type(value).__name__} of {len(value)} items>"
+    if isinstance(value, (str, bytes)) and len(value) > max_chars:
+        return value[:max_chars] + ("..." if isinstance(value, str) else b"...")
+    return value
+
+
+def render_validation_error(
+        errors: list[dict],
+        body: Any,
+        body_size: int | None,
+        max_errors: int = 20,
+        max_echo_bytes: int = 2048,
+        max_input_items: int = 10,
+        max_input_chars: int = 256,
+) -> bytes:
+    """
+    The `{"detail": [...], "body": ...}` payload FastAPI's handler would send, as JSON bytes.
+
+    `body_size` is the request's Content-Length; the body is echoed only when it is known
+    and at most `max_echo_bytes`, otherwise `body` is null. `error_count` is added when
+    errors were left out.
+    """
+    shown = [
+        {**error, "input": short_input(error["input"], max_input_items, max_input_chars)} if "input" in error else error
+        for error in errors[:max_errors]
+    ]
+    content = {"detail": shown, "body": body if body_size is not None and body_size <= max_echo_bytes else None}
+    if len(errors) > max_errors:
+        content["error_count"] = len(errors)
+    # ctx 里可能有异常对象之类的，pydantic-core 不认识的类型按 str() 输出
+    return pydantic_core.to_json(content, fallback=str)
+
+
+def error_shape(route: str, errors: list[dict]) -> tuple:
+    # 列表下标不算在形状里：第 3 个和第 7 个元素的同一种错误是一回事
+    return route, tuple(sorted({
+        (error["type"], tuple("*" if isinstance(part, int) else part for part in error["loc"])) for error in errors
+    }))
+
+
+class ErrorShapeSampler:
+    def __init__(self, window: float = 60.0, max_shapes: int = 1000, clock=time.monotonic):
+        self.window = window
+        self.max_shapes = max_shapes
+        self.clock = clock
+        # 形状 -> [这个窗口开始的时间, 窗口里出现的次数]
+        self._shapes: OrderedDict[tuple, list] = OrderedDict()
+
+    def record(self, shape: tuple) -> int | None:
+        """
+        0 the first time `shape` is seen, the number of repeats since the last report once
+        per window, otherwise `None` (don't log).
+        """
+        now = self.clock()
+        entry = self._shapes.get(shape)
+        if entry is None:
+            self._shapes[shape] = [now, 0]
+            if len(self._shapes) > self.max_shapes:
+                self._shapes.popitem(last=False)
+            return 0
+        self._shapes.move_to_end(shape)
+        entry[1] += 1
+        if now - entry[0] < self.window:
+            return None
+        repeats, entry[0], entry[1] = entry[1], now, 0
+        return repeats
+
+    def log(self, route: str, errors: list[dict]) -> None:
+        shape = error_shape(route, errors)
+        repeats = self.record(shape)
+        if repeats == 0:
+            logger.warning("validation failed on %s: %s", route, shape[1])
+        elif repeats is not None:
+            logger.warning("validation failed on %s %d more times since the last report: %s", route, repeats, shape[1])
@@ -0,0 +1,33 @@
+"""
+Run the background job workers for background.py.
+
+    python worker.py --concurrency 4
+
+Start as many of these processes as needed; they share the queue in JOBS_DB and stop
+cleanly on SIGTERM / Ctrl-C after finishing the jobs they already claimed.
+"""
+import argparse
+import signal
+import threading
+
+from background import job_handlers, job_queue, log_writer
+from jobs import run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    try:
+        run_worker(job_queue, job_handlers, concurrency=args.concurrency, poll_interval=args.poll_interval, stop=stop)
+    finally:
+        log_writer.close()
+
+
+if __name__ == "__main__":
+    main()